@@ -1,8 +1,75 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
 from django.conf import settings
 from django.utils import timezone
 from rest_framework.authentication import TokenAuthentication
 from rest_framework import exceptions
 
+from . import metrics
+
+
+class _AuthCache:
+    """
+    A small thread-safe LRU of authenticated tokens, each entry holding the
+    user, the profile and the token's computed expiry. Entries live for a
+    short TTL so changes made by other processes are picked up quickly;
+    changes made in this process evict them immediately (see api.signals).
+    A TTL of 0 turns the cache off, as the server profile does: there
+    another worker's logout or newly linked account must count at once.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, 'AUTH_CACHE_TTL_SECONDS', 60)
+
+    def get(self, key):
+        if self._ttl() <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['cached_at'] + self._ttl() < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if self._ttl() <= 0:
+            return
+        entry['cached_at'] = time.monotonic()
+        max_size = getattr(settings, 'AUTH_CACHE_MAX_ENTRIES', 1024)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_token(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry['user'].pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+auth_cache = _AuthCache()
+
 
 class ExpiringTokenAuthentication(TokenAuthentication):
     """
@@ -14,18 +81,46 @@ class ExpiringTokenAuthentication(TokenAuthentication):
     - If `keep_user_logged_in` is False, a short TTL will be applied and the
       token will be treated as expired once older than that TTL.
 
+    Authenticated tokens are kept in an in-process LRU (`auth_cache`) together
+    with the user's profile, so repeated requests skip the token, user and
+    profile queries and `request.user.profile` is already loaded.
+
     Config (in Django settings, optional):
     - TOKEN_EXPIRE_DAYS_NO_KEEP: int (default: 1)
         Number of days before tokens for users who do NOT want to stay logged in expire.
     - TOKEN_EXPIRE_DAYS_KEEP_LOGGED_IN: int or None (default: None)
         If set, tokens for users who WANT to stay logged in will expire after this many days.
         If None, such tokens do not expire here.
+    - AUTH_CACHE_TTL_SECONDS: int (default: 60; 0 disables the cache)
+    - AUTH_CACHE_MAX_ENTRIES: int (default: 1024)
     """
 
     def authenticate_credentials(self, key):
+        entry = auth_cache.get(key)
+        metrics.record_cache('auth', hits=entry is not None, misses=entry is None)
+        if entry is None:
+            entry = self._load(key)
+            auth_cache.set(key, entry)
+
+        if entry['expires_at'] is not None and timezone.now() >= entry['expires_at']:
+            # Token expired: delete and fail authentication
+            auth_cache.invalidate_token(key)
+            try:
+                self.get_model().objects.filter(key=key).delete()
+            except Exception:
+                pass
+            raise exceptions.AuthenticationFailed('Token has expired.')
+
+        # Hand out copies so requests never share (and mutate) the cached instances
+        user = copy.copy(entry['user'])
+        if entry['profile'] is not None:
+            user.profile = copy.copy(entry['profile'])
+        return (user, entry['token'])
+
+    def _load(self, key):
         model = self.get_model()
         try:
-            token = model.objects.select_related('user').get(key=key)
+            token = model.objects.select_related('user', 'user__profile').get(key=key)
         except model.DoesNotExist:
             raise exceptions.AuthenticationFailed('Invalid token.')
 
@@ -34,6 +129,7 @@ class ExpiringTokenAuthentication(TokenAuthentication):
 
         # Determine TTL depending on the user's profile preference
         ttl_days = None
+        profile = None
         try:
             profile = token.user.profile
             keep = getattr(profile, 'keep_user_logged_in', True)
@@ -45,16 +141,9 @@ class ExpiringTokenAuthentication(TokenAuthentication):
             # If profile lookup fails, fall back to the conservative expiry
             ttl_days = getattr(settings, 'TOKEN_EXPIRE_DAYS_NO_KEEP', 1)
 
+        expires_at = None
         if ttl_days is not None:
-            now = timezone.now()
             # token.created is a datetime
-            age = now - token.created
-            if age.days >= int(ttl_days):
-                # Token expired: delete and fail authentication
-                try:
-                    token.delete()
-                except Exception:
-                    pass
-                raise exceptions.AuthenticationFailed('Token has expired.')
-
-        return (token.user, token)
+            expires_at = token.created + timedelta(days=int(ttl_days))
+
+        return {'user': token.user, 'profile': profile, 'token': token, 'expires_at': expires_at}
@@ -0,0 +1,315 @@
+"""
+Batch mutations for the library and custom list entries.
+
+A batch is validated as a whole before anything is written: if any operation
+is invalid, nothing is applied and every problem is reported. Valid batches
+are applied in one transaction with a handful of bulk queries, whatever the
+number of operations.
+"""
+from . import identity
+from .library import bulk_library_write
+from .models import CustomList, CustomListEntry, Media, UserMedia
+
+MAX_BATCH_OPERATIONS = 500
+MAX_TITLE_LENGTH = Media._meta.get_field('primary_title').max_length
+
+# api_source -> Media field holding that provider's id
+SOURCE_ID_FIELDS = {
+    'ANILIST': 'anilist_id',
+    'TMDB': 'tmdb_id',
+    'RAWG': 'rawg_id',
+    'GOOGLE': 'google_book_id',
+}
+# TMDB and Google Books ids are only unique per media type
+TYPED_ID_FIELDS = {'tmdb_id', 'google_book_id'}
+
+VALID_STATUSES = {choice for choice, _label in UserMedia.STATUS_CHOICES}
+VALID_MEDIA_TYPES = {choice for choice, _label in Media.MEDIA_TYPE_CHOICES}
+
+
+class BatchValidationError(Exception):
+    def __init__(self, errors):
+        super().__init__("Invalid batch.")
+        self.errors = errors
+
+
+def parse_score(raw):
+    """Returns a score between 0 and 10 or None; raises ValueError otherwise."""
+    if raw is None or raw == '':
+        return None
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError("Score must be a number between 0 and 10.")
+    if value < 0 or value > 10:
+        raise ValueError("Score must be between 0 and 10.")
+    return value
+
+
+def parse_progress(raw):
+    if raw is None or raw == '':
+        return 0
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise ValueError("Progress must be an integer.")
+
+
+def _is_id(value):
+    """True for a row id: an int, but not a bool (which would match pk 1)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _parse_api_id(field, raw):
+    """The provider id for `field`: a string for Google Books, an int otherwise; raises ValueError."""
+    if field == 'google_book_id':
+        if not isinstance(raw, str) or not raw.strip():
+            raise ValueError("api_id must be a non-empty string.")
+        return raw
+    if isinstance(raw, str) and raw.isdigit():
+        raw = int(raw)
+    if not _is_id(raw) or raw <= 0:
+        raise ValueError("api_id must be a positive integer.")
+    return raw
+
+
+def _operations(payload, names):
+    if not isinstance(payload, dict):
+        raise BatchValidationError([{'error': "Body must be an object."}])
+    operations = {}
+    for name in names:
+        value = payload.get(name) or []
+        if not isinstance(value, list):
+            raise BatchValidationError([{'op': name, 'error': f"{name} must be a list."}])
+        operations[name] = value
+    if sum(len(value) for value in operations.values()) > MAX_BATCH_OPERATIONS:
+        raise BatchValidationError([{'error': f"A batch may contain at most {MAX_BATCH_OPERATIONS} operations."}])
+    return operations
+
+
+def _media_key(field, api_id, media_type):
+    return (field, api_id, media_type if field in TYPED_ID_FIELDS else None)
+
+
+# ------------------------------------------------------------------------------
+# UserMedia
+# ------------------------------------------------------------------------------
+
+def _validate_user_media_ops(profile, ops):
+    errors = []
+    adds, updates = [], []
+
+    for index, item in enumerate(ops['add']):
+        try:
+            media = item.get('media') if isinstance(item, dict) else None
+            if not isinstance(media, dict):
+                raise ValueError("media object is required")
+            api_source = media.get('api_source')
+            if not isinstance(api_source, str) or api_source not in SOURCE_ID_FIELDS:
+                raise ValueError("Invalid api_source")
+            field = SOURCE_ID_FIELDS[api_source]
+            if media.get('api_id') in (None, ''):
+                raise ValueError("api_source and api_id are required")
+            api_id = _parse_api_id(field, media['api_id'])
+            # AniList search results carry the MyAnimeList id, which links them to MAL-synced rows
+            mal_id = None
+            if api_source == 'ANILIST' and media.get('mal_id') not in (None, ''):
+                mal_id = _parse_api_id('mal_id', media['mal_id'])
+            if not isinstance(media.get('media_type'), str) or media['media_type'] not in VALID_MEDIA_TYPES:
+                raise ValueError("Invalid media_type")
+            title = media.get('primary_title')
+            if not isinstance(title, str) or not title.strip():
+                raise ValueError("primary_title is required")
+            if len(title) > MAX_TITLE_LENGTH:
+                raise ValueError(f"primary_title may be at most {MAX_TITLE_LENGTH} characters")
+            for name in ('secondary_title', 'cover_image_url', 'description'):
+                if media.get(name) is None:
+                    continue
+                max_length = Media._meta.get_field(name).max_length
+                if not isinstance(media[name], str) or (max_length and len(media[name]) > max_length):
+                    raise ValueError(f"{name} must be a string of at most {max_length or 'any'} characters")
+            item_status = item.get('status', UserMedia.PLANNED)
+            if not isinstance(item_status, str) or item_status not in VALID_STATUSES:
+                raise ValueError("Invalid status")
+            adds.append({
+                'index': index,
+                'key': _media_key(field, api_id, media['media_type']),
+                'ids': {api_source: api_id, 'MAL': mal_id},
+                'media': media,
+                'status': item_status,
+                'score': parse_score(item.get('score')),
+                'progress': parse_progress(item.get('progress')),
+            })
+        except ValueError as e:
+            errors.append({'op': 'add', 'index': index, 'error': str(e)})
+
+    referenced = [item.get('id') for item in ops['update'] if isinstance(item, dict)] + list(ops['delete'])
+    owned = set(
+        UserMedia.objects.filter(profile=profile, pk__in=[pk for pk in referenced if _is_id(pk)])
+        .values_list('pk', flat=True)
+    )
+
+    for index, item in enumerate(ops['update']):
+        try:
+            if not isinstance(item, dict) or not _is_id(item.get('id')):
+                raise ValueError("id must be an integer.")
+            if item['id'] not in owned:
+                raise ValueError("Item not found in your list.")
+            changes = {}
+            if 'status' in item:
+                if not isinstance(item['status'], str) or item['status'] not in VALID_STATUSES:
+                    raise ValueError("Invalid status")
+                changes['status'] = item['status']
+            if 'score' in item:
+                changes['score'] = parse_score(item['score'])
+            if 'progress' in item:
+                changes['progress'] = parse_progress(item['progress'])
+            updates.append({'index': index, 'id': item['id'], 'changes': changes})
+        except ValueError as e:
+            errors.append({'op': 'update', 'index': index, 'error': str(e)})
+
+    for index, pk in enumerate(ops['delete']):
+        if not _is_id(pk):
+            errors.append({'op': 'delete', 'index': index, 'error': "id must be an integer."})
+        elif pk not in owned:
+            errors.append({'op': 'delete', 'index': index, 'error': "Item not found in your list."})
+
+    if errors:
+        raise BatchValidationError(errors)
+    return adds, updates, list(ops['delete'])
+
+
+def _resolve_media(adds):
+    """
+    Finds or creates the Media rows for the add operations through
+    `identity.upsert_media`, like every other write path. Returns {key: Media}.
+    """
+    records = {}
+    for add in adds:
+        if add['key'] not in records:
+            media = add['media']
+            records[add['key']] = {
+                'ids': add['ids'],
+                'media_type': media['media_type'],
+                **{field: media[field] for field in identity.DETAIL_FIELDS if field in media},
+            }
+    return dict(zip(records, identity.upsert_media(list(records.values()))))
+
+
+def apply_user_media_batch(profile, payload):
+    """Validates and applies a `{add, update, delete}` batch; returns per-operation results."""
+    adds, updates, deletes = _validate_user_media_ops(profile, _operations(payload, ('add', 'update', 'delete')))
+    results = []
+
+    with bulk_library_write(profile) as batch:
+        if adds:
+            media_by_key = _resolve_media(adds)
+            existing = {
+                um.media_id: um for um in UserMedia.objects.filter(
+                    profile=profile, media_id__in=[media.pk for media in media_by_key.values()]
+                )
+            }
+            to_create = {}
+            for add in adds:
+                media = media_by_key[add['key']]
+                if media.pk in existing or media.pk in to_create:
+                    continue
+                to_create[media.pk] = UserMedia(
+                    profile=profile, media=media, status=add['status'], score=add['score'], progress=add['progress']
+                )
+            UserMedia.objects.bulk_create(batch.stamp(list(to_create.values())))
+
+            created_ids = set()
+            for add in adds:
+                media = media_by_key[add['key']]
+                if media.pk in existing:
+                    results.append({'op': 'add', 'index': add['index'], 'id': existing[media.pk].pk, 'result': 'exists'})
+                elif media.pk in created_ids:
+                    results.append({'op': 'add', 'index': add['index'], 'id': to_create[media.pk].pk, 'result': 'duplicate'})
+                else:
+                    created_ids.add(media.pk)
+                    results.append({'op': 'add', 'index': add['index'], 'id': to_create[media.pk].pk, 'result': 'created'})
+
+        if updates:
+            rows = UserMedia.objects.in_bulk([update['id'] for update in updates])
+            fields = {'change_seq'}
+            for update in updates:
+                row = rows[update['id']]
+                for name, value in update['changes'].items():
+                    setattr(row, name, value)
+                    fields.add(name)
+            UserMedia.objects.bulk_update(batch.stamp(list(rows.values())), sorted(fields))
+            results += [{'op': 'update', 'index': u['index'], 'id': u['id'], 'result': 'updated'} for u in updates]
+
+        if deletes:
+            batch.delete_user_media(deletes)
+            results += [{'op': 'delete', 'index': i, 'id': pk, 'result': 'deleted'} for i, pk in enumerate(deletes)]
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+# Custom list entries
+# ------------------------------------------------------------------------------
+
+def apply_custom_list_entry_batch(profile, payload):
+    """Validates and applies a `{add: [{custom_list, user_media}], delete: [entry ids]}` batch."""
+    ops = _operations(payload, ('add', 'delete'))
+    adds = [item if isinstance(item, dict) else {} for item in ops['add']]
+
+    list_ids = set(CustomList.objects.filter(
+        user_id=profile.user_id, pk__in=[a.get('custom_list') for a in adds if _is_id(a.get('custom_list'))]
+    ).values_list('pk', flat=True))
+    user_media_ids = set(UserMedia.objects.filter(
+        profile=profile, pk__in=[a.get('user_media') for a in adds if _is_id(a.get('user_media'))]
+    ).values_list('pk', flat=True))
+    entry_ids = set(CustomListEntry.objects.filter(
+        custom_list__user_id=profile.user_id, pk__in=[pk for pk in ops['delete'] if _is_id(pk)]
+    ).values_list('pk', flat=True))
+
+    errors = []
+    for index, add in enumerate(adds):
+        if not _is_id(add.get('custom_list')) or not _is_id(add.get('user_media')):
+            errors.append({'op': 'add', 'index': index, 'error': "custom_list and user_media must be integers."})
+        elif add['custom_list'] not in list_ids:
+            errors.append({'op': 'add', 'index': index, 'error': "Custom list not found."})
+        elif add['user_media'] not in user_media_ids:
+            errors.append({'op': 'add', 'index': index, 'error': "Item not found in your list."})
+    for index, pk in enumerate(ops['delete']):
+        if not _is_id(pk):
+            errors.append({'op': 'delete', 'index': index, 'error': "id must be an integer."})
+        elif pk not in entry_ids:
+            errors.append({'op': 'delete', 'index': index, 'error': "Entry not found."})
+    if errors:
+        raise BatchValidationError(errors)
+
+    results = []
+    with bulk_library_write(profile) as batch:
+        if adds:
+            pairs = [(add['custom_list'], add['user_media']) for add in adds]
+            existing = {
+                (entry.custom_list_id, entry.user_media_id): entry.pk
+                for entry in CustomListEntry.objects.filter(
+                    custom_list_id__in={l for l, _ in pairs}, user_media_id__in={u for _, u in pairs}
+                )
+            }
+            to_create = {}
+            for pair in pairs:
+                if pair not in existing and pair not in to_create:
+                    to_create[pair] = CustomListEntry(custom_list_id=pair[0], user_media_id=pair[1])
+            CustomListEntry.objects.bulk_create(batch.stamp(list(to_create.values())))
+            created_pairs = set()
+            for index, pair in enumerate(pairs):
+                if pair in existing:
+                    results.append({'op': 'add', 'index': index, 'id': existing[pair], 'result': 'exists'})
+                elif pair in created_pairs:
+                    results.append({'op': 'add', 'index': index, 'id': to_create[pair].pk, 'result': 'duplicate'})
+                else:
+                    created_pairs.add(pair)
+                    results.append({'op': 'add', 'index': index, 'id': to_create[pair].pk, 'result': 'created'})
+
+        if ops['delete']:
+            batch.delete_custom_list_entries(ops['delete'])
+            results += [{'op': 'delete', 'index': i, 'id': pk, 'result': 'deleted'} for i, pk in enumerate(ops['delete'])]
+
+    return results
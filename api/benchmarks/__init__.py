@@ -0,0 +1,17 @@
+"""
+Offline performance benchmarks, run with `python manage.py benchmark <name>`.
+
+Each benchmark module exposes `run(options) -> dict`. Benchmarks create their
+own synthetic data inside a transaction that is rolled back afterwards, so
+they can be pointed at a real database without leaving anything behind.
+`endpoints` exercises the HTTP API end to end, with provider responses
+replayed from `fixtures/` (see providers.py).
+"""
+from . import endpoints, render, stats, title_index
+
+BENCHMARKS = {
+    'stats': stats.run,
+    'render': render.run,
+    'title_index': title_index.run,
+    'endpoints': endpoints.run,
+}
@@ -0,0 +1,151 @@
+"""
+End-to-end benchmark of the API endpoints: requests go through the full
+middleware, authentication, view and rendering stack (with the Django test
+client, so no network), and the providers answer from recorded responses
+(see providers.py).
+
+Every endpoint is measured on synthetic libraries of 1k, 10k and 50k items
+(`--size` picks one): requests per second, p50 and p99 latency, database
+queries and peak Python memory of one request. Syncs import a provider
+library of `--sync-size` entries; after an untimed first import they measure
+a re-sync, the common case. Provider latency comes from
+`providers.DEFAULT_LATENCY` unless overridden with `--latency`
+(`--latency all=0` leaves only the backend's own time).
+"""
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.models import CustomList, CustomListEntry, Profile, UserMedia
+from api.query_budget import track_queries
+
+from .providers import ProviderReplay, parse_latency
+from .synthetic import build_profile, percentile
+
+SIZES = (1000, 10000, 50000)
+CUSTOM_LIST_ENTRIES = 1000
+# Syncs are slow with realistic provider latency; they run at most this often
+SYNC_REPEAT = 5
+
+
+def _prepare(size):
+    profile = build_profile(size)
+    Profile.objects.filter(pk=profile.pk).update(
+        anilist_access_token='benchmark',
+        mal_access_token='benchmark',
+        tmdb_session_id='benchmark',
+        steam_id='76561197960287930',
+        keep_local_on_sync=False,
+    )
+    user = profile.user
+    custom_lists = CustomList.objects.bulk_create([
+        CustomList(user=user, name=name) for name in ('Favourites', 'Rewatch', 'Backlog')
+    ])
+    rows = UserMedia.objects.filter(profile=profile).values_list('pk', flat=True)[:CUSTOM_LIST_ENTRIES]
+    CustomListEntry.objects.bulk_create(
+        [CustomListEntry(custom_list=custom_lists[0], user_media_id=pk) for pk in rows], batch_size=1000
+    )
+
+    client = APIClient(SERVER_NAME='localhost')
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    return profile, client, custom_lists[0]
+
+
+def _scenarios(profile, custom_list):
+    """`(name, method, path, params, before)`; `before()` runs ahead of every request, untimed."""
+
+    def use_rawg(enabled):
+        return lambda: Profile.objects.filter(pk=profile.pk).update(use_steam_or_rawg=not enabled)
+
+    return [
+        ('search', 'get', '/api/search/', {'q': 'fullmetal'}, use_rawg(False)),
+        ('search (rawg)', 'get', '/api/search/', {'q': 'fullmetal', 'sources': 'GAME'}, use_rawg(True)),
+        ('trends', 'get', '/api/trends/', None, use_rawg(False)),
+        ('trends (rawg)', 'get', '/api/trends/', None, use_rawg(True)),
+        ('user-media-list (cold)', 'get', '/api/user/list/', None, cache.clear),
+        ('user-media-list', 'get', '/api/user/list/', None, None),
+        ('user-media-page', 'get', '/api/user/library/', {'sort': 'title', 'limit': 50}, None),
+        ('stats', 'get', '/api/stats/', None, None),
+        ('custom-lists', 'get', '/api/custom-lists/', None, None),
+        ('custom-list-entries', 'get', f'/api/custom-lists/{custom_list.pk}/entries/', {'limit': 100}, None),
+        ('sync-anilist', 'post', '/api/sync/anilist/', None, None),
+        ('sync-mal', 'post', '/api/sync/mal/', None, None),
+        ('sync-tmdb', 'post', '/api/sync/tmdb/', None, None),
+        ('steam-sync', 'post', '/api/sync/steam/', None, None),
+    ]
+
+
+def _measure(client, replay, scenario, repeat):
+    name, method, path, params, before = scenario
+
+    def send():
+        if before:
+            before()
+        started = time.perf_counter()
+        response = client.post(path, params, format='json') if method == 'post' else client.get(path, params)
+        return response, time.perf_counter() - started
+
+    response, _ = send()
+    errors = int(response.status_code >= 400)
+
+    # Peak memory, queries and provider calls of one request, apart from the timed runs
+    calls_before = sum(replay.calls.values())
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    with track_queries() as queries:
+        send()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    provider_calls = sum(replay.calls.values()) - calls_before
+
+    latencies = []
+    for _ in range(repeat):
+        response, elapsed = send()
+        latencies.append(elapsed)
+        errors += response.status_code >= 400
+    latencies.sort()
+
+    result = {
+        'runs': repeat,
+        'errors': errors,
+        'throughput_rps': repeat / sum(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_memory_kib': peak / 1024,
+        'queries': queries.count,
+        'provider_calls': provider_calls,
+    }
+    print(
+        f"  {name:<24} {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.1f} ms  "
+        f"p99 {result['p99_ms']:8.1f} ms  {result['peak_memory_kib']:9.0f} KiB  {queries.count:4d} queries"
+        + (f'  {errors} errors' if errors else '')
+    )
+    return result
+
+
+def run(options):
+    sizes = (options['size'],) if options.get('size') else SIZES
+    repeat = options.get('repeat') or 20
+    sync_size = options.get('sync_size') or 200
+    latency = parse_latency(options.get('latency'))
+
+    results = {'sync_size': sync_size, 'profiles': {}}
+    with ProviderReplay(latency=latency, list_size=sync_size) as replay:
+        results['latency'] = {provider: value.as_dict() for provider, value in replay.latency.items()}
+        for size in sizes:
+            print(f'Endpoint benchmark on a synthetic {size}-item library ({sync_size}-entry provider libraries)')
+            profile, client, custom_list = _prepare(size)
+            results['profiles'][str(size)] = {
+                scenario[0]: _measure(
+                    client, replay, scenario, min(repeat, SYNC_REPEAT) if scenario[1] == 'post' else repeat
+                )
+                for scenario in _scenarios(profile, custom_list)
+            }
+            cache.clear()
+        results['unmatched_requests'] = dict(replay.unmatched)
+    if replay.unmatched:
+        print(f'  {sum(replay.unmatched.values())} provider requests had no recorded response: {dict(replay.unmatched)}')
+    return results
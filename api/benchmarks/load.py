@@ -0,0 +1,298 @@
+"""
+Closed-loop load generator for a running backend (`python manage.py loadtest`).
+
+`users` synthetic users register through /api/auth/register/ and log in
+through /api/auth/local-login/. Each then sends one request at a time,
+picked from a weighted mix of endpoints, and after the answer pauses for an
+exponentially distributed think time before the next. The request rate
+therefore follows how fast the server answers, which is what tells how many
+users one backend carries before latency or errors climb. Users start spread
+over the ramp-up.
+
+Every `interval` seconds a window of requests per second, p50/p95/p99 latency
+and error rate is taken per endpoint; the report holds that timeline and the
+totals after the ramp-up.
+
+Syncs need linked provider accounts. When the load generator shares the
+database with the server, `link_providers` fills in placeholder tokens and
+gives every user a library with one MAL sync before the load starts. Run the
+server with PROVIDER_STANDIN_URL pointing at the provider stand-in
+(standin.py), so searches, trends and syncs stay on the machine.
+"""
+import random
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.contrib.auth.models import User
+
+from api.models import Profile
+
+from .synthetic import percentile
+
+# Relative weights of the endpoints in the default mix
+DEFAULT_MIX = {
+    'library-page': 25,
+    'library-list': 8,
+    'library-changes': 5,
+    'stats': 10,
+    'update': 15,
+    'search': 15,
+    'trends': 5,
+    'sync-anilist': 1,
+    'sync-mal': 1,
+    'sync-tmdb': 1,
+    'steam-sync': 1,
+}
+SYNC_ENDPOINTS = {
+    'sync-anilist': '/api/sync/anilist/',
+    'sync-mal': '/api/sync/mal/',
+    'sync-tmdb': '/api/sync/tmdb/',
+    'steam-sync': '/api/sync/steam/',
+}
+SEARCH_TERMS = ['fullmetal', 'dune', 'portal', 'inception', 'one piece', 'witcher', 'breaking bad', 'hades']
+SIGN_UP_RETRIES = 5
+
+
+def parse_mix(spec):
+    """`'search=10,stats=5'` -> `{'search': 10, 'stats': 5}`; the default mix for an empty spec."""
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in spec.split(','):
+        name, sep, weight = part.strip().partition('=')
+        if not sep or name not in DEFAULT_MIX:
+            raise ValueError(f"Expected <endpoint>=<weight> with an endpoint of {', '.join(DEFAULT_MIX)}, got {part!r}")
+        mix[name] = float(weight)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("The mix needs at least one endpoint with a positive weight")
+    return mix
+
+
+def summarize(samples, seconds):
+    """
+    `{endpoint: stats}` of `(endpoint, started, seconds, status)` samples
+    collected over `seconds`; a status of 0 stands for a connection error.
+    """
+    by_endpoint = {}
+    for endpoint, _started, elapsed, status in samples:
+        by_endpoint.setdefault(endpoint, []).append((elapsed, status))
+    summary = {}
+    for endpoint, results in sorted(by_endpoint.items()):
+        latencies = sorted(elapsed for elapsed, _status in results)
+        statuses = {}
+        for _elapsed, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(1 for _elapsed, status in results if not 200 <= status < 400)
+        summary[endpoint] = {
+            'requests': len(results),
+            'rps': len(results) / seconds if seconds else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'error_rate': errors / len(results),
+            'statuses': statuses,
+        }
+    return summary
+
+
+class VirtualUser:
+    """One synthetic user with its own connection, sending one request at a time."""
+
+    def __init__(self, base_url, username, password, samples, rng, timeout):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.samples = samples
+        self.rng = rng
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.library_ids = []
+        self.seq = 0
+
+    def request(self, endpoint, method, path, **kwargs):
+        """Sends one request and appends its sample; returns the response, or None if it failed to connect."""
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self.samples.append((endpoint, started, time.monotonic() - started, 0))
+            return None
+        self.samples.append((endpoint, started, time.monotonic() - started, response.status_code))
+        return response
+
+    def _sign_up_request(self, endpoint, path):
+        # The anonymous throttle counts all users as one client; wait it out like a real client would
+        for _attempt in range(SIGN_UP_RETRIES):
+            response = self.request(endpoint, 'POST', path, json={'username': self.username, 'password': self.password})
+            if response is None or response.status_code != 429:
+                return response
+            time.sleep(float(response.headers.get('Retry-After') or 1))
+        return response
+
+    def sign_up(self):
+        """Registers and logs in; True once the user holds a token."""
+        self._sign_up_request('register', '/api/auth/register/')
+        response = self._sign_up_request('login', '/api/auth/local-login/')
+        if response is None or response.status_code != 200:
+            return False
+        self.session.headers['Authorization'] = f"Token {response.json()['token']}"
+        return True
+
+    def act(self, endpoint):
+        if endpoint == 'update' and not self.library_ids:
+            endpoint = 'library-page'
+        if endpoint == 'library-page':
+            sort = self.rng.choice(['-score', 'title', '-progress'])
+            response = self.request(endpoint, 'GET', '/api/user/library/', params={'limit': 50, 'sort': sort})
+            if response is not None and response.status_code == 200:
+                self.library_ids = [item['id'] for item in response.json()['results']]
+        elif endpoint == 'library-list':
+            self.request(endpoint, 'GET', '/api/user/list/')
+        elif endpoint == 'library-changes':
+            response = self.request(endpoint, 'GET', '/api/user/list/changes', params={'since': self.seq})
+            if response is not None and response.status_code == 200:
+                self.seq = response.json()['seq']
+        elif endpoint == 'stats':
+            self.request(endpoint, 'GET', '/api/stats/')
+        elif endpoint == 'update':
+            pk = self.rng.choice(self.library_ids)
+            self.request(endpoint, 'PATCH', f'/api/list/update/{pk}/', json={
+                'score': round(self.rng.uniform(0, 10), 1), 'progress': self.rng.randint(0, 100),
+            })
+        elif endpoint == 'search':
+            self.request(endpoint, 'GET', '/api/search/', params={'q': self.rng.choice(SEARCH_TERMS)})
+        elif endpoint == 'trends':
+            self.request(endpoint, 'GET', '/api/trends/')
+        else:
+            self.request(endpoint, 'POST', SYNC_ENDPOINTS[endpoint])
+
+    def run(self, mix, deadline, think_seconds):
+        endpoints, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            self.act(self.rng.choices(endpoints, weights)[0])
+            if think_seconds:
+                time.sleep(min(self.rng.expovariate(1 / think_seconds), max(deadline - time.monotonic(), 0)))
+
+
+def link_providers(usernames):
+    """Gives the users provider accounts the stand-in accepts (needs the server's database)."""
+    return Profile.objects.filter(user__username__in=usernames).update(
+        anilist_access_token='loadtest',
+        mal_access_token='loadtest',
+        tmdb_session_id='loadtest',
+        steam_id='76561197960287930',
+        keep_local_on_sync=False,
+    )
+
+
+class LoadTest:
+    def __init__(self, base_url, users=50, duration=60, ramp_up=10, think_seconds=0.5, interval=5, mix=None,
+                 timeout=30, link=True, seed=0, out=print):
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.duration = duration
+        self.ramp_up = min(ramp_up, duration)
+        self.think_seconds = think_seconds
+        self.interval = interval
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.timeout = timeout
+        self.link = link
+        self.seed = seed
+        self.out = out
+        self.prefix = f'load-{int(time.time())}-{secrets.token_hex(2)}'
+        # Appended to by every user thread; list.append is atomic
+        self.samples = []
+        self.setup_samples = []
+        self.setup_seconds = 0.0
+
+    def _make_users(self):
+        password = secrets.token_urlsafe(12)
+        return [
+            VirtualUser(
+                self.base_url, f'{self.prefix}-{i}', password, self.setup_samples,
+                random.Random(self.seed * 100003 + i), self.timeout,
+            )
+            for i in range(self.users)
+        ]
+
+    def setup(self):
+        """Signs the users up (and links and fills their libraries); returns the ones ready to go."""
+        users = self._make_users()
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(len(users), 32)) as pool:
+            ready = [user for user, ok in zip(users, pool.map(VirtualUser.sign_up, users)) if ok]
+            if self.link and ready:
+                linked = link_providers([user.username for user in ready])
+                self.out(f"Linked provider accounts of {linked} users")
+                list(pool.map(lambda user: user.request('sync-mal', 'POST', SYNC_ENDPOINTS['sync-mal']), ready))
+        self.setup_seconds = time.monotonic() - started
+        self.out(f"{len(ready)} of {len(users)} users signed up in {self.setup_seconds:.1f} s")
+        for user in ready:
+            user.samples = self.samples
+        return ready
+
+    def _window_line(self, elapsed, seconds, window):
+        requests_count = sum(stats['requests'] for stats in window.values())
+        errors = sum(stats['requests'] * stats['error_rate'] for stats in window.values())
+        slowest = max(window.items(), key=lambda item: item[1]['p95_ms'], default=None)
+        line = f"[{elapsed:5.0f}s] {requests_count / seconds:8.1f} req/s  errors {errors / max(requests_count, 1):6.1%}"
+        if slowest:
+            line += f"  slowest p95 {slowest[0]} {slowest[1]['p95_ms']:.0f} ms"
+        return line
+
+    def run(self):
+        users = self.setup()
+        if not users:
+            raise RuntimeError(f"No user could sign up at {self.base_url}; is the backend running?")
+
+        started = time.monotonic()
+        deadline = started + self.duration
+        threads = []
+        for i, user in enumerate(users):
+            threads.append(threading.Timer(
+                self.ramp_up * i / len(users), user.run, (self.mix, deadline, self.think_seconds),
+            ))
+            threads[-1].daemon = True
+            threads[-1].start()
+
+        timeline = []
+        seen = 0
+        window_start = started
+        while True:
+            window_end = window_start + self.interval
+            for thread in threads:
+                thread.join(max(window_end - time.monotonic(), 0))
+            finished = not any(thread.is_alive() for thread in threads)
+            now = time.monotonic()
+            window_samples = self.samples[seen:]
+            seen += len(window_samples)
+            window = summarize(window_samples, now - window_start)
+            timeline.append({'t': round(now - started, 1), 'endpoints': window})
+            self.out(self._window_line(now - started, now - window_start, window))
+            if finished:
+                break
+            window_start = now
+
+        measured = [sample for sample in self.samples if sample[1] - started >= self.ramp_up]
+        measured_seconds = max(self.duration - self.ramp_up, 1e-9)
+        summary = summarize(measured, measured_seconds)
+        return {
+            'base_url': self.base_url,
+            'users': len(users),
+            'duration': self.duration,
+            'ramp_up': self.ramp_up,
+            'think_seconds': self.think_seconds,
+            'mix': self.mix,
+            'setup': summarize(self.setup_samples, self.setup_seconds),
+            'summary': summary,
+            'total': summarize([('all', *sample[1:]) for sample in measured], measured_seconds).get('all'),
+            'timeline': timeline,
+            'usernames_prefix': self.prefix,
+        }
+
+    def remove_users(self):
+        """Deletes the users this run signed up, with their libraries (needs the server's database)."""
+        return User.objects.filter(username__startswith=f'{self.prefix}-').delete()[1].get('auth.User', 0)
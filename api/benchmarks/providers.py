@@ -0,0 +1,343 @@
+"""
+Replays recorded provider responses so searches, trends and syncs can be
+benchmarked offline.
+
+`ProviderReplay` answers every HTTP request the provider services make
+(AniList, MyAnimeList, TMDB, Steam, RAWG and Google Books) from the
+responses in `fixtures/`, after sleeping for a latency drawn from that
+provider's distribution. Library lists are grown to `list_size` entries by
+renumbering the recorded ones, and paginated the way the real APIs do, so a
+sync makes the same number of requests it would against a library that size.
+
+    with ProviderReplay(latency={'tmdb': Latency(80, 0.3)}, list_size=500) as replay:
+        client.post('/api/sync/tmdb/')
+    replay.calls  # {'tmdb': 5}
+
+Requests to anything else get a 404 and are counted in `unmatched`. The
+stand-in server (standin.py) serves the same responses over HTTP.
+"""
+import copy
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from importlib import import_module
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+HOSTS = {
+    'graphql.anilist.co': 'anilist',
+    'api.myanimelist.net': 'mal',
+    'api.themoviedb.org': 'tmdb',
+    'api.steampowered.com': 'steam',
+    'store.steampowered.com': 'steam',
+    'api.rawg.io': 'rawg',
+    'www.googleapis.com': 'google_books',
+}
+
+# Module-level API keys the services refuse to run without
+API_KEYS = {
+    'rawg_service': 'RAWG_API_KEY',
+    'steam_service': 'STEAM_API_KEY',
+    'google_books_service': 'GOOGLE_BOOKS_API_KEY',
+    'tmdb_service': 'TMDB_API_KEY',
+}
+
+# Page sizes the real APIs use for library lists
+ANILIST_PAGE_SIZE = 50
+MAL_PAGE_SIZE = 100
+
+
+class Latency:
+    """A lognormal latency: `median_ms`, spread by `sigma` (0 for a constant)."""
+
+    def __init__(self, median_ms, sigma=0.0):
+        self.median_ms = float(median_ms)
+        self.sigma = float(sigma)
+
+    @classmethod
+    def parse(cls, spec):
+        """`'120'` or `'120:0.5'` (median in ms, then sigma)."""
+        median, _, sigma = spec.partition(':')
+        return cls(float(median), float(sigma) if sigma else 0.0)
+
+    def sample(self, rng):
+        """A latency in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        jitter = math.exp(rng.gauss(0, self.sigma)) if self.sigma else 1.0
+        return self.median_ms * jitter / 1000
+
+    def as_dict(self):
+        return {'median_ms': self.median_ms, 'sigma': self.sigma}
+
+
+# Roughly what the providers answer in from Europe, p50 and spread
+DEFAULT_LATENCY = {
+    'anilist': Latency(180, 0.4),
+    'mal': Latency(220, 0.5),
+    'tmdb': Latency(90, 0.3),
+    'steam': Latency(120, 0.5),
+    'rawg': Latency(300, 0.5),
+    'google_books': Latency(110, 0.3),
+}
+
+
+def parse_latency(specs):
+    """`['anilist=120:0.4', 'all=0']` -> `{provider: Latency}`; `all` sets every provider."""
+    latency = {}
+    for spec in specs or ():
+        provider, sep, value = spec.partition('=')
+        if not sep or (provider != 'all' and provider not in DEFAULT_LATENCY):
+            raise ValueError(f"Expected <provider>=<median_ms>[:<sigma>] with a provider of {', '.join(DEFAULT_LATENCY)} or all, got {spec!r}")
+        if provider == 'all':
+            latency.update({name: Latency.parse(value) for name in DEFAULT_LATENCY})
+        else:
+            latency[provider] = Latency.parse(value)
+    return latency
+
+
+def resolve(url):
+    """
+    `(provider, path)` of a request to a provider API, made to the provider
+    itself or to the stand-in, which serves each one under its host name
+    (see `provider_url()` in backend/settings/base.py). The provider is None
+    for other URLs.
+    """
+    parts = urlsplit(url)
+    if parts.hostname in HOSTS:
+        return HOSTS[parts.hostname], parts.path
+    host, _, path = parts.path.lstrip('/').partition('/')
+    return HOSTS.get(host), f'/{path}'
+
+
+def load_fixtures():
+    return {path.stem: json.loads(path.read_text(encoding='utf-8')) for path in FIXTURES_DIR.glob('*.json')}
+
+
+def _numbered(templates, count, renumber):
+    """`count` copies of the recorded `templates`, each passed through `renumber(item, i)`."""
+    return [renumber(copy.deepcopy(templates[i % len(templates)]), i) for i in range(count)]
+
+
+class ProviderReplay:
+    """Context manager answering provider HTTP requests from the fixtures."""
+
+    def __init__(self, latency=None, list_size=200, seed=0):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.list_size = list_size
+        self.fixtures = load_fixtures()
+        self.calls = Counter()
+        self.unmatched = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._lists = {}
+        self._saved_keys = {}
+        self._original_send = None
+
+    # -- patching --------------------------------------------------------------
+
+    def __enter__(self):
+        for module_name, attribute in API_KEYS.items():
+            module = import_module(f'api.services.{module_name}')
+            self._saved_keys[module, attribute] = getattr(module, attribute)
+            if not getattr(module, attribute):
+                setattr(module, attribute, 'benchmark')
+
+        replay = self
+        self._original_send = HTTPAdapter.send
+
+        def send(adapter, request, **kwargs):
+            return replay.send(request)
+
+        HTTPAdapter.send = send
+        return self
+
+    def __exit__(self, *exc_info):
+        HTTPAdapter.send = self._original_send
+        for (module, attribute), value in self._saved_keys.items():
+            setattr(module, attribute, value)
+        self._saved_keys = {}
+
+    def send(self, request):
+        provider, path = resolve(request.url)
+        query = urlsplit(request.url).query
+        body = self.answer(provider, path, {key: values[-1] for key, values in parse_qs(query).items()}, request.body)
+        delay = self.delay(provider)
+        if delay:
+            time.sleep(delay)
+        return self._response(request, 404 if body is None else 200, body or {})
+
+    def answer(self, provider, path, params, body):
+        """The recorded response to a request for `path` of `provider`'s API, or None."""
+        response = None
+        if provider is not None:
+            response = getattr(self, f'_{provider}')(path, params, body)
+        with self._lock:
+            if response is None:
+                self.unmatched[f'{provider or "unknown"} {path}'] += 1
+            else:
+                self.calls[provider] += 1
+        return response
+
+    def delay(self, provider):
+        """A latency in seconds for a request to `provider`."""
+        if provider is None:
+            return 0.0
+        with self._lock:
+            return self.latency[provider].sample(self._rng)
+
+    @staticmethod
+    def _response(request, status, body):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK' if status == 200 else 'Not Found'
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json; charset=utf-8'})
+        response._content = json.dumps(body).encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def _library(self, key, build):
+        """The generated list `key`, built once per replay (pages of it are requested concurrently)."""
+        with self._lock:
+            if key not in self._lists:
+                self._lists[key] = build()
+            return self._lists[key]
+
+    # -- providers -------------------------------------------------------------
+
+    def _anilist(self, path, params, body):
+        payload = json.loads(body or b'{}')
+        query = payload.get('query', '')
+        variables = payload.get('variables') or {}
+        recorded = self.fixtures['anilist']
+        if 'Viewer' in query:
+            return recorded['viewer']
+        if 'mediaList' in query:
+            media_type = 'MANGA' if 'type: MANGA' in query else 'ANIME'
+            entries = self._library(('anilist', media_type), lambda: self._anilist_list(media_type))
+            page, per_page = variables.get('page', 1), variables.get('perPage', ANILIST_PAGE_SIZE)
+            start = (page - 1) * per_page
+            return {'data': {'Page': {
+                'pageInfo': {'hasNextPage': start + per_page < len(entries)},
+                'mediaList': entries[start:start + per_page],
+            }}}
+        if 'idMal_in' in query:
+            return {'data': {'Page': {'media': [
+                {'id': mal_id, 'idMal': mal_id, 'type': variables.get('type'), 'description': 'Replayed description.',
+                 'duration': 24, 'episodes': 12, 'chapters': None}
+                for mal_id in variables.get('ids', [])
+            ]}}}
+        if 'id_in' in query:
+            return {'data': {'Page': {'media': [
+                {'id': media_id, 'idMal': media_id, 'type': 'ANIME', 'description': 'Replayed description.',
+                 'duration': 24, 'episodes': 12, 'chapters': None}
+                for media_id in variables.get('ids', [])
+            ]}}}
+        if 'TRENDING_DESC' in query:
+            return recorded['trending']
+        return recorded['search']
+
+    def _anilist_list(self, media_type):
+        base = 1_000_000 if media_type == 'ANIME' else 2_000_000
+        templates = self.fixtures['anilist']['media_list']['data']['Page']['mediaList']
+
+        def renumber(entry, i):
+            media = entry['media']
+            media['id'] = media['idMal'] = base + i
+            media['title']['romaji'] = f"{media['title']['romaji']} #{i}"
+            return entry
+
+        return _numbered(templates, self.list_size, renumber)
+
+    def _mal(self, path, params, body):
+        list_type = path.rstrip('/').rsplit('/', 1)[-1]
+        if list_type not in ('animelist', 'mangalist'):
+            return None
+        base = 1_000_000 if list_type == 'animelist' else 2_000_000
+
+        def build():
+            def renumber(entry, i):
+                entry['node']['id'] = base + i
+                entry['node']['title'] = f"{entry['node']['title']} #{i}"
+                return entry
+
+            return _numbered(self.fixtures['mal'][list_type]['data'], self.list_size, renumber)
+
+        entries = self._library(('mal', list_type), build)
+        limit, offset = int(params.get('limit', MAL_PAGE_SIZE)), int(params.get('offset', 0))
+        paging = {}
+        if offset + limit < len(entries):
+            paging['next'] = f'{settings.MAL_API_URL}/users/@me/{list_type}?offset={offset + limit}&limit={limit}'
+        return {'data': entries[offset:offset + limit], 'paging': paging}
+
+    def _tmdb(self, path, params, body):
+        recorded = self.fixtures['tmdb']
+        route = path.removeprefix('/3/').rstrip('/')
+        simple = {
+            'search/movie': 'search_movie',
+            'search/tv': 'search_tv',
+            'trending/movie/week': 'trending_movie',
+            'trending/tv/week': 'trending_tv',
+            'account': 'account',
+        }
+        if route in simple:
+            return recorded[simple[route]]
+        parts = route.split('/')
+        if len(parts) != 4 or parts[0] != 'account' or parts[2] not in ('watchlist', 'rated'):
+            return None
+        kind, list_name = parts[3], parts[2]
+        # The four account lists make up the library between them
+        base = {'movies': 1_000_000, 'tv': 2_000_000}[kind] + (500_000 if list_name == 'rated' else 0)
+
+        def build():
+            def renumber(item, i):
+                item['id'] = base + i
+                return item
+
+            templates = recorded['account_movies' if kind == 'movies' else 'account_tv']['results']
+            return _numbered(templates, max(self.list_size // 4, 1), renumber)
+
+        results = self._library(('tmdb', list_name, kind), build)
+        return {'page': 1, 'results': results, 'total_pages': 1, 'total_results': len(results)}
+
+    def _steam(self, path, params, body):
+        recorded = self.fixtures['steam']
+        if 'GetOwnedGames' in path:
+            def build():
+                def renumber(game, i):
+                    game['appid'] = 1_000_000 + i
+                    game['name'] = f"{game['name']} #{i}"
+                    return game
+
+                return _numbered(recorded['owned_games']['response']['games'], self.list_size, renumber)
+
+            games = self._library(('steam', 'owned'), build)
+            return {'response': {'game_count': len(games), 'games': games}}
+        if path.rstrip('/').endswith('/appdetails'):
+            appid = params.get('appids', '')
+            details = copy.deepcopy(next(iter(recorded['app_details'].values())))
+            details['data']['steam_appid'] = int(appid) if appid.isdigit() else appid
+            return {appid: details}
+        if 'GetMostPlayedGames' in path:
+            return recorded['most_played']
+        if 'storesearch' in path:
+            return recorded['store_search']
+        return None
+
+    def _rawg(self, path, params, body):
+        return self.fixtures['rawg']['games'] if path.rstrip('/') == '/api/games' else None
+
+    def _google_books(self, path, params, body):
+        return self.fixtures['google_books']['volumes'] if path.rstrip('/') == '/books/v1/volumes' else None
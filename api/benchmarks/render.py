@@ -0,0 +1,50 @@
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from api import columnar
+from api.models import UserMedia
+from api.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from api.serializers import UserMediaSerializer
+
+from .synthetic import build_profile, timed
+
+
+def _drf_serialize(rows):
+    """What `UserMediaSerializer(rows, many=True).data` did before the plain-dict fast path."""
+    return serializers.ListSerializer(rows, child=UserMediaSerializer()).data
+
+
+def _measure(label, fn, repeat):
+    seconds, result = timed(fn, repeat=repeat)
+    size = f'{len(result) / 1024:9.0f} KiB' if isinstance(result, bytes) else ''
+    print(f'  {label:<28} {seconds * 1000:9.1f} ms {size}')
+    return {'seconds': seconds, **({'bytes': len(result)} if isinstance(result, bytes) else {})}, result
+
+
+def run(options):
+    size = options.get('size') or 10000
+    repeat = options.get('repeat') or 5
+    print(f'Serialize/render benchmark on a synthetic {size}-item library')
+    profile = build_profile(size)
+    rows = list(UserMedia.objects.filter(profile=profile).select_related('media'))
+
+    results = {'size': size}
+    results['serialize_drf'], data = _measure('serialize (DRF fields)', lambda: _drf_serialize(rows), repeat)
+    results['serialize_plain'], plain = _measure(
+        'serialize (plain dicts)', lambda: UserMediaSerializer(rows, many=True).data, repeat
+    )
+    assert list(map(dict, data)) == list(plain), "fast path output differs from DRF's"
+
+    results['render_json'], _ = _measure('render stdlib json', lambda: JSONRenderer().render(plain), repeat)
+    if orjson is not None:
+        results['render_orjson'], _ = _measure('render orjson', lambda: ORJSONRenderer().render(plain), repeat)
+    else:
+        print('  orjson not installed, skipping')
+    results['columnar_json'], _ = _measure(
+        'columnar encode + render', lambda: ORJSONRenderer().render(columnar.encode_user_media(plain)), repeat
+    )
+    if msgpack is not None:
+        results['render_msgpack'], _ = _measure('render msgpack', lambda: MessagePackRenderer().render(plain), repeat)
+    else:
+        print('  msgpack not installed, skipping')
+    return results
@@ -0,0 +1,109 @@
+"""
+A local stand-in for the provider APIs, for load tests and offline work
+(`python manage.py provider_standin`).
+
+It answers the requests the provider services make with the recorded
+responses of providers.py, each provider under its host name
+(`http://127.0.0.1:8100/api.themoviedb.org/3/search/movie`), so setting
+`PROVIDER_STANDIN_URL=http://127.0.0.1:8100` points the backend at it.
+Every response waits for the provider's latency first, and a share of them
+can fail: `throttle_rate` with 429 and a `Retry-After` header,
+`error_rate` with 503. The services retry both, as they would upstream.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .providers import ProviderReplay, resolve
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8100
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, replay, error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=0):
+        super().__init__(address, StandinHandler)
+        self.replay = replay
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.responses = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def outcome(self):
+        """'throttled', 'error' or 'ok', drawn with the configured rates."""
+        with self._lock:
+            draw = self._rng.random()
+        if draw < self.throttle_rate:
+            return 'throttled'
+        if draw < self.throttle_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+    def record(self, provider, status):
+        with self._lock:
+            self.responses[provider or 'unknown', status] += 1
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server_version = 'ProviderStandin/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._answer()
+
+    def do_POST(self):
+        self._answer()
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        provider, path = resolve(self.path)
+        params = {key: values[-1] for key, values in parse_qs(urlsplit(self.path).query).items()}
+
+        delay = self.server.replay.delay(provider)
+        if delay:
+            time.sleep(delay)
+
+        headers = {}
+        outcome = self.server.outcome() if provider else 'ok'
+        if outcome == 'throttled':
+            status, payload = 429, {'error': 'Too Many Requests'}
+            headers['Retry-After'] = str(self.server.retry_after)
+        elif outcome == 'error':
+            status, payload = 503, {'error': 'Service Unavailable'}
+        else:
+            payload = self.server.replay.answer(provider, path, params, body)
+            status = 404 if payload is None else 200
+            payload = payload or {'error': 'Not Found'}
+
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.record(provider, status)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(host='127.0.0.1', port=DEFAULT_PORT, latency=None, list_size=200, error_rate=0.0, throttle_rate=0.0,
+                retry_after=1, seed=0):
+    """A `StandinServer` bound to `host:port`; call `serve_forever()` on it."""
+    replay = ProviderReplay(latency=latency, list_size=list_size, seed=seed)
+    return StandinServer(
+        (host, port), replay, error_rate=error_rate, throttle_rate=throttle_rate, retry_after=retry_after, seed=seed,
+    )
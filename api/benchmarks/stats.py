@@ -0,0 +1,64 @@
+from django.db import connection
+
+from api import stats
+from api.models import UserMedia
+
+from .synthetic import build_profile, timed
+
+
+def _per_row_stats(profile):
+    """The previous `StatsView` algorithm: one pass per row in Python."""
+    time_spent = {}
+    for item in UserMedia.objects.filter(profile=profile):
+        if item.progress <= 0:
+            continue
+        media_type = item.media.media_type
+        time_spent[media_type] = time_spent.get(media_type, 0) + stats.minutes_for(media_type, item.progress)
+    for item in UserMedia.objects.filter(profile=profile, status='COMPLETED', score__isnull=False):
+        media_type = item.media.media_type
+        weight = stats.minutes_for(media_type, item.progress) or 1
+        time_spent[media_type] = time_spent.get(media_type, 0) + weight
+    return time_spent
+
+
+def _measure(label, fn, repeat):
+    queries = []
+    with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+        fn()
+    seconds, _ = timed(fn, repeat=repeat)
+    print(f'  {label:<28} {seconds * 1000:9.1f} ms  {len(queries):6d} queries')
+    return {'seconds': seconds, 'queries': len(queries)}
+
+
+def run(options):
+    size = options.get('size') or 20000
+    repeat = options.get('repeat') or 3
+    print(f'Stats benchmark on a synthetic {size}-item profile')
+    profile = build_profile(size)
+
+    results = {'size': size}
+    results['per_row'] = _measure('per-row python loop', lambda: _per_row_stats(profile), 1)
+    results['aggregate'] = _measure(
+        'grouped aggregate query', lambda: stats.build_stats_payload(stats.aggregate_by_type(profile)), repeat
+    )
+    stats.rebuild_profile_stats(profile)
+    results['summary_table'] = _measure(
+        'summary table read',
+        lambda: stats.build_stats_payload({
+            row.pop('media_type'): row
+            for row in profile.stats_buckets.values(
+                'media_type', 'progress_minutes', 'completed_count', 'weight_sum', 'weighted_score_sum'
+            )
+        }),
+        repeat,
+    )
+    item = UserMedia.objects.filter(profile=profile).select_related('media').first()
+    results['incremental_update'] = _measure(
+        'incremental bucket update',
+        lambda: stats.apply_contribution(
+            profile.pk, item.media.media_type,
+            stats.contribution(item.media.media_type, UserMedia.COMPLETED, 7.0, 12),
+        ),
+        repeat,
+    )
+    return results
@@ -0,0 +1,89 @@
+import math
+import random
+import time
+
+from django.contrib.auth.models import User
+
+from api.models import Media, Profile, UserMedia
+
+STATUSES = [choice for choice, _label in UserMedia.STATUS_CHOICES]
+MEDIA_TYPES = [choice for choice, _label in Media.MEDIA_TYPE_CHOICES]
+
+
+def build_profile(size, username=None, seed=0):
+    """
+    Creates a user, profile and `size` Media/UserMedia rows with a
+    deterministic random spread of types, statuses, scores and progress.
+    """
+    rng = random.Random(seed)
+    username = username or f'bench-{size}-{int(time.time() * 1000)}'
+    user = User.objects.create_user(username=username, password='bench')
+    profile = Profile.objects.create(user=user)
+
+    media = Media.objects.bulk_create([
+        Media(
+            media_type=rng.choice(MEDIA_TYPES),
+            primary_title=f'{username} title {i}',
+            cover_image_url=f'https://example.invalid/{i}.jpg',
+        )
+        for i in range(size)
+    ], batch_size=1000)
+    UserMedia.objects.bulk_create([
+        UserMedia(
+            profile=profile,
+            media=item,
+            status=rng.choice(STATUSES),
+            score=round(rng.uniform(0, 10), 1) if rng.random() < 0.8 else None,
+            progress=rng.randint(0, 200),
+        )
+        for item in media
+    ], batch_size=1000)
+    return profile
+
+
+def timed(fn, repeat=5):
+    """Runs `fn` `repeat` times and returns (best_seconds, last_result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    rank = min(max(math.ceil(fraction * len(sorted_values)), 1), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+# Pseudo-words built from syllables, so a large catalog has a realistic spread
+# of rare and common trigrams
+_ONSETS = 'b c d f g h j k l m n p r s t v w y z ch sh th st tr br kr gr pl'.split()
+_VOWELS = 'a e i o u ai ea ou io y'.split()
+_CODAS = ['', '', '', 'n', 'r', 's', 't', 'l', 'ng', 'ck']
+_ARTICLES = ['the', 'of', 'no']
+_SUFFIXES = ['and', 'in', 'season 2', 'part 2', 'the movie', 'zero']
+
+
+def synthetic_titles(count, seed=0):
+    rng = random.Random(seed)
+
+    def word():
+        return ''.join(
+            rng.choice(_ONSETS) + rng.choice(_VOWELS) + rng.choice(_CODAS)
+            for _ in range(rng.choice((1, 2, 2, 3, 3, 4)))
+        )
+
+    words = [word() for _ in range(max(count // 2, 100))]
+    titles = []
+    for _ in range(count):
+        parts = rng.choices(words, k=rng.randint(1, 4))
+        if rng.random() < 0.3:
+            parts.insert(0, rng.choice(_ARTICLES))
+        if rng.random() < 0.2:
+            parts.append(rng.choice(_SUFFIXES))
+        titles.append(' '.join(parts).title())
+    return titles
@@ -0,0 +1,51 @@
+import random
+import time
+
+from api.models import Media
+from api.title_index import TitleIndex
+
+from .synthetic import synthetic_titles
+
+
+def _misspell(rng, title):
+    position = rng.randrange(len(title))
+    return title[:position] + rng.choice('abcdefghijklmnopqrstuvwxyz') + title[position + 1:]
+
+
+def run(options):
+    size = options.get('size') or 100000
+    queries = (options.get('repeat') or 5) * 200
+    print(f'Trigram title index benchmark on {size} synthetic titles, {queries} misspelt lookups')
+    rng = random.Random(1)
+    titles = synthetic_titles(size)
+    media_types = [choice for choice, _label in Media.MEDIA_TYPE_CHOICES]
+
+    index = TitleIndex()
+    started = time.perf_counter()
+    index.load((pk, rng.choice(media_types), title, None) for pk, title in enumerate(titles, start=1))
+    build_seconds = time.perf_counter() - started
+    print(f'  build                        {build_seconds * 1000:9.1f} ms')
+
+    picked = [rng.randrange(size) for _ in range(queries)]
+    timings, found = [], 0
+    for position in picked:
+        query = _misspell(rng, titles[position])
+        started = time.perf_counter()
+        matches = index.search(query)
+        timings.append(time.perf_counter() - started)
+        found += any(title == titles[position] for _similarity, _media_id, title in matches)
+    timings.sort()
+
+    results = {
+        'size': size,
+        'build_seconds': build_seconds,
+        'lookup_p50_seconds': timings[len(timings) // 2],
+        'lookup_p90_seconds': timings[int(len(timings) * 0.9)],
+        'lookup_p99_seconds': timings[int(len(timings) * 0.99)],
+        # Misspelt title found among the matches
+        'recall': found / queries,
+    }
+    for name in ('p50', 'p90', 'p99'):
+        print(f'  lookup {name}                   {results[f"lookup_{name}_seconds"] * 1000:9.3f} ms')
+    print(f'  recall                       {results["recall"]:9.3f}')
+    return results
@@ -0,0 +1,106 @@
+"""
+Library-versioned response caching.
+
+Every profile has a `LibraryVersion` counter that is bumped whenever its
+library changes (see `api.signals`). Read endpoints that only depend on the
+library cache their payload under that version and send it as an `ETag`, so:
+
+- a request whose `If-None-Match` matches the current version gets a 304
+  without the payload being computed or even loaded from the cache;
+- otherwise the payload is served from the cache when the version is
+  unchanged, and only recomputed after a write.
+"""
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+from .models import LibraryVersion
+
+CACHE_TIMEOUT_SECONDS = 60 * 60
+
+_batch_state = threading.local()
+
+
+def get_library_version(profile_id):
+    version = LibraryVersion.objects.filter(profile_id=profile_id).values_list('version', flat=True).first()
+    return version or 0
+
+
+def _bump(profile_ids):
+    updated = LibraryVersion.objects.filter(profile_id__in=profile_ids).update(version=F('version') + 1)
+    if updated < len(profile_ids):
+        existing = set(LibraryVersion.objects.filter(profile_id__in=profile_ids).values_list('profile_id', flat=True))
+        LibraryVersion.objects.bulk_create(
+            [LibraryVersion(profile_id=pk, version=1) for pk in profile_ids if pk not in existing],
+            ignore_conflicts=True,
+        )
+
+
+def mark_library_changed(*profile_ids):
+    """
+    Bumps the library version of the given profiles. Inside a
+    `batched_library_changes()` block the bump is deferred to the end of the
+    block so bulk writes cost one update instead of one per row.
+    """
+    profile_ids = {pk for pk in profile_ids if pk is not None}
+    if not profile_ids:
+        return
+    pending = getattr(_batch_state, 'pending', None)
+    if pending is not None:
+        pending.update(profile_ids)
+        return
+    _bump(profile_ids)
+
+
+@contextmanager
+def batched_library_changes():
+    """Collects library version bumps (e.g. during a sync) and applies them once on exit."""
+    if getattr(_batch_state, 'pending', None) is not None:
+        # Nested block: the outermost one flushes
+        yield
+        return
+    _batch_state.pending = set()
+    try:
+        yield
+    finally:
+        pending, _batch_state.pending = _batch_state.pending, None
+        if pending:
+            _bump(pending)
+
+
+def _variant(request):
+    """Distinguishes cached payloads of the same endpoint by query string and accepted format."""
+    raw = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+
+def versioned_response(request, profile, namespace, compute):
+    """
+    Returns a `Response` for `compute()` cached under the profile's current
+    library version, honouring `If-None-Match`.
+    """
+    version = get_library_version(profile.pk)
+    variant = _variant(request)
+    etag = f'"{namespace}-{profile.pk}-{version}-{variant}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        candidates = parse_etags(if_none_match)
+        if etag in candidates or '*' in candidates:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cache_key = f'library:{profile.pk}:{namespace}:{variant}:{version}'
+    payload = cache.get(cache_key)
+    metrics.record_cache('library', hits=payload is not None, misses=payload is None)
+    if payload is None:
+        payload = compute()
+        cache.set(cache_key, payload, CACHE_TIMEOUT_SECONDS)
+    return Response(payload, headers=headers)
@@ -0,0 +1,104 @@
+"""
+Library change feed for clients that keep a local mirror of the library.
+
+Every UserMedia and CustomListEntry write stamps the row with a fresh value
+of the profile's `LibraryVersion` counter (`change_seq`), and every delete
+leaves a `LibraryTombstone` with one. `changes_since()` then returns only the
+rows and tombstones stamped after a client's last known sequence, so a
+refresh costs O(changes) instead of O(library).
+
+A sequence is allocated in the same transaction that writes its rows, so
+the `LibraryVersion` row lock serialises a profile's writers: once a
+version is committed, every row stamped at or below it is too. The same
+bump serves as the cache version (see `api.caching`).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import CustomListEntry, LibraryTombstone, LibraryVersion, UserMedia
+
+TOMBSTONE_RETENTION_DAYS = 30
+
+
+def allocate_change_seq(profile_id):
+    """
+    Bumps the profile's library version and returns the new value. Call it
+    inside the transaction that writes the stamped rows: the bump holds the
+    profile's `LibraryVersion` row lock until they are committed.
+    """
+    updated = LibraryVersion.objects.filter(profile_id=profile_id).update(version=F('version') + 1)
+    if not updated:
+        LibraryVersion.objects.get_or_create(profile_id=profile_id, defaults={'version': 1})
+    return LibraryVersion.objects.filter(profile_id=profile_id).values_list('version', flat=True).get()
+
+
+def record_tombstones(profile_id, kind, object_ids, seq=None):
+    """Records deletions of `object_ids` under `seq`, or a single new change sequence."""
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    with transaction.atomic():
+        if seq is None:
+            seq = allocate_change_seq(profile_id)
+        LibraryTombstone.objects.bulk_create([
+            LibraryTombstone(profile_id=profile_id, kind=kind, object_id=pk, change_seq=seq)
+            for pk in object_ids
+        ])
+
+
+def changes_since(profile, since):
+    """
+    Returns the changed UserMedia rows, changed CustomListEntry rows and
+    deleted ids stamped after `since`, plus the sequence the client should
+    send next time. `reset` is True when tombstones the client would need
+    have already been purged and it has to reload everything.
+    """
+    state = LibraryVersion.objects.filter(profile=profile).values('version', 'tombstone_floor').first()
+    if state is None:
+        state = {'version': 0, 'tombstone_floor': 0}
+    if since < state['tombstone_floor']:
+        return {'reset': True, 'seq': state['version']}
+
+    # Only rows up to the version read above: every one of them is committed,
+    # while a row stamped later may still be missing a lower-stamped neighbour
+    window = {'change_seq__gt': since, 'change_seq__lte': state['version']}
+    user_media = list(
+        UserMedia.objects.filter(profile=profile, **window).select_related('media').order_by('change_seq', 'id')
+    )
+    entries = list(
+        CustomListEntry.objects.filter(custom_list__user_id=profile.user_id, **window).order_by('change_seq', 'id')
+    )
+    tombstones = list(
+        LibraryTombstone.objects.filter(profile=profile, **window).values_list('kind', 'object_id', 'change_seq')
+    )
+
+    deleted = {LibraryTombstone.USER_MEDIA: [], LibraryTombstone.CUSTOM_LIST_ENTRY: []}
+    for kind, object_id, _seq in tombstones:
+        deleted[kind].append(object_id)
+
+    return {
+        'reset': False,
+        'seq': state['version'],
+        'user_media': user_media,
+        'custom_list_entries': entries,
+        'deleted': deleted,
+    }
+
+
+def purge_tombstones(older_than_days=TOMBSTONE_RETENTION_DAYS):
+    """
+    Deletes old tombstones and raises each affected profile's floor so
+    clients that missed them are told to reload. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    stale = LibraryTombstone.objects.filter(deleted_at__lt=cutoff)
+    floors = stale.values('profile_id').annotate(floor=Max('change_seq'))
+    for row in floors:
+        LibraryVersion.objects.filter(profile_id=row['profile_id'], tombstone_floor__lt=row['floor']).update(
+            tombstone_floor=row['floor']
+        )
+    deleted, _ = stale.delete()
+    return deleted
@@ -0,0 +1,102 @@
+"""
+Startup self-check for settings that slow the backend down.
+
+Registered under the `performance` tag, so it runs with every management
+command; `python manage.py check --tag performance` runs it alone and
+run_backend.py prints its warnings when the server starts.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PERFORMANCE = 'performance'
+
+LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(PERFORMANCE)
+def check_debug(app_configs, **kwargs):
+    if not settings.DEBUG:
+        return []
+    return [Warning(
+        "DEBUG is on: every SQL query is kept in memory and errors render full debug pages.",
+        hint="Set DJANGO_DEBUG=0 anywhere but on a development machine.",
+        id='api.W001',
+    )]
+
+
+@register(PERFORMANCE, Tags.database)
+def check_sqlite(app_configs, **kwargs):
+    warnings = []
+    for alias, database in settings.DATABASES.items():
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            continue
+        options = database.get('OPTIONS', {})
+        if 'journal_mode=wal' not in options.get('init_command', '').replace(' ', '').lower():
+            warnings.append(Warning(
+                f"SQLite database {alias!r} doesn't use WAL: every write blocks all reads.",
+                hint="Add 'PRAGMA journal_mode=WAL' to OPTIONS['init_command'].",
+                id='api.W002',
+            ))
+        if options.get('timeout', 5) < 5:
+            warnings.append(Warning(
+                f"SQLite database {alias!r} waits less than 5 s for locks, so busy moments fail with "
+                f"'database is locked'.",
+                hint="Raise OPTIONS['timeout'].",
+                id='api.W003',
+            ))
+    return warnings
+
+
+@register(PERFORMANCE, Tags.caches)
+def check_caches(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend == 'django.core.cache.backends.dummy.DummyCache':
+        return [Warning(
+            "The default cache is a DummyCache: every cached response is recomputed.",
+            id='api.W004',
+        )]
+    if getattr(settings, 'PROFILE', None) == 'server' and backend in LOCAL_CACHE_BACKENDS:
+        return [Warning(
+            "The default cache is local to each worker process, so workers recompute each other's payloads.",
+            hint="Use api.cache_backends.TieredCache in front of a shared cache.",
+            id='api.W005',
+        )]
+    return []
+
+
+@register(PERFORMANCE)
+def check_rest_framework(app_configs, **kwargs):
+    warnings = []
+    rest_framework = getattr(settings, 'REST_FRAMEWORK', {})
+    # Under `manage.py test` DEBUG is off while the profile's DEBUG renderers stay
+    if not settings.DEBUG and not getattr(settings, 'TESTING', False) and any(
+        renderer.endswith('BrowsableAPIRenderer') for renderer in rest_framework.get('DEFAULT_RENDERER_CLASSES', [])
+    ):
+        warnings.append(Warning(
+            "The browsable API renderer is enabled with DEBUG off: browsers get HTML pages that "
+            "take far longer to render than JSON.",
+            hint="Leave it to the DEBUG profiles.",
+            id='api.W006',
+        ))
+    if any(
+        auth.endswith('BasicAuthentication') for auth in rest_framework.get('DEFAULT_AUTHENTICATION_CLASSES', [])
+    ):
+        warnings.append(Warning(
+            "Basic authentication hashes a password on every request that sends credentials.",
+            id='api.W007',
+        ))
+    return warnings
+
+
+@register(PERFORMANCE)
+def check_server_concurrency(app_configs, **kwargs):
+    if getattr(settings, 'PROFILE', None) != 'server' or getattr(settings, 'ASGI_THREADS', 0):
+        return []
+    return [Warning(
+        "ASGI_THREADS is 0: a worker runs any number of requests at once, each on its own thread.",
+        hint="Set ASGI_THREADS to the number of requests a worker should run at a time.",
+        id='api.W008',
+    )]
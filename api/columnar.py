@@ -0,0 +1,128 @@
+"""
+Compact columnar layout for library payloads, requested with `?layout=columnar`.
+
+The regular responses repeat every key and the full nested `media` object for
+each item. The columnar layout sends one array per field instead, replaces
+`status` and `media_type` strings with indexes into `enums`, and sends each
+Media (and, for custom lists, each UserMedia) once, referenced by row index:
+
+    {
+      "layout": "columnar",
+      "enums": {"status": [...], "media_type": [...]},
+      "media": {"id": [...], "primary_title": [...], "media_type": [0, 3, ...], ...},
+      "user_media": {"id": [...], "media": [0, 1, ...], "status": [2, 0, ...], ...}
+    }
+
+Custom list payloads add `custom_lists` and `entries` tables. With
+`?fields=` only the selected fields get columns. The encoders
+take the regular serialized data, so both layouts always carry the same
+information; `decodeColumnar*` in my-anime-app/src/api.ts turn them back
+into the regular shape.
+"""
+from .models import Media, UserMedia
+
+LAYOUT = 'columnar'
+
+ENUMS = {
+    'status': [choice for choice, _label in UserMedia.STATUS_CHOICES],
+    'media_type': [choice for choice, _label in Media.MEDIA_TYPE_CHOICES],
+}
+_ENUM_INDEX = {name: {value: i for i, value in enumerate(values)} for name, values in ENUMS.items()}
+
+
+def columnar_requested(request):
+    return request.query_params.get('layout') == LAYOUT
+
+
+class _Table:
+    """Column arrays for one record type, holding each id at most once."""
+
+    def __init__(self):
+        self.columns = {}
+        self.positions = {}
+        self.length = 0
+
+    def add(self, row):
+        """
+        Appends `row` unless a record with its id is already present; returns
+        its row index. Rows without an id (left out by `?fields=`) are always
+        appended.
+        """
+        key = row.get('id')
+        if key is not None and key in self.positions:
+            return self.positions[key]
+        position = self.length
+        self.length += 1
+        if key is not None:
+            self.positions[key] = position
+        if not self.columns:
+            self.columns = {name: [] for name in row}
+        for name, column in self.columns.items():
+            column.append(row.get(name))
+        return position
+
+
+class _Encoder:
+    def __init__(self):
+        self.media = _Table()
+        self.user_media = _Table()
+
+    def add_user_media(self, item):
+        """Adds a serialized UserMedia; only the fields it carries (see api/fieldsets.py) become columns."""
+        row = dict(item)
+        if 'status' in row:
+            row['status'] = _ENUM_INDEX['status'].get(row['status'])
+        if 'media' in row:
+            media = dict(row['media'])
+            if 'media_type' in media:
+                media['media_type'] = _ENUM_INDEX['media_type'].get(media['media_type'])
+            row['media'] = self.media.add(media)
+        return self.user_media.add(row)
+
+    def add_entry(self, entry, **extra):
+        """An entry row for `entry`, with `user_media` replaced by its row index."""
+        row = dict(entry, **extra)
+        if 'user_media' in row:
+            row['user_media'] = self.add_user_media(row['user_media'])
+        return row
+
+    def payload(self, **tables):
+        return {
+            'layout': LAYOUT,
+            'enums': ENUMS,
+            'media': self.media.columns,
+            'user_media': self.user_media.columns,
+            **{name: table.columns for name, table in tables.items()},
+        }
+
+
+def encode_user_media(items):
+    """Encodes `UserMediaSerializer(many=True)` data."""
+    encoder = _Encoder()
+    for item in items:
+        encoder.add_user_media(item)
+    return encoder.payload()
+
+
+def encode_entries(entries):
+    """Encodes `CustomListEntrySerializer(many=True)` data; `entries.user_media` holds row indexes."""
+    encoder = _Encoder()
+    table = _Table()
+    for entry in entries:
+        table.add(encoder.add_entry(entry))
+    return encoder.payload(entries=table)
+
+
+def encode_custom_lists(custom_lists):
+    """
+    Encodes `CustomListSerializer` (or `CustomListSummarySerializer`) data.
+    Entries are flattened into one `entries` table whose `custom_list`
+    column holds row indexes into `custom_lists`.
+    """
+    encoder = _Encoder()
+    lists, entries = _Table(), _Table()
+    for custom_list in custom_lists:
+        position = lists.add({name: value for name, value in custom_list.items() if name != 'entries'})
+        for entry in custom_list.get('entries', ()):
+            entries.add(encoder.add_entry(entry, custom_list=position))
+    return encoder.payload(custom_lists=lists, entries=entries)
@@ -1,17 +1,92 @@
+from django.db.models import Count, Prefetch
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from .models import CustomList, CustomListEntry
-from .serializers import CustomListSerializer, CustomListEntrySerializer
+from .serializers import CustomListSerializer, CustomListEntrySerializer, CustomListSummarySerializer
 from .models import UserMedia
+from api.batch import BatchValidationError, apply_custom_list_entry_batch
 from api.authentication import ExpiringTokenAuthentication
+from api.caching import versioned_response
+from api.columnar import columnar_requested, encode_custom_lists, encode_entries
+from api.fieldsets import restrict_queryset
+
+
+def _entries_with_media():
+    # Loads each entry's UserMedia and Media in the same query as the entry
+    return CustomListEntry.objects.select_related('user_media__media').order_by('id')
+
+
+class CustomListEntryPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 200
+
 
 class CustomListViewSet(viewsets.ModelViewSet):
     serializer_class = CustomListSerializer
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [ExpiringTokenAuthentication]
+    query_budget = 6
+
+    def _summary_requested(self):
+        return self.request.query_params.get('summary', '').lower() in ('1', 'true', 'yes')
 
     def get_queryset(self): #type: ignore
-        return CustomList.objects.filter(user=self.request.user)
+        queryset = CustomList.objects.filter(user=self.request.user).order_by('id')
+        if self.action == 'list' and self._summary_requested():
+            return queryset.annotate(entry_count=Count('entries'))
+        if self.action not in ('list', 'retrieve'):
+            return queryset.prefetch_related(Prefetch('entries', queryset=_entries_with_media()))
+
+        # Load only what the requested `?fields=` will output
+        serializer = self.get_serializer()
+        entries_field = serializer.fields.get('entries')
+        if entries_field is None:
+            return restrict_queryset(queryset, serializer)
+        entries = restrict_queryset(_entries_with_media(), entries_field, extra=['custom_list'])
+        return restrict_queryset(queryset, serializer).prefetch_related(Prefetch('entries', queryset=entries))
+
+    def get_serializer_class(self): #type: ignore
+        if self.action == 'list' and self._summary_requested():
+            return CustomListSummarySerializer
+        return CustomListSerializer
+
+    def list(self, request, *args, **kwargs):
+        parent_list = super().list
+
+        def compute():
+            data = parent_list(request, *args, **kwargs).data
+            return encode_custom_lists(data) if columnar_requested(request) else data
+
+        return versioned_response(request, request.user.profile, 'custom-lists', compute)
+
+    def retrieve(self, request, *args, **kwargs):
+        parent_retrieve = super().retrieve
+
+        def compute():
+            data = parent_retrieve(request, *args, **kwargs).data
+            return encode_custom_lists([data]) if columnar_requested(request) else data
+
+        return versioned_response(request, request.user.profile, 'custom-list', compute)
+
+    @action(detail=True, methods=['get'])
+    def entries(self, request, pk=None):
+        """One page of a list's entries (`?limit=` / `?offset=`, `?layout=columnar`)."""
+        custom_list = get_object_or_404(CustomList, pk=pk, user=request.user)
+
+        def compute():
+            paginator = CustomListEntryPagination()
+            serializer = CustomListEntrySerializer(many=True, context={'request': request})
+            queryset = restrict_queryset(_entries_with_media().filter(custom_list=custom_list), serializer)
+            serializer.instance = paginator.paginate_queryset(queryset, request, view=self)
+            data = serializer.data
+            if columnar_requested(request):
+                data = encode_entries(data)
+            return paginator.get_paginated_response(data).data
+
+        return versioned_response(request, request.user.profile, 'custom-list-entries', compute)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -20,9 +95,14 @@ class CustomListEntryViewSet(viewsets.ModelViewSet):
     serializer_class = CustomListEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [ExpiringTokenAuthentication]
+    # Covers `batch/`, which runs a fixed number of queries per request
+    query_budget = 20
 
     def get_queryset(self): #type: ignore
-        return CustomListEntry.objects.filter(custom_list__user=self.request.user)
+        queryset = _entries_with_media().filter(custom_list__user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            return restrict_queryset(queryset, self.get_serializer())
+        return queryset
 
     def perform_create(self, serializer):
         custom_list_id = self.request.data.get('custom_list') #type: ignore
@@ -30,3 +110,12 @@ class CustomListEntryViewSet(viewsets.ModelViewSet):
         custom_list = CustomList.objects.get(id=custom_list_id, user=self.request.user)
         user_media = UserMedia.objects.get(id=user_media_id, profile__user=self.request.user)
         serializer.save(custom_list=custom_list, user_media=user_media)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Adds and removes many entries at once: `{"add": [{custom_list, user_media}], "delete": [entry ids]}`."""
+        try:
+            results = apply_custom_list_entry_batch(request.user.profile, request.data)
+        except BatchValidationError as e:
+            return Response({"errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": results})
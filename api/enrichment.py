@@ -0,0 +1,329 @@
+"""
+Fills in Media descriptions and lengths from the provider each row came from.
+
+Searches and syncs only store titles and covers. `enrich()` looks up what is
+missing, querying providers concurrently while keeping each one under its
+rate limit, and writes the results back with a single bulk update. AniList
+rows are fetched 50 per request, as are MyAnimeList rows (from AniList, by
+their MyAnimeList id); the other providers one item per request.
+
+Rows still missing details form the enrichment queue (`pending_media()`).
+A background worker started by run_backend.py (`start_worker()`) drains it
+in batches, woken up whenever new Media rows are created, so syncs never
+wait on it. `python manage.py enrich_media` drains it by hand.
+"""
+import concurrent.futures
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics, stats
+from .library import media_changed
+from .models import Media
+from .services import anilist_service, google_books_service, rawg_service, steam_service, tmdb_service
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 8
+DEFAULT_TIMEOUT_SECONDS = 10
+ANILIST_BATCH_SIZE = 50
+# Items a provider had nothing for are looked up again after this long
+RETRY_AFTER_DAYS = 30
+
+QUEUE_BATCH_SIZE = 200
+# The worker isn't answering a request, so it can wait for slow, rate-limited providers
+WORKER_TIMEOUT_SECONDS = 5 * 60
+
+# Requests started per second, per provider, across all threads
+RATE_LIMITS = {
+    'ANILIST': 1.0,
+    'TMDB': 20.0,
+    'STEAM': 1.0,
+    'RAWG': 5.0,
+    'GOOGLE': 5.0,
+}
+
+
+class RateLimiter:
+    """Spaces out calls so that at most `rate` start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+_limiters = {provider: RateLimiter(rate) for provider, rate in RATE_LIMITS.items()}
+# MyAnimeList rows are looked up on AniList
+_limiters['MAL'] = _limiters['ANILIST']
+
+
+def needs_enrichment(media_type, description, length):
+    return not description or (length is None and media_type in stats.LENGTH_AWARE_TYPES)
+
+
+def _has_provider():
+    return (
+        Q(anilist_id__isnull=False) | Q(mal_id__isnull=False) | Q(tmdb_id__isnull=False) | Q(steam_appid__isnull=False)
+        | Q(rawg_id__isnull=False) | Q(google_book_id__isnull=False)
+    )
+
+
+def pending_media():
+    """The enrichment queue: rows missing details that haven't been looked up recently."""
+    missing = (
+        Q(description__isnull=True) | Q(description='')
+        | Q(length__isnull=True, media_type__in=stats.LENGTH_AWARE_TYPES)
+    )
+    due = Q(enriched_at__isnull=True) | Q(enriched_at__lt=timezone.now() - timedelta(days=RETRY_AFTER_DAYS))
+    return Media.objects.filter(missing, due, _has_provider())
+
+
+def _provider_key(media):
+    """(provider, lookup key) for the provider that owns `media`, or None."""
+    if media.anilist_id is not None:
+        return 'ANILIST', media.anilist_id
+    if media.mal_id is not None:
+        return 'MAL', (media.mal_id, media.media_type)
+    if media.tmdb_id is not None:
+        return 'TMDB', (media.tmdb_id, media.media_type)
+    if media.steam_appid is not None:
+        return 'STEAM', media.steam_appid
+    if media.rawg_id is not None:
+        return 'RAWG', media.rawg_id
+    if media.google_book_id:
+        return 'GOOGLE', media.google_book_id
+    return None
+
+
+# Fetchers return {lookup key: {'description': ..., 'length': ...}}; AniList
+# also reports the MyAnimeList id, used to link rows in api.identity
+
+def _fetch_anilist(ids):
+    return {
+        item['id']: {'description': item.get('description'), 'length': item.get('duration'), 'mal_id': item.get('idMal')}
+        for item in anilist_service.get_media_by_ids(ids)
+    }
+
+
+def _fetch_mal(keys):
+    """`keys`: `(MyAnimeList id, media type)` pairs, all of one media type."""
+    media_type = keys[0][1]
+    return {
+        (item['idMal'], media_type): {'description': item.get('description'), 'length': item.get('duration')}
+        for item in anilist_service.get_media_by_mal_ids([mal_id for mal_id, _media_type in keys], media_type)
+    }
+
+
+def _fetch_tmdb(key):
+    tmdb_id, media_type = key
+    data = tmdb_service.get_details(tmdb_id, media_type)
+    if media_type == Media.MOVIE:
+        length = data.get('runtime')
+    else:
+        runtimes = data.get('episode_run_time') or []
+        length = round(sum(runtimes) / len(runtimes)) if runtimes else None
+    return {key: {'description': data.get('overview'), 'length': length or None}}
+
+
+def _fetch_steam(appid):
+    data = steam_service.get_app_details(appid) or {}
+    return {appid: {'description': data.get('short_description'), 'length': None}}
+
+
+def _fetch_rawg(game_id):
+    data = rawg_service.get_game_details(game_id) or {}
+    return {game_id: {'description': data.get('description_raw'), 'length': None}}
+
+
+def _fetch_google(volume_id):
+    info = (google_books_service.get_volume(volume_id) or {}).get('volumeInfo', {})
+    return {volume_id: {'description': info.get('description'), 'length': info.get('pageCount')}}
+
+
+FETCHERS = {
+    'TMDB': _fetch_tmdb,
+    'STEAM': _fetch_steam,
+    'RAWG': _fetch_rawg,
+    'GOOGLE': _fetch_google,
+}
+
+
+def _rate_limited(provider, fetch, arg):
+    _limiters[provider].wait()
+    return fetch(arg)
+
+
+def fetch_details(media_list, timeout=DEFAULT_TIMEOUT_SECONDS):
+    """
+    Looks up details for `media_list` and returns `(details, looked_up)`:
+    `{media.pk: details}` and the pks whose lookup completed, found or not.
+    Provider errors are logged and skipped; lookups still running after
+    `timeout` seconds are abandoned.
+    """
+    by_key = {}
+    for media in media_list:
+        provider_key = _provider_key(media)
+        if provider_key is not None:
+            by_key.setdefault(provider_key, []).append(media.pk)
+    if not by_key:
+        return {}, set()
+
+    tasks = []
+    anilist_ids = [key for provider, key in by_key if provider == 'ANILIST']
+    for start in range(0, len(anilist_ids), ANILIST_BATCH_SIZE):
+        chunk = anilist_ids[start:start + ANILIST_BATCH_SIZE]
+        tasks.append(('ANILIST', _fetch_anilist, chunk, chunk))
+    for media_type in (Media.ANIME, Media.MANGA):
+        mal_keys = [key for provider, key in by_key if provider == 'MAL' and key[1] == media_type]
+        for start in range(0, len(mal_keys), ANILIST_BATCH_SIZE):
+            chunk = mal_keys[start:start + ANILIST_BATCH_SIZE]
+            tasks.append(('MAL', _fetch_mal, chunk, chunk))
+    tasks += [
+        (provider, FETCHERS[provider], key, [key]) for provider, key in by_key if provider not in ('ANILIST', 'MAL')
+    ]
+
+    details, looked_up = {}, set()
+    executor = metrics.track_pool(
+        'enrichment', concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(tasks)))
+    )
+    try:
+        futures = {executor.submit(_rate_limited, provider, fetch, arg): (provider, keys)
+                   for provider, fetch, arg, keys in tasks}
+        done, _ = concurrent.futures.wait(futures, timeout=timeout)
+        for future in done:
+            provider, keys = futures[future]
+            try:
+                found = future.result()
+            except Exception as e:
+                logger.warning("%s details lookup failed: %s", provider, e)
+                continue
+            for key in keys:
+                pks = by_key[(provider, key)]
+                looked_up.update(pks)
+                if key in found:
+                    details.update((pk, found[key]) for pk in pks)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return details, looked_up
+
+
+def apply_details(media_list, details, looked_up=()):
+    """
+    Copies fetched details onto the rows that lack them and saves the
+    changed ones in one bulk update; rows in `looked_up` are marked as done
+    so they leave the queue. Returns the changed rows.
+    """
+    now = timezone.now()
+    changed, lengths_changed = [], []
+    for media in media_list:
+        if media.pk in looked_up:
+            media.enriched_at = now
+        item = details.get(media.pk)
+        if not item:
+            continue
+        updated = False
+        if not media.description and item.get('description'):
+            media.description = item['description']
+            updated = True
+        if media.length is None and item.get('length'):
+            media.length = item['length']
+            lengths_changed.append(media.pk)
+            updated = True
+        if updated:
+            # bulk_update() skips VersionField.pre_save()
+            media.version += 1
+            changed.append(media)
+
+    if looked_up:
+        Media.objects.filter(pk__in=looked_up).update(enriched_at=now)
+    if changed:
+        Media.objects.bulk_update(changed, ['description', 'length', 'version'])
+        media_changed([media.pk for media in changed])
+    if lengths_changed:
+        # Lengths feed the time-spent numbers of everyone who has these items
+        stats.rebuild_owner_stats(lengths_changed)
+    return changed
+
+
+def enrich(media_list, timeout=DEFAULT_TIMEOUT_SECONDS):
+    """
+    Fills in missing descriptions and lengths of `media_list` in place.
+    Rows looked up within the last `RETRY_AFTER_DAYS` are skipped.
+    """
+    retry_before = timezone.now() - timedelta(days=RETRY_AFTER_DAYS)
+    candidates = [
+        media for media in media_list
+        if needs_enrichment(media.media_type, media.description, media.length)
+        and (media.enriched_at is None or media.enriched_at < retry_before)
+    ]
+    if not candidates:
+        return []
+    details, looked_up = fetch_details(candidates, timeout)
+    return apply_details(candidates, details, looked_up)
+
+
+def process_queue(batch_size=QUEUE_BATCH_SIZE, timeout=WORKER_TIMEOUT_SECONDS):
+    """Enriches every queued row, a batch at a time. Returns the number of rows updated."""
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(pending_media().filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+        updated += len(enrich(batch, timeout))
+
+
+# ------------------------------------------------------------------------------
+# Background worker
+# ------------------------------------------------------------------------------
+
+_wakeup = threading.Event()
+_worker_thread = None
+
+
+def notify():
+    """Tells the worker there may be new rows to enrich."""
+    _wakeup.set()
+
+
+def start_worker(interval_seconds=None):
+    """Starts the background enrichment thread (once per process)."""
+    global _worker_thread
+    interval = interval_seconds or getattr(settings, 'ENRICHMENT_INTERVAL_SECONDS', 5 * 60)
+    if _worker_thread is not None or not interval:
+        return _worker_thread
+
+    def loop():
+        while True:
+            # Let a sync finish creating its rows before picking them up
+            _wakeup.wait(interval)
+            time.sleep(1)
+            _wakeup.clear()
+            try:
+                updated = process_queue()
+                if updated:
+                    logger.info("Enriched %d media rows", updated)
+            except Exception:
+                logger.exception("Media enrichment failed")
+            finally:
+                connection.close()
+
+    _worker_thread = threading.Thread(target=loop, name='media-enrichment', daemon=True)
+    _worker_thread.start()
+    return _worker_thread
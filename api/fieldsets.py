@@ -0,0 +1,136 @@
+"""
+Sparse fieldsets for list endpoints: `?fields=` and `?expand=`.
+
+`fields` is a comma separated list of field names, with dotted paths for
+nested serializers (`fields=id,status,media.primary_title,media.cover_image_url`).
+A nested name on its own (`fields=id,media`) keeps that serializer's default
+fields. Fields a serializer lists in `Meta.expandable_fields` (such as the
+media `description`) are left out of every sparse response unless they are
+named in `fields` or in `expand` (`expand=media.description`). Without either
+parameter the full representation is returned as before.
+
+`restrict_queryset()` turns the selected fields into `.only()` paths so the
+columns that are not sent are not read from the database either.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+
+
+class InvalidFieldset(ParseError):
+    default_detail = "Invalid fields or expand parameter."
+
+
+def parse_paths(value):
+    """Parses `a,b.c,b.d` into `{'a': {}, 'b': {'c': {}, 'd': {}}}`."""
+    tree = {}
+    for path in value.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        node = tree
+        for name in path.split('.'):
+            if not name:
+                raise InvalidFieldset(f"Invalid field path: {path!r}.")
+            node = node.setdefault(name, {})
+    return tree
+
+
+class Fieldset:
+    """The part of a request's `fields`/`expand` selection that applies to one serializer."""
+
+    def __init__(self, selected=None, expanded=None, path=''):
+        self.selected = selected  # None keeps the default fields
+        self.expanded = expanded or {}
+        self.path = path
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        selected = parse_paths(params['fields']) if 'fields' in params else None
+        return cls(selected or None, parse_paths(params.get('expand', '')))
+
+    def _check(self, names, available):
+        unknown = sorted(set(names) - set(available))
+        if unknown:
+            raise InvalidFieldset(f"Unknown field: {self.path}{unknown[0]}.")
+
+    def apply(self, serializer, fields):
+        """Prunes `fields` (a serializer's field dict) and passes the selection on to nested serializers."""
+        self._check(self.expanded, fields)
+        if self.selected is not None:
+            self._check(self.selected, fields)
+            keep = set(self.selected)
+        else:
+            keep = set(fields) - set(getattr(serializer.Meta, 'expandable_fields', ()))
+        keep |= set(self.expanded)
+
+        for name in list(fields):
+            if name not in keep:
+                del fields[name]
+        for name, field in fields.items():
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if hasattr(nested, 'assign_fieldset'):
+                nested.assign_fieldset(Fieldset(
+                    (self.selected or {}).get(name) or None,
+                    self.expanded.get(name),
+                    f'{self.path}{name}.',
+                ))
+            elif self.selected and self.selected.get(name) or self.expanded.get(name):
+                raise InvalidFieldset(f"{self.path}{name} has no sub-fields.")
+        return fields
+
+
+def only_paths(serializer, prefix=''):
+    """
+    Returns `(columns, relations)`: the model field paths `serializer`
+    reads, for `.only()`, and the forward relations it nests, for
+    `.select_related()`. Returns None when a field isn't backed by a
+    concrete column and the rows can't safely be trimmed. Reverse relations
+    are skipped; they are loaded by their own (prefetch) querysets.
+    """
+    model = serializer.Meta.model
+    columns, relations = [prefix + model._meta.pk.name], []
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.ListSerializer):
+            continue
+        if not field.source_attrs or len(field.source_attrs) > 1:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            return None
+        if model_field.one_to_many or model_field.many_to_many:
+            continue
+        columns.append(prefix + model_field.name)
+        if isinstance(field, serializers.BaseSerializer):
+            nested = only_paths(field, f'{prefix}{model_field.name}__')
+            if nested is None:
+                return None
+            relations.append(prefix + model_field.name)
+            columns += nested[0]
+            relations += nested[1]
+    return columns, relations
+
+
+def restrict_queryset(queryset, serializer, extra=()):
+    """
+    Limits the columns (and joins) `queryset` loads to those `serializer`
+    will output, when the request asked for a sparse fieldset. `extra` names
+    columns that are needed anyway, such as the foreign key a prefetch joins on.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if getattr(serializer, 'fieldset', None) is None:
+        return queryset
+    paths = only_paths(serializer)
+    if paths is None:
+        return queryset
+    columns, relations = paths
+    # Relations that are no longer output can't stay in select_related() once deferred
+    queryset = queryset.select_related(None)
+    if relations:
+        queryset = queryset.select_related(*relations)
+    return queryset.only(*columns, *extra)
@@ -0,0 +1,319 @@
+"""
+Cross-provider identity resolution for Media rows.
+
+The same title can reach us from several providers: an anime synced from
+AniList and again from MyAnimeList used to end up as two Media rows, one with
+only `anilist_id` and one with only `mal_id`. `MediaIdentity` indexes every
+row under each provider id it is known by, including cross ids such as the
+MyAnimeList id AniList reports, and `upsert_media()` resolves a whole batch of
+incoming provider records against that index in one query, reusing existing
+rows instead of creating duplicates.
+
+Rows that were duplicated before they could be linked are folded together by
+`merge_media()`, which moves library rows and custom list entries onto the
+surviving row. `python manage.py merge_duplicate_media` runs it over the
+whole table.
+"""
+import logging
+
+from django.db import transaction
+
+from . import enrichment, title_index
+from .library import bulk_library_write, media_changed
+from .models import CustomListEntry, Media, MediaIdentity, Profile, UserMedia
+
+logger = logging.getLogger(__name__)
+
+# provider -> Media column holding its id. A row's titles and cover belong to
+# the first provider in this order it has an id from (its home provider).
+ID_FIELDS = {
+    'ANILIST': 'anilist_id',
+    'MAL': 'mal_id',
+    'TMDB': 'tmdb_id',
+    'RAWG': 'rawg_id',
+    'STEAM': 'steam_appid',
+    'GOOGLE': 'google_book_id',
+}
+# Ids only unique per media type: MyAnimeList numbers anime and manga
+# separately, TMDB movies and TV shows, Google Books volumes per type
+TYPED_PROVIDERS = {'MAL', 'TMDB', 'GOOGLE'}
+
+DETAIL_FIELDS = ['primary_title', 'secondary_title', 'cover_image_url', 'description']
+
+# Keeps `key__in` lookups well under SQLite's bound parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+def identity_key(provider, external_id, media_type=None):
+    if provider in TYPED_PROVIDERS:
+        return f'{provider}:{media_type}:{external_id}'
+    return f'{provider}:{external_id}'
+
+
+def _has_value(value):
+    return value is not None and value != ''
+
+
+def media_keys(media):
+    """Keys for the provider ids stored in `media`'s own columns."""
+    return [
+        identity_key(provider, getattr(media, field), media.media_type)
+        for provider, field in ID_FIELDS.items() if _has_value(getattr(media, field))
+    ]
+
+
+def home_provider(media):
+    return next((provider for provider, field in ID_FIELDS.items() if _has_value(getattr(media, field))), None)
+
+
+def resolve(keys):
+    """Returns `{key: media_id}` for those of `keys` that are indexed."""
+    keys = list(set(keys))
+    found = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        found.update(
+            MediaIdentity.objects.filter(key__in=keys[start:start + LOOKUP_CHUNK_SIZE]).values_list('key', 'media_id')
+        )
+    return found
+
+
+def record(pairs):
+    """Indexes `(key, media_id)` pairs. Keys that already belong to a row keep it."""
+    MediaIdentity.objects.bulk_create(
+        [MediaIdentity(key=key, media_id=media_id) for key, media_id in pairs],
+        batch_size=LOOKUP_CHUNK_SIZE, ignore_conflicts=True,
+    )
+
+
+def index_media(media_list):
+    """Indexes rows under the ids in their own columns."""
+    record((key, media.pk) for media in media_list for key in media_keys(media))
+
+
+# ------------------------------------------------------------------------------
+# Resolving provider records
+# ------------------------------------------------------------------------------
+
+def _record_keys(item):
+    return [
+        identity_key(provider, external_id, item['media_type'])
+        for provider, external_id in item['ids'].items() if _has_value(external_id)
+    ]
+
+
+def _merge_linked(keyed):
+    """Merges rows that one record's ids resolve to more than one of. Returns the fresh index lookup."""
+    all_keys = [key for keys in keyed for key in keys]
+    found = resolve(all_keys)
+    groups = []
+    for keys in keyed:
+        media_ids = list(dict.fromkeys(found[key] for key in keys if key in found))
+        if len(media_ids) > 1:
+            groups.append(media_ids)
+    if not groups:
+        return found
+    for media_ids in groups:
+        rows = Media.objects.in_bulk(media_ids)
+        if media_ids[0] in rows:
+            merge_media(rows[media_ids[0]], [rows[pk] for pk in media_ids[1:] if pk in rows])
+    return resolve(all_keys)
+
+
+def _apply_record(media, item, by_key, overwrite):
+    """Copies a record's ids and details onto an existing row; returns the names of the changed fields."""
+    changed = set()
+    for provider, external_id in item['ids'].items():
+        field = ID_FIELDS[provider]
+        key = identity_key(provider, external_id, item['media_type'])
+        # Only take ids no other row is known by
+        if _has_value(external_id) and getattr(media, field) is None and by_key.get(key) is media:
+            setattr(media, field, external_id)
+            changed.add(field)
+    for field in DETAIL_FIELDS:
+        if field not in item:
+            continue
+        value, current = item[field], getattr(media, field)
+        # Fields a provider leaves out never erase what another one filled in
+        if _has_value(value) and value != current and (overwrite or not current):
+            setattr(media, field, value)
+            changed.add(field)
+    return changed
+
+
+def upsert_media(items):
+    """
+    Finds or creates the Media row for each provider record in `items` and
+    returns the rows in the same order. A record holds Media field values
+    and `ids`, `{provider: external id}`, with the provider it came from
+    first followed by any cross ids it reported:
+
+        {'ids': {'ANILIST': 21, 'MAL': 21}, 'media_type': 'ANIME', 'primary_title': 'One Piece', ...}
+
+    Existing rows pick up the ids they were missing. They take the record's
+    details when it comes from their home provider; other providers only
+    fill in empty fields, so two providers don't
+    keep renaming a shared row. Rows that turn out to be the same title are
+    merged. Everything is resolved and written with a handful of queries,
+    whatever the number of records.
+    """
+    keyed = [_record_keys(item) for item in items]
+    found = _merge_linked(keyed)
+    existing = Media.objects.in_bulk(set(found.values()))
+    by_key = {key: existing[media_id] for key, media_id in found.items() if media_id in existing}
+    homes = {media.pk: home_provider(media) for media in existing.values()}
+
+    rows, created, changed = [], [], {}
+    for item, keys in zip(items, keyed):
+        media = next((by_key[key] for key in keys if key in by_key), None)
+        source = next(iter(item['ids']))
+        if media is None:
+            media = Media(
+                media_type=item['media_type'],
+                **{field: item[field] for field in DETAIL_FIELDS if field in item},
+                **{ID_FIELDS[p]: external_id for p, external_id in item['ids'].items() if _has_value(external_id)},
+            )
+            created.append(media)
+        for key in keys:
+            by_key.setdefault(key, media)
+        if media.pk is not None:
+            fields = _apply_record(media, item, by_key, overwrite=homes[media.pk] == source)
+            if fields:
+                changed.setdefault(media.pk, (media, set()))[1].update(fields)
+        rows.append(media)
+
+    if created:
+        Media.objects.bulk_create(created)
+        # bulk_create() sends no post_save
+        enrichment.notify()
+        title_index.update(created)
+    if changed:
+        # bulk_update() skips VersionField.pre_save()
+        for media, _fields in changed.values():
+            media.version += 1
+        fields = sorted(set().union(*(fields for _media, fields in changed.values())))
+        Media.objects.bulk_update([media for media, _fields in changed.values()], [*fields, 'version'])
+        media_changed(list(changed))
+        renamed = [media for media, fields in changed.values() if fields & {'primary_title', 'secondary_title'}]
+        title_index.update(renamed)
+    record((key, media.pk) for key, media in by_key.items() if key not in found)
+    return rows
+
+
+# ------------------------------------------------------------------------------
+# Merging duplicates
+# ------------------------------------------------------------------------------
+
+def _merge_library_rows(profile, owned, target):
+    """
+    Leaves one UserMedia row of `profile` for the title, pointing at
+    `target`: the most recently changed one. The others' custom list
+    entries move onto it (unless it is in that list already) and they are
+    deleted.
+    """
+    keep, others = owned[0], owned[1:]
+    if keep.media_id == target.pk and not others:
+        return
+    with bulk_library_write(profile) as batch:
+        if others:
+            other_ids = [row.pk for row in others]
+            entries = CustomListEntry.objects.filter(user_media_id__in=[keep.pk, *other_ids]).order_by('pk')
+            lists = {entry.custom_list_id for entry in entries if entry.user_media_id == keep.pk}
+            moved = []
+            for entry in entries:
+                if entry.user_media_id != keep.pk and entry.custom_list_id not in lists:
+                    lists.add(entry.custom_list_id)
+                    moved.append(entry.pk)
+            CustomListEntry.objects.filter(pk__in=moved).update(user_media_id=keep.pk, change_seq=batch.seq)
+            # Deletes the entries that weren't moved along with the rows
+            batch.delete_user_media(other_ids)
+        UserMedia.objects.filter(pk=keep.pk).update(media_id=target.pk, change_seq=batch.seq)
+        batch.changed = True
+
+
+def merge_media(target, duplicates):
+    """
+    Folds the `duplicates` Media rows into `target`. Library rows and custom
+    list entries are moved over; when a profile has the title under more
+    than one row, its most recently changed row is kept. `target` takes the
+    ids and details it was missing and is indexed under the duplicates' keys.
+    """
+    duplicates = [media for media in duplicates if media.pk != target.pk]
+    if not duplicates:
+        return target
+    duplicate_ids = [media.pk for media in duplicates]
+
+    with transaction.atomic():
+        owned = {}
+        rows = UserMedia.objects.filter(media_id__in=[target.pk, *duplicate_ids]).order_by('-change_seq', '-pk')
+        for row in rows:
+            owned.setdefault(row.profile_id, []).append(row)
+        profiles = Profile.objects.in_bulk(owned)
+        for profile_id, profile_rows in owned.items():
+            _merge_library_rows(profiles[profile_id], profile_rows, target)
+
+        keys = list(MediaIdentity.objects.filter(media_id__in=duplicate_ids).values_list('key', flat=True))
+        for media in duplicates:
+            keys += media_keys(media)
+            for provider, field in ID_FIELDS.items():
+                # Typed ids are only unique together with the media type
+                if provider in TYPED_PROVIDERS and media.media_type != target.media_type:
+                    continue
+                if not _has_value(getattr(target, field)):
+                    setattr(target, field, getattr(media, field))
+            for field in [*DETAIL_FIELDS, 'length']:
+                if not _has_value(getattr(target, field)):
+                    setattr(target, field, getattr(media, field))
+        # Frees the duplicates' unique ids (and index keys) before target takes them
+        Media.objects.filter(pk__in=duplicate_ids).delete()
+        target.save()
+        record((key, target.pk) for key in keys)
+
+    logger.info("Merged media %s into %s", duplicate_ids, target.pk)
+    return target
+
+
+def merge_duplicates(fetch_cross_ids=True, chunk_size=LOOKUP_CHUNK_SIZE):
+    """
+    One-off cleanup of rows duplicated before they could be linked. Indexes
+    every row, asks AniList for the MyAnimeList ids of AniList rows that
+    lack one (unless `fetch_cross_ids` is False), and merges rows known
+    under the same key. Returns the number of rows merged away.
+    """
+    merged = 0
+    last_pk = 0
+    while True:
+        chunk = list(Media.objects.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        index_media(chunk)
+        # A row whose own ids are indexed under other rows duplicates them
+        found = resolve(key for media in chunk for key in media_keys(media))
+        for media in chunk:
+            owners = {found[key] for key in media_keys(media) if key in found} - {media.pk}
+            if not owners:
+                continue
+            rows = Media.objects.in_bulk([*owners, media.pk])
+            if media.pk not in rows or len(rows) < 2:
+                continue
+            target = rows.pop(min(pk for pk in owners if pk in rows))
+            merge_media(target, list(rows.values()))
+            merged += len(rows)
+
+    if fetch_cross_ids:
+        unlinked = Media.objects.filter(anilist_id__isnull=False, mal_id__isnull=True).order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(unlinked.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            details, _looked_up = enrichment.fetch_details(chunk, timeout=enrichment.WORKER_TIMEOUT_SECONDS)
+            items = [
+                {'ids': {'ANILIST': media.anilist_id, 'MAL': details[media.pk]['mal_id']}, 'media_type': media.media_type}
+                for media in chunk if details.get(media.pk, {}).get('mal_id')
+            ]
+            before = Media.objects.count()
+            upsert_media(items)
+            merged += before - Media.objects.count()
+    return merged
@@ -0,0 +1,147 @@
+"""
+Periodic database housekeeping.
+
+Expired auth tokens are otherwise only removed when they are presented, and
+OAuth handshake rows (`TMDBRequestToken`, `MALAuthRequest`) only when their
+callback succeeds, so abandoned logins pile up. `run_maintenance()` purges
+them in small chunks, prunes old change-feed tombstones and refreshes SQLite's
+query planner statistics. It runs on a background thread inside the backend
+process (`start_scheduler()`, started by run_backend.py) and can be triggered
+manually with `python manage.py run_maintenance`. The duration of each step
+and the time of the last run are exported through `/api/metrics` by the
+process that ran it.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import metrics
+from .changes import purge_tombstones
+from .models import MALAuthRequest, TMDBRequestToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Step report and Unix time of this process's most recent run, read by the gauges below
+last_run = {}
+
+metrics.Gauge(
+    'maintenance_step_duration_seconds', "Time each step of the last maintenance run took.",
+    lambda: {(name, ): step['seconds'] for name, step in last_run.get('steps', {}).items()}, ('step',),
+)
+metrics.Gauge(
+    'maintenance_last_run_timestamp_seconds', "Unix time the last maintenance run finished.",
+    lambda: {(): last_run['finished_at']} if last_run else {},
+)
+
+
+def _delete_in_chunks(queryset, chunk_size):
+    """Deletes rows matching `queryset` a chunk at a time so no single write holds the database for long."""
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def purge_expired_tokens(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Deletes tokens past the expiry `ExpiringTokenAuthentication` would enforce."""
+    now = timezone.now()
+    no_keep_days = getattr(settings, 'TOKEN_EXPIRE_DAYS_NO_KEEP', 1)
+    keep_days = getattr(settings, 'TOKEN_EXPIRE_DAYS_KEEP_LOGGED_IN', None)
+
+    short_lived = Q(user__profile__keep_user_logged_in=False) | Q(user__profile__isnull=True)
+    expired = Q(short_lived, created__lte=now - timedelta(days=int(no_keep_days)))
+    if keep_days is not None:
+        expired |= Q(user__profile__keep_user_logged_in=True, created__lte=now - timedelta(days=int(keep_days)))
+    return _delete_in_chunks(Token.objects.filter(expired), chunk_size)
+
+
+def purge_stale_handshakes(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Deletes OAuth handshake rows older than `OAUTH_HANDSHAKE_MAX_AGE_HOURS`."""
+    cutoff = timezone.now() - timedelta(hours=getattr(settings, 'OAUTH_HANDSHAKE_MAX_AGE_HOURS', 24))
+    deleted = _delete_in_chunks(TMDBRequestToken.objects.filter(created_at__lt=cutoff), chunk_size)
+    deleted += _delete_in_chunks(MALAuthRequest.objects.filter(created_at__lt=cutoff), chunk_size)
+    return deleted
+
+
+def optimize_database():
+    """Refreshes planner statistics and returns free pages to the OS (SQLite only)."""
+    if connection.vendor != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        # Bound the work ANALYZE does on big tables; the sampled stats are plenty for the planner
+        cursor.execute('PRAGMA analysis_limit = 1000')
+        cursor.execute('ANALYZE')
+        # No-op unless the database was created with auto_vacuum = INCREMENTAL
+        cursor.execute('PRAGMA incremental_vacuum(1000)')
+        cursor.fetchall()
+    return 0
+
+
+STEPS = [
+    ('expired_tokens', purge_expired_tokens),
+    ('stale_handshakes', purge_stale_handshakes),
+    ('tombstones', lambda chunk_size: purge_tombstones()),
+    ('optimize', lambda chunk_size: optimize_database()),
+]
+
+
+def run_maintenance(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Runs every housekeeping step and returns `{step: {'rows': n, 'seconds': t}}`.
+    A failing step is logged and reported without stopping the others.
+    """
+    report = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            rows = step(chunk_size)
+            error = None
+        except Exception as e:
+            logger.exception("Maintenance step %s failed", name)
+            rows, error = 0, str(e)
+        report[name] = {'rows': rows, 'seconds': round(time.perf_counter() - started, 4)}
+        if error:
+            report[name]['error'] = error
+    logger.info("Maintenance run finished: %s", report)
+    last_run.update(steps=report, finished_at=time.time())
+    return report
+
+
+_scheduler_thread = None
+
+
+def start_scheduler(interval_seconds=None):
+    """Starts the background maintenance thread (once per process)."""
+    global _scheduler_thread
+    interval = interval_seconds or getattr(settings, 'MAINTENANCE_INTERVAL_SECONDS', 6 * 60 * 60)
+    if _scheduler_thread is not None or not interval:
+        return _scheduler_thread
+
+    stop = threading.Event()
+
+    def loop():
+        # First run shortly after startup, then every `interval` seconds
+        delay = min(interval, 60)
+        while not stop.wait(delay):
+            try:
+                run_maintenance()
+            finally:
+                connection.close()
+            delay = interval
+
+    _scheduler_thread = threading.Thread(target=loop, name='maintenance', daemon=True)
+    _scheduler_thread.stop = stop
+    _scheduler_thread.start()
+    return _scheduler_thread
@@ -0,0 +1,103 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.benchmarks import BENCHMARKS
+from api.benchmarks.providers import parse_latency
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _timings(report, prefix=''):
+    """`{'endpoints.profiles.1000.stats.p50_ms': 12.3, ...}`: the timings in a report, by path."""
+    flat = {}
+    for key, value in report.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_timings(value, f'{path}.'))
+        elif isinstance(value, (int, float)) and (key == 'seconds' or key.endswith('_ms')):
+            flat[path] = value
+    return flat
+
+
+class Command(BaseCommand):
+    help = "Runs offline performance benchmarks against synthetic data (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+        parser.add_argument('--size', type=int, help="Number of synthetic library items")
+        parser.add_argument('--repeat', type=int, help="Timed repetitions per measurement")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument(
+            '--compare', metavar='REPORT', help="Print how the timings changed since an earlier --output report",
+        )
+        parser.add_argument(
+            '--sync-size', type=int, help="Entries in each replayed provider library (endpoints benchmark)",
+        )
+        parser.add_argument(
+            '--latency', action='append', metavar='PROVIDER=MS[:SIGMA]',
+            help="Replayed provider latency, lognormal with this median and sigma; "
+                 "`all=0` for none (endpoints benchmark, repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+        try:
+            parse_latency(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)
+
+        report = {}
+        for name in names:
+            with transaction.atomic():
+                report[name] = BENCHMARKS[name](options)
+                transaction.set_rollback(True)
+
+        if baseline is not None:
+            self._compare(baseline, report)
+
+        if options['output']:
+            report['meta'] = {
+                'commit': _git_commit(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'machine': platform.machine(),
+                'options': {key: options[key] for key in ('size', 'repeat', 'sync_size', 'latency')},
+            }
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _compare(self, baseline, report):
+        commit = baseline.get('meta', {}).get('commit') or 'the baseline'
+        before, after = _timings(baseline), _timings(report)
+        shared = [path for path in after if path in before]
+        if not shared:
+            self.stdout.write(f"No timings in common with {commit}")
+            return
+        self.stdout.write(f"Compared with {commit}:")
+        for path in shared:
+            old, new = before[path], after[path]
+            change = f'{(new - old) / old * 100:+7.1f}%' if old else '      -'
+            self.stdout.write(f"  {path:<64} {old:10.3f} -> {new:10.3f}  {change}")
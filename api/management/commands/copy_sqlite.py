@@ -0,0 +1,31 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.sqlite_copy import DEFAULT_BATCH_SIZE, CopyError, copy_database, register_sqlite
+
+
+class Command(BaseCommand):
+    help = "Copies every row of a SQLite database file (e.g. db.sqlite3) into the configured database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="SQLite file to copy from, migrated to the current code")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows read (and bulk inserted) at a time")
+        parser.add_argument('--replace', action='store_true',
+                            help="Overwrite users and media already in the target database")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f"{path} is not a file")
+        started = time.perf_counter()
+        try:
+            copied = copy_database(register_sqlite(path), batch_size=options['batch_size'], replace=options['replace'])
+        except CopyError as e:
+            raise CommandError(str(e))
+        for table, rows in copied.items():
+            if rows:
+                self.stdout.write(f"{table:<36} {rows:>9} rows")
+        self.stdout.write(f"Copied {sum(copied.values())} rows in {time.perf_counter() - started:.1f} s")
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.enrichment import QUEUE_BATCH_SIZE, pending_media, process_queue
+
+
+class Command(BaseCommand):
+    help = "Fills in missing media descriptions and lengths from the providers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=QUEUE_BATCH_SIZE,
+                            help="Rows looked up per batch")
+
+    def handle(self, *args, **options):
+        queued = pending_media().count()
+        started = time.perf_counter()
+        updated = process_queue(batch_size=options['batch_size'])
+        self.stdout.write(
+            f"{queued} queued, {updated} updated in {time.perf_counter() - started:.1f} s"
+        )
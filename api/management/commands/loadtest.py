@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks.load import DEFAULT_MIX, LoadTest, parse_mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives a running backend with synthetic users sending a mix of requests and reports throughput, "
+        "latency percentiles and error rates per endpoint over time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the backend")
+        parser.add_argument('--users', type=int, default=50, help="Concurrent synthetic users")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds of load, ramp-up included")
+        parser.add_argument('--ramp-up', type=float, default=10,
+                            help="Seconds over which the users start; left out of the totals")
+        parser.add_argument('--think-ms', type=float, default=500, help="Mean pause between a user's requests")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds per timeline window")
+        parser.add_argument('--mix', help=f"Endpoint weights, e.g. search=10,stats=5 (of {', '.join(DEFAULT_MIX)})")
+        parser.add_argument('--timeout', type=float, default=30, help="Seconds before a request counts as failed")
+        parser.add_argument('--no-link', action='store_true',
+                            help="Don't link provider accounts in the database (when it isn't the server's)")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the synthetic users afterwards")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['users'] < 1 or options['duration'] <= 0 or options['interval'] <= 0:
+            raise CommandError("--users, --duration and --interval must be positive")
+
+        load = LoadTest(
+            options['url'], users=options['users'], duration=options['duration'], ramp_up=options['ramp_up'],
+            think_seconds=options['think_ms'] / 1000, interval=options['interval'], mix=mix,
+            timeout=options['timeout'], link=not options['no_link'], seed=options['seed'], out=self.stdout.write,
+        )
+        try:
+            report = load.run()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        finally:
+            if options['cleanup']:
+                self.stdout.write(f"Removed {load.remove_users()} synthetic users")
+
+        self.stdout.write(f"\n{'endpoint':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for endpoint, stats in [*report['summary'].items(), ('total', report['total'])]:
+            if stats:
+                self.stdout.write(
+                    f"{endpoint:<16} {stats['rps']:8.1f} {stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} "
+                    f"{stats['p99_ms']:8.1f} {stats['error_rate']:7.1%}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api import title_index
+from api.identity import merge_duplicates
+from api.models import Media
+
+
+class Command(BaseCommand):
+    help = "Merges Media rows that are the same title from different providers (e.g. AniList and MyAnimeList)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offline', action='store_true',
+                            help="Don't ask AniList for MyAnimeList ids; only merge rows already linked")
+        parser.add_argument('--similar', type=float, metavar='THRESHOLD',
+                            help="Afterwards, list rows of the same type whose titles are at least this similar "
+                                 "(0-1) for manual review; they are not merged")
+
+    def handle(self, *args, **options):
+        merged = merge_duplicates(fetch_cross_ids=not options['offline'])
+        self.stdout.write(f"Merged {merged} duplicate media rows.")
+
+        if options['similar'] is not None:
+            for media in Media.objects.order_by('pk').iterator():
+                for other_id, similarity in title_index.similar_media(media, threshold=options['similar']):
+                    if other_id > media.pk:
+                        self.stdout.write(f"{similarity:.2f}  #{media.pk} {media.primary_title!r}  ~  #{other_id}")
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks.providers import parse_latency
+from api.benchmarks.standin import DEFAULT_PORT, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves recorded provider API responses locally, for load tests without network access. "
+        "Point the backend at it with PROVIDER_STANDIN_URL=http://<host>:<port>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+        parser.add_argument('--latency', action='append', metavar='PROVIDER=MS[:SIGMA]',
+                            help="Response latency, lognormal with this median and sigma; `all=0` for none (repeatable)")
+        parser.add_argument('--list-size', type=int, default=200, help="Entries in each user's provider library")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with 503")
+        parser.add_argument('--throttle-rate', type=float, default=0.0,
+                            help="Share of requests answered with 429 Too Many Requests")
+        parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+
+    def handle(self, *args, **options):
+        try:
+            latency = parse_latency(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not 0 <= options['error_rate'] + options['throttle_rate'] <= 1:
+            raise CommandError("--error-rate and --throttle-rate must add up to between 0 and 1")
+
+        server = make_server(
+            options['host'], options['port'], latency=latency, list_size=options['list_size'],
+            error_rate=options['error_rate'], throttle_rate=options['throttle_rate'],
+            retry_after=options['retry_after'],
+        )
+        self.stdout.write(f"Provider stand-in on http://{options['host']}:{server.server_port} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        for (provider, status), count in sorted(server.responses.items()):
+            self.stdout.write(f"{provider:<14} {status}  {count:>8}")
+        if server.replay.unmatched:
+            self.stdout.write(f"Unmatched requests: {dict(server.replay.unmatched)}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.maintenance import DEFAULT_CHUNK_SIZE, run_maintenance
+
+
+class Command(BaseCommand):
+    help = "Purges expired tokens, stale OAuth handshakes and old tombstones, and optimizes the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Rows deleted per statement")
+
+    def handle(self, *args, **options):
+        report = run_maintenance(chunk_size=options['chunk_size'])
+        for step, result in report.items():
+            line = f"{step:<18} {result['rows']:>7} rows  {result['seconds'] * 1000:9.1f} ms"
+            if 'error' in result:
+                line += f"  FAILED: {result['error']}"
+            self.stdout.write(line)
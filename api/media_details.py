@@ -0,0 +1,75 @@
+"""
+Full Media details for many ids at once (`/api/media/batch?ids=`).
+
+Each item's serialized details are cached under its row `version`, so a
+request costs one small `(id, version)` query when everything is cached and
+one more for the rows that are not. Any save of a Media row bumps its
+version, which retires the old cache entry.
+"""
+from django.core.cache import cache
+
+from . import enrichment, metrics
+from .models import Media
+from .serializers import MediaDetailSerializer
+
+MAX_IDS = 100
+CACHE_TIMEOUT_SECONDS = 24 * 60 * 60
+# How long a request waits for `enrich` lookups; slower ones are left to the worker
+ENRICH_TIMEOUT_SECONDS = 2
+
+
+def parse_ids(raw):
+    """Parses `1,2,3` into a list of unique ids, in order; raises ValueError."""
+    ids = []
+    for part in raw.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            pk = int(part)
+        except ValueError:
+            raise ValueError("ids must be a comma separated list of integers.")
+        if pk not in ids:
+            ids.append(pk)
+    if not ids:
+        raise ValueError("ids is required.")
+    if len(ids) > MAX_IDS:
+        raise ValueError(f"At most {MAX_IDS} ids can be requested at once.")
+    return ids
+
+
+def _cache_key(pk, version):
+    return f'media:{pk}:v{version}'
+
+
+def get_details(ids, enrich=False):
+    """
+    Returns `(details, missing_ids)`, details in the order of `ids`. With
+    `enrich`, missing descriptions and lengths are first looked up from the
+    providers (see api/enrichment.py), for at most `ENRICH_TIMEOUT_SECONDS`;
+    items still lacking them are handed to the background worker and served
+    as they are.
+    """
+    versions = dict(Media.objects.filter(pk__in=ids).values_list('pk', 'version'))
+    keys = {pk: _cache_key(pk, version) for pk, version in versions.items()}
+    cached = cache.get_many(keys.values())
+    found = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    if enrich:
+        found = {
+            pk: item for pk, item in found.items()
+            if not enrichment.needs_enrichment(item['media_type'], item['description'], item['length'])
+        }
+
+    to_load = [pk for pk in versions if pk not in found]
+    metrics.record_cache('media_details', hits=len(found), misses=len(to_load))
+    if to_load:
+        rows = list(Media.objects.filter(pk__in=to_load))
+        if enrich:
+            enrichment.enrich(rows, timeout=ENRICH_TIMEOUT_SECONDS)
+            if any(enrichment.needs_enrichment(media.media_type, media.description, media.length) for media in rows):
+                enrichment.notify()
+        data = MediaDetailSerializer(rows, many=True).data
+        cache.set_many({_cache_key(item['id'], item['version']): item for item in data}, CACHE_TIMEOUT_SECONDS)
+        found.update((item['id'], item) for item in data)
+
+    return [found[pk] for pk in ids if pk in found], [pk for pk in ids if pk not in versions]
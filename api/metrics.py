@@ -0,0 +1,406 @@
+"""
+Process metrics in the Prometheus text format (`/api/metrics`, served to
+scrapers holding `METRICS_TOKEN`).
+
+- request latency, DB query count and DB time per URL name
+  (`MetricsMiddleware`, from the counts of `api.query_budget`);
+- latency, failures and HTTP retries of every provider service function
+  (`instrument_provider()`, applied when `api.services` loads a provider);
+- hits and misses of the response, media details and auth caches;
+- queued work in the thread pools and the ASGI request queue.
+
+Recording happens on the hot path of every request, so it takes no lock:
+each thread adds to its own shard of a metric, and a scrape sums the shards.
+The shards of finished threads are folded into a running total whenever a
+new thread starts recording, or at the next scrape. A scrape may
+therefore miss an observation that is being recorded at that very moment,
+which Prometheus doesn't mind.
+
+Values are per process: with several gunicorn workers each scrape reports the
+worker that answered it, told apart by the `process_id` gauge.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from . import profiling
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base of the recorded metrics: keeps one shard of values per thread."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                # Short-lived threads (per-request pools) come and go without a
+                # scrape; folding theirs away here keeps the list to live threads
+                self._retire_finished()
+                self._shards.append((weakref.ref(threading.current_thread()), values))
+            return values
+
+    def _retire_finished(self):
+        """Folds the shards of finished threads into `_retired`; call with `_lock` held."""
+        live = []
+        for thread_ref, values in self._shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live.append((thread_ref, values))
+            else:
+                self._merge(self._retired, values)
+        self._shards = live
+
+    def _merge(self, into, values):
+        raise NotImplementedError
+
+    def collect(self):
+        """Returns `{label values: value}` summed over all threads."""
+        with self._lock:
+            self._retire_finished()
+            totals = {}
+            self._merge(totals, self._retired)
+            for _thread_ref, values in self._shards:
+                # dict() copies without letting the owning thread run in between
+                self._merge(totals, dict(values))
+        return totals
+
+    def render(self):
+        raise NotImplementedError
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def _merge(self, into, values):
+        for key, value in values.items():
+            into[key] = into.get(key, 0) + value
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        shard = self._shard()
+        # [per-bucket counts..., +Inf count, sum]
+        counts = shard.get(label_values)
+        if counts is None:
+            counts = shard[label_values] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def _merge(self, into, values):
+        for key, counts in values.items():
+            total = into.get(key)
+            if total is None:
+                into[key] = list(counts)
+            else:
+                for i, count in enumerate(counts):
+                    total[i] += count
+
+    def render(self):
+        lines = self._header()
+        bounds = [*self.buckets, float('inf')]
+        names = (*self.labels, 'le')
+        for key, counts in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(names, (*key, _format_value(bound)))} {cumulative}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """A value read when scraped: `read()` returns `{label values: value}`."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.read = read
+        with _registry_lock:
+            _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self.read().items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ------------------------------------------------------------------------------
+# Requests and database queries
+# ------------------------------------------------------------------------------
+
+request_seconds = Histogram(
+    'http_request_duration_seconds', "Time spent answering requests, by URL name.", ('view', 'method', 'status'),
+)
+request_queries = Histogram(
+    'http_request_db_queries', "Database queries run per request, by URL name.", ('view',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+request_db_seconds = Histogram(
+    'http_request_db_seconds', "Time spent in database queries per request, by URL name.", ('view',),
+)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and database work of every request under its URL
+    name. Goes first in MIDDLEWARE, followed by QueryBudgetMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        # Unresolved paths share one label rather than one each
+        view = (match.url_name or match.view_name) if match else '<unmatched>'
+        request_seconds.observe(elapsed, view, request.method, f'{response.status_code // 100}xx')
+        # Counted by api.query_budget.QueryBudgetMiddleware
+        query_log = getattr(request, 'query_log', None)
+        if query_log is not None:
+            request_queries.observe(query_log.count, view)
+            request_db_seconds.observe(query_log.seconds, view)
+        return response
+
+
+# ------------------------------------------------------------------------------
+# Provider calls
+# ------------------------------------------------------------------------------
+
+provider_seconds = Histogram(
+    'provider_call_duration_seconds', "Time spent in provider service functions.", ('service', 'function'),
+)
+provider_errors = Counter(
+    'provider_call_errors_total',
+    "Provider service calls that raised or got an error response (even when they returned a fallback).",
+    ('service', 'function'),
+)
+provider_retries = Counter(
+    'provider_call_retries_total', "HTTP retries made by provider service calls.", ('service', 'function'),
+)
+
+_current_call = threading.local()
+_requests_instrumented = False
+
+
+def _record_http(response=None, failed=False):
+    call = getattr(_current_call, 'call', None)
+    if call is None:
+        return
+    if failed or response.status_code >= 400:
+        call['failed'] = True
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    if retries is not None and retries.history:
+        provider_retries.inc(*call['labels'], amount=len(retries.history))
+
+
+def _instrument_requests():
+    """Reports the outcome of HTTP requests made during a provider call back to it."""
+    global _requests_instrumented
+    if _requests_instrumented:
+        return
+    import requests
+
+    send = requests.Session.send
+
+    @functools.wraps(send)
+    def instrumented_send(session, request, **kwargs):
+        try:
+            response = send(session, request, **kwargs)
+        except Exception:
+            _record_http(failed=True)
+            raise
+        _record_http(response)
+        return response
+
+    requests.Session.send = instrumented_send
+    _requests_instrumented = True
+
+
+def _instrumented(service, func):
+    labels = (service, func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_current_call, 'call', None)
+        call = _current_call.call = {'labels': labels, 'failed': False}
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            call['failed'] = True
+            raise
+        finally:
+            provider_seconds.observe(time.perf_counter() - started, *labels)
+            if call['failed']:
+                provider_errors.inc(*labels)
+            _current_call.call = outer
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_provider(module):
+    """Wraps the public functions of a provider service module to record their calls."""
+    _instrument_requests()
+    service = module.__name__.rsplit('.', 1)[-1].removesuffix('_service')
+    for name, value in list(vars(module).items()):
+        if (
+            not name.startswith('_') and callable(value) and not isinstance(value, type)
+            and getattr(value, '__module__', None) == module.__name__
+            and not getattr(value, 'instrumented', False)
+        ):
+            setattr(module, name, _instrumented(service, value))
+    return module
+
+
+# ------------------------------------------------------------------------------
+# Caches
+# ------------------------------------------------------------------------------
+
+cache_requests = Counter(
+    'cache_requests_total', "Cache lookups, by cache and result (hit or miss).", ('cache', 'result'),
+)
+
+
+def record_cache(name, hits, misses=0):
+    if hits:
+        cache_requests.inc(name, 'hit', amount=hits)
+    if misses:
+        cache_requests.inc(name, 'miss', amount=misses)
+
+
+def _hit_ratios():
+    totals = {}
+    for (name, result), count in cache_requests.collect().items():
+        totals.setdefault(name, {'hit': 0, 'miss': 0})[result] += count
+    return {(name, ): counts['hit'] / (counts['hit'] + counts['miss']) for name, counts in totals.items()}
+
+
+Gauge('cache_hit_ratio', "Share of lookups answered from each cache since the process started.", _hit_ratios, ('cache',))
+
+
+# ------------------------------------------------------------------------------
+# Queues
+# ------------------------------------------------------------------------------
+
+_pools = weakref.WeakKeyDictionary()
+_queues = {}
+
+
+def track_pool(name, executor):
+    """
+    Reports the queued work of `executor` (a ThreadPoolExecutor) under `name`
+    and lets a request profiler follow its threads (see api/profiling.py);
+    returns it.
+    """
+    _pools[executor] = name
+    profiling.watch_pool(executor)
+    return executor
+
+
+def _pool_depths():
+    depths = {}
+    for executor, name in list(_pools.items()):
+        depths[(name, )] = depths.get((name, ), 0) + executor._work_queue.qsize()
+    return depths
+
+
+def register_queue(name, depth):
+    """Reports `depth()`, the length of a queue, under `name`."""
+    _queues[name] = depth
+
+
+Gauge('thread_pool_queue_depth', "Tasks waiting for a thread, by pool.", _pool_depths, ('pool',))
+Gauge(
+    'queue_depth', "Items waiting in other queues, such as the ASGI request queue.",
+    lambda: {(name, ): depth() for name, depth in list(_queues.items())}, ('queue',),
+)
+Gauge('process_id', "Id of the process these values belong to.", lambda: {(): os.getpid()})
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_profile_use_steam_or_rawg'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileStatsBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_type', models.CharField(choices=[('ANIME', 'Anime'), ('MOVIE', 'Movie'), ('BOOK', 'Book'), ('GAME', 'Game'), ('TV_SHOW', 'TV Show'), ('MANGA', 'Manga')], max_length=7)),
+                ('progress_minutes', models.BigIntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('weight_sum', models.BigIntegerField(default=0)),
+                ('weighted_score_sum', models.FloatField(default=0)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_buckets', to='api.profile')),
+            ],
+            options={
+                'unique_together': {('profile', 'media_type')},
+            },
+        ),
+    ]
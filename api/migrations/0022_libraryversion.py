@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_profilestatsbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='library_version', to='api.profile')),
+            ],
+        ),
+    ]
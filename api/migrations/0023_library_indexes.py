@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_libraryversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['media_type', 'primary_title'], name='media_type_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermedia',
+            index=models.Index(fields=['profile', 'status', 'score'], name='usermedia_status_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermedia',
+            index=models.Index(fields=['profile', 'score', 'id'], name='usermedia_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermedia',
+            index=models.Index(fields=['profile', 'progress', 'id'], name='usermedia_progress_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_library_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user_media', 'User Media'), ('custom_list_entry', 'Custom List Entry')], max_length=17)),
+                ('object_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customlistentry',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='libraryversion',
+            name='tombstone_floor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='usermedia',
+            index=models.Index(fields=['profile', 'change_seq'], name='usermedia_change_seq_idx'),
+        ),
+        migrations.AddField(
+            model_name='librarytombstone',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to='api.profile'),
+        ),
+        migrations.AddIndex(
+            model_name='librarytombstone',
+            index=models.Index(fields=['profile', 'change_seq'], name='tombstone_change_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0004_alter_tokenproxy_options'),
+        ('api', '0024_change_sequence'),
+    ]
+
+    operations = [
+        # DRF's Token model has no index on `created`, which the token janitor filters on
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS authtoken_token_created_idx ON authtoken_token (created)',
+            reverse_sql='DROP INDEX IF EXISTS authtoken_token_created_idx',
+        ),
+        migrations.AlterField(
+            model_name='malauthrequest',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='tmdbrequesttoken',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:14
+
+import api.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_maintenance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='version',
+            field=api.models.VersionField(default=1),
+        ),
+    ]
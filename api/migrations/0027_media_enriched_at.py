@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_media_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='enriched_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Media column -> provider; MyAnimeList, TMDB and Google Books ids are only unique per media type
+ID_FIELDS = [
+    ('anilist_id', 'ANILIST', False),
+    ('mal_id', 'MAL', True),
+    ('tmdb_id', 'TMDB', True),
+    ('rawg_id', 'RAWG', False),
+    ('steam_appid', 'STEAM', False),
+    ('google_book_id', 'GOOGLE', True),
+]
+
+
+def index_existing_media(apps, schema_editor):
+    Media = apps.get_model('api', 'Media')
+    MediaIdentity = apps.get_model('api', 'MediaIdentity')
+    db_alias = schema_editor.connection.alias
+    rows = []
+    for media in Media.objects.using(db_alias).only('pk', 'media_type', *(field for field, _, _ in ID_FIELDS)).iterator():
+        for field, provider, typed in ID_FIELDS:
+            value = getattr(media, field)
+            if value is not None and value != '':
+                key = f'{provider}:{media.media_type}:{value}' if typed else f'{provider}:{value}'
+                rows.append(MediaIdentity(key=key, media_id=media.pk))
+    MediaIdentity.objects.using(db_alias).bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_media_enriched_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identities', to='api.media')),
+            ],
+        ),
+        migrations.RunPython(index_existing_media, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-19 04:02
+
+from django.db import migrations
+
+# PostgreSQL only: SQLite deployments search titles with the in-memory index
+# of api/title_index.py instead. Creating the extension needs a role allowed
+# to, or pg_trgm installed beforehand.
+TRIGRAM_INDEXES = [
+    # `%` similarity lookups (api.title_index on PostgreSQL)
+    ('media_primary_title_trgm', 'primary_title gin_trgm_ops'),
+    ('media_secondary_title_trgm', 'secondary_title gin_trgm_ops'),
+    # istartswith/icontains, which compare UPPER(column::text)
+    ('media_primary_title_upper_trgm', '(UPPER(primary_title::text)) gin_trgm_ops'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, expression in TRIGRAM_INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON api_media USING gin ({expression})')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _expression in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_media_identity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-19 04:37
+
+from django.db import migrations, models
+
+
+def type_mal_keys(apps, schema_editor):
+    """Re-keys `MAL:<id>` identities from before MyAnimeList ids were typed as `MAL:<type>:<id>`."""
+    MediaIdentity = apps.get_model('api', 'MediaIdentity')
+    identities = MediaIdentity.objects.using(schema_editor.connection.alias)
+    untyped = list(identities.filter(key__regex=r'^MAL:[0-9]+$').select_related('media'))
+    identities.bulk_create(
+        [MediaIdentity(key=f'MAL:{row.media.media_type}:{row.key[len("MAL:"):]}', media_id=row.media_id)
+         for row in untyped],
+        batch_size=500, ignore_conflicts=True,
+    )
+    identities.filter(pk__in=[row.pk for row in untyped]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_media_title_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='mal_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='media',
+            unique_together={('google_book_id', 'media_type'), ('mal_id', 'media_type'), ('tmdb_id', 'media_type')},
+        ),
+        migrations.RunPython(type_mal_keys, migrations.RunPython.noop),
+    ]
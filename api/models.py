@@ -1,6 +1,19 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
+
+class VersionField(models.PositiveIntegerField):
+    """
+    A counter incremented every time the row is saved. Because it changes in
+    pre_save(), update_or_create() writes it along with the updated fields.
+    bulk_update() and queryset.update() bypass it and must bump it themselves.
+    """
+    def pre_save(self, model_instance, add):
+        value = 1 if add else (getattr(model_instance, self.attname) or 0) + 1
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class Profile(models.Model):
     """
     Extends the default Django User model with additional fields for external
@@ -63,6 +76,7 @@ class Media(models.Model):
     secondary_title = models.CharField(max_length=255, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     cover_image_url = models.URLField(blank=True, null=True)
+    # Minutes per episode or movie, pages for books (see api/stats.py), when the provider reports it
     length = models.IntegerField(null=True, blank=True)
     
     # IDs from external services used for syncing and preventing duplicates
@@ -70,15 +84,39 @@ class Media(models.Model):
     tmdb_id = models.IntegerField(blank=True, null=True) 
     rawg_id = models.IntegerField(unique=True, blank=True, null=True)
     google_book_id = models.CharField(unique=True, blank=True, null=True)
-    mal_id = models.IntegerField(unique=True, blank=True, null=True)
+    mal_id = models.IntegerField(blank=True, null=True)
     steam_appid = models.IntegerField(unique=True, blank=True, null=True)  # Steam's unique game identifier
 
+    # Keys the per-media detail cache (api/media_details.py)
+    version = VersionField(default=1)
+    # Last time missing details were looked up from the provider (api/enrichment.py)
+    enriched_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
     def __str__(self):
         return f"{self.primary_title} ({self.get_media_type_display()})" # type: ignore
 
     class Meta:
-        # Prevents duplicate entries for TMDB and Google Books, which have separate IDs for different media types.
-        unique_together = [['tmdb_id', 'media_type'], ['google_book_id', 'media_type']]
+        # Prevents duplicate entries for TMDB, Google Books and MyAnimeList (anime and manga), which have
+        # separate IDs for different media types.
+        unique_together = [['tmdb_id', 'media_type'], ['google_book_id', 'media_type'], ['mal_id', 'media_type']]
+        indexes = [
+            # Library filtering by type and title prefix
+            models.Index(fields=['media_type', 'primary_title'], name='media_type_title_idx'),
+        ]
+
+class MediaIdentity(models.Model):
+    """
+    Maps a provider id (`ANILIST:21`, `MAL:ANIME:21`, `TMDB:MOVIE:603`) to the Media
+    row it belongs to. Besides the ids in its own columns, a row is indexed
+    under the cross ids other providers report for it (AniList exposes each
+    item's MyAnimeList id), so the same title synced from different providers
+    resolves to one Media row. See `api.identity`.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    media = models.ForeignKey(Media, on_delete=models.CASCADE, related_name='identities')
+
+    def __str__(self):
+        return f"{self.key} -> {self.media_id}"
 
 class UserMedia(models.Model):
     """
@@ -109,15 +147,68 @@ class UserMedia(models.Model):
     
     start_date = models.DateField(blank=True, null=True)
     finish_date = models.DateField(blank=True, null=True)
+
+    # Library version at which this row last changed (see api.changes)
+    change_seq = models.BigIntegerField(default=0)
     
     class Meta:
         # Ensures that a user can have only one entry for any given media item.
         unique_together = ('profile', 'media')
+        indexes = [
+            # Keyset pagination and filtering of a profile's library (see api.pagination)
+            models.Index(fields=['profile', 'status', 'score'], name='usermedia_status_score_idx'),
+            models.Index(fields=['profile', 'score', 'id'], name='usermedia_score_idx'),
+            models.Index(fields=['profile', 'progress', 'id'], name='usermedia_progress_idx'),
+            models.Index(fields=['profile', 'change_seq'], name='usermedia_change_seq_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The change sequence stamped in pre_save (api.signals) commits together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         display_title = self.media.primary_title or self.media.secondary_title or "Untitled"
         return f"{self.profile.user.username}'s entry for {display_title}"
-    
+
+class LibraryVersion(models.Model):
+    """
+    A per-profile counter bumped on every change to the profile's library
+    (UserMedia rows, custom lists and their entries). Cached payloads and
+    ETags are keyed on it, see `api.caching`.
+
+    Kept out of `Profile` so that saving a stale Profile instance can never
+    roll the counter back.
+    """
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, related_name='library_version')
+    version = models.BigIntegerField(default=0)
+    # Tombstones at or below this version have been purged; clients that
+    # last synced before it must reload the whole library.
+    tombstone_floor = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.profile} v{self.version}"
+
+class ProfileStatsBucket(models.Model):
+    """
+    Pre-aggregated statistics for one media type of a profile's library.
+    Maintained incrementally by the UserMedia signals in `api.signals` when
+    `STATS_SUMMARY_TABLE` is enabled (see `api.stats`).
+    """
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='stats_buckets')
+    media_type = models.CharField(max_length=7, choices=Media.MEDIA_TYPE_CHOICES)
+
+    progress_minutes = models.BigIntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    weight_sum = models.BigIntegerField(default=0)
+    weighted_score_sum = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('profile', 'media_type')
+
+    def __str__(self):
+        return f"{self.profile} - {self.media_type}"
+
 class TMDBRequestToken(models.Model):
     """
     A temporary model to store TMDB OAuth request tokens during the
@@ -125,7 +216,7 @@ class TMDBRequestToken(models.Model):
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.CharField(max_length=255, unique=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
 class MALAuthRequest(models.Model):
     """
@@ -134,7 +225,7 @@ class MALAuthRequest(models.Model):
     """
     state = models.CharField(max_length=255, unique=True)
     code_verifier = models.CharField(max_length=255)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
 class CustomList(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='custom_lists')
@@ -151,9 +242,42 @@ class CustomListEntry(models.Model):
     custom_list = models.ForeignKey(CustomList, on_delete=models.CASCADE, related_name='entries')
     user_media = models.ForeignKey(UserMedia, on_delete=models.CASCADE)
     added_at = models.DateTimeField(auto_now_add=True)
+    change_seq = models.BigIntegerField(default=0, db_index=True)
 
     class Meta:
         unique_together = ('custom_list', 'user_media')
 
+    def save(self, *args, **kwargs):
+        # The change sequence stamped in pre_save (api.signals) commits together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.custom_list.name}: {self.user_media}"
+
+class LibraryTombstone(models.Model):
+    """
+    Marks a deleted UserMedia or CustomListEntry so clients mirroring the
+    library can drop it when they fetch changes (see api.changes).
+    """
+    USER_MEDIA = 'user_media'
+    CUSTOM_LIST_ENTRY = 'custom_list_entry'
+
+    KIND_CHOICES = [
+        (USER_MEDIA, 'User Media'),
+        (CUSTOM_LIST_ENTRY, 'Custom List Entry'),
+    ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='tombstones')
+    kind = models.CharField(max_length=17, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['profile', 'change_seq'], name='tombstone_change_seq_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.custom_list.name}: {self.user_media}"
\ No newline at end of file
+        return f"{self.kind} {self.object_id} deleted at {self.change_seq}"
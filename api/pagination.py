@@ -0,0 +1,192 @@
+"""
+Keyset (cursor) pagination for the user's library.
+
+Pages are selected with `WHERE (sort_value, id) < (last_sort_value, last_id)`
+instead of OFFSET, so fetching page N costs the same as fetching page 1 and
+the composite `UserMedia` indexes can be used to walk the library in order.
+"""
+import base64
+import json
+
+from django.db.models import F, Q
+
+from . import title_index
+from .models import Media, UserMedia
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Public sort key -> expression used for ordering. Plain columns, so the
+# composite `UserMedia` indexes serve both the order and the cursor filter.
+SORT_KEYS = {
+    'score': F('score'),
+    'title': F('media__primary_title'),
+    'progress': F('progress'),
+}
+# Python type of each sort key's values, which cursors are checked against
+SORT_TYPES = {
+    'score': float,
+    'title': str,
+    'progress': int,
+}
+# Sort keys whose NULLs (unscored items) sort below every value, walked as a
+# separate range by id; their cursors carry `null` as the sort value there
+NULLABLE_SORT_KEYS = {'score'}
+DEFAULT_SORT = '-score'
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for malformed filters, sort keys or cursors."""
+
+
+def encode_cursor(sort_value, pk):
+    raw = json.dumps([sort_value, pk], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, value_type, nullable=False):
+    """
+    Returns the cursor's `(sort_value, pk)`, the sort value coerced to
+    `value_type` (or None, for `nullable` sort keys).
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if sort_value is None and nullable:
+            return None, int(pk)
+        if value_type is str and not isinstance(sort_value, str):
+            raise TypeError(sort_value)
+        return value_type(sort_value), int(pk)
+    except (ValueError, TypeError, OverflowError):
+        raise InvalidPageRequest("Invalid cursor.")
+
+
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _float_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise InvalidPageRequest(f"{name} must be a number.")
+
+
+def filter_library(queryset, params):
+    """Applies the `status`, `media_type`, `min_score`, `max_score`, `title` and `fuzzy_title` filters."""
+    statuses = _split(params.get('status', ''))
+    if statuses:
+        valid = {choice for choice, _label in UserMedia.STATUS_CHOICES}
+        if not set(statuses) <= valid:
+            raise InvalidPageRequest("Unknown status.")
+        queryset = queryset.filter(status__in=statuses)
+
+    media_types = _split(params.get('media_type', ''))
+    if media_types:
+        valid = {choice for choice, _label in Media.MEDIA_TYPE_CHOICES}
+        if not set(media_types) <= valid:
+            raise InvalidPageRequest("Unknown media_type.")
+        queryset = queryset.filter(media__media_type__in=media_types)
+
+    min_score = _float_param(params, 'min_score')
+    if min_score is not None:
+        queryset = queryset.filter(score__gte=min_score)
+    max_score = _float_param(params, 'max_score')
+    if max_score is not None:
+        queryset = queryset.filter(score__lte=max_score)
+
+    title = params.get('title', '').strip()
+    if title:
+        queryset = queryset.filter(media__primary_title__istartswith=title)
+    fuzzy_title = params.get('fuzzy_title', '').strip()
+    if fuzzy_title:
+        # Typo-tolerant: every close title among the (otherwise filtered) library's own
+        matches = title_index.lookup(fuzzy_title, limit=None, within=queryset.values_list('media_id', flat=True))
+        queryset = queryset.filter(media_id__in=[media_id for _similarity, media_id, _title in matches])
+    return queryset
+
+
+def paginate_library(queryset, params):
+    """
+    Returns `(items, next_cursor)` for one page of `queryset` ordered by the
+    `sort` parameter (`score`, `title` or `progress`, prefixed with `-` for
+    descending order).
+    """
+    sort = params.get('sort', DEFAULT_SORT)
+    descending = sort.startswith('-')
+    key = sort.lstrip('-')
+    if key not in SORT_KEYS:
+        raise InvalidPageRequest(f"sort must be one of: {', '.join(SORT_KEYS)}.")
+
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPageRequest("limit must be an integer.")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    queryset = queryset.annotate(sort_value=SORT_KEYS[key])
+    cursor = params.get('cursor')
+    after = decode_cursor(cursor, SORT_TYPES[key], nullable=key in NULLABLE_SORT_KEYS) if cursor else None
+
+    # Fetch one extra row to know whether another page exists
+    if key in NULLABLE_SORT_KEYS:
+        rows = _nullable_page(queryset, descending, after, limit + 1)
+    else:
+        rows = list(_after(_ordered(queryset, descending), descending, after)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.sort_value, last.pk)
+    return rows, next_cursor
+
+
+def _ordered(queryset, descending):
+    if descending:
+        return queryset.order_by('-sort_value', '-id')
+    return queryset.order_by('sort_value', 'id')
+
+
+def _after(queryset, descending, after):
+    """Rows past the `(sort_value, pk)` cursor position `after`."""
+    if after is None:
+        return queryset
+    last_value, last_pk = after
+    # The plain range on the sort value lets the index seek to the cursor
+    if descending:
+        return queryset.filter(sort_value__lte=last_value).filter(Q(sort_value__lt=last_value) | Q(id__lt=last_pk))
+    return queryset.filter(sort_value__gte=last_value).filter(Q(sort_value__gt=last_value) | Q(id__gt=last_pk))
+
+
+def _nullable_page(queryset, descending, after, count):
+    """
+    Up to `count` rows walking the non-NULL sort values and then the NULLs
+    (the other way round when ascending), each range in index order. A page
+    crossing from one range to the other takes two queries.
+    """
+    ranges = [
+        (False, _ordered(queryset.filter(sort_value__isnull=False), descending)),
+        (True, _ordered(queryset.filter(sort_value__isnull=True), descending)),
+    ]
+    if not descending:
+        ranges.reverse()
+    rows = []
+    reached = after is None
+    for null_range, rows_in_range in ranges:
+        if not reached:
+            if (after[0] is None) != null_range:
+                # The cursor is past this whole range
+                continue
+            reached = True
+            if null_range:
+                past = Q(id__lt=after[1]) if descending else Q(id__gt=after[1])
+                rows_in_range = rows_in_range.filter(past)
+            else:
+                rows_in_range = _after(rows_in_range, descending, after)
+        rows += rows_in_range[:count - len(rows)]
+        if len(rows) >= count:
+            break
+    return rows
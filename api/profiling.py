@@ -0,0 +1,221 @@
+"""
+On-demand profiling of single requests in a running server.
+
+A request is profiled when it carries `X-Profile: <PROFILING_SECRET>` (only
+ever a header, so the secret stays out of access logs), or when it is picked
+by `PROFILING_SAMPLE_RATE`. The profile is written to `PROFILING_DIR` and its
+id returned in the `X-Profile-Id` response header; only the newest
+`PROFILING_MAX_FILES` profiles are kept.
+
+Two profilers, chosen with `X-Profile-Mode`:
+
+- `sample` (the default, and the one sampled requests get): a thread reads
+  the stacks of the request's threads every `PROFILING_INTERVAL_MS` and
+  counts them. Cheap enough for production; writes `<id>.folded`, the folded
+  stack format of flamegraph.pl, speedscope and inferno.
+- `trace`: cProfile, recording every call; slows the request down several
+  times. Writes `<id>.prof`, for pstats, snakeviz or flameprof. From Python
+  3.12 cProfile runs on sys.monitoring, which allows one profiler per
+  process and records every thread: the profile then also holds whatever
+  other requests ran meanwhile, and a second trace request while one is
+  running is answered unprofiled.
+
+Both follow the work a view hands to thread pools registered with
+`metrics.track_pool()` (searches, trends, syncs and enrichment), not just
+the request's own thread.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile-Id'
+MODES = ('sample', 'trace')
+
+_active = threading.local()
+
+# cProfile on sys.monitoring: one active profiler per process, seeing all threads
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+
+class SamplingProfiler:
+    """Counts the stacks of the watched threads every `interval` seconds."""
+
+    extension = 'folded'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._threads = {threading.get_ident(): 'request'}
+        self._pools = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def watch_pool(self, executor):
+        self._pools.append(executor)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        threads = dict(self._threads)
+        for executor in self._pools:
+            threads.update((thread.ident, thread.name) for thread in list(executor._threads))
+        for ident, name in threads.items():
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                stack.append(name)
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class TracingProfiler:
+    """
+    cProfile in the request thread and around every task handed to a watched
+    pool; before Python 3.12 a profiler only sees the thread that enabled it.
+    """
+
+    extension = 'prof'
+
+    def __init__(self):
+        self._profilers = [cProfile.Profile()]
+
+    def start(self):
+        """Raises ValueError while another profiler is active (Python 3.12+)."""
+        self._profilers[0].enable()
+
+    def stop(self):
+        self._profilers[0].disable()
+
+    def watch_pool(self, executor):
+        if PROCESS_WIDE_CPROFILE:
+            # The request's profiler already records the pool's threads
+            return
+        submit = executor.submit
+
+        def profiled_submit(fn, /, *args, **kwargs):
+            return submit(self._run_task, fn, *args, **kwargs)
+
+        executor.submit = profiled_submit
+
+    def _run_task(self, fn, *args, **kwargs):
+        profiler = cProfile.Profile()
+        self._profilers.append(profiler)
+        return profiler.runcall(fn, *args, **kwargs)
+
+    def save(self, path):
+        stats = pstats.Stats(self._profilers[0])
+        for profiler in self._profilers[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    filename = '/'.join(code.co_filename.replace('\\', '/').rsplit('/', 2)[-2:])
+    return f'{code.co_qualname} ({filename}:{code.co_firstlineno})'
+
+
+def watch_pool(executor):
+    """Lets the profiler of the current request, if any, follow the work `executor` runs."""
+    profiler = getattr(_active, 'profiler', None)
+    if profiler is not None:
+        profiler.watch_pool(executor)
+
+
+def requested_mode(request):
+    """The profiler `request` asks for (and is allowed to), or None."""
+    secret = getattr(settings, 'PROFILING_SECRET', '')
+    token = request.headers.get('X-Profile')
+    if secret and token and constant_time_compare(token, secret):
+        mode = request.headers.get('X-Profile-Mode') or 'sample'
+        return mode if mode in MODES else 'sample'
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def _spool_path(profile_id, extension):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{profile_id}.{extension}')
+
+
+def _prune_spool():
+    directory = settings.PROFILING_DIR
+    entries = sorted(os.scandir(directory), key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[getattr(settings, 'PROFILING_MAX_FILES', 50):]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class ProfilingMiddleware:
+    """Profiles the requests `requested_mode()` picks and reports where the profile went."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        if mode == 'trace':
+            profiler = TracingProfiler()
+        else:
+            profiler = SamplingProfiler(getattr(settings, 'PROFILING_INTERVAL_MS', 5) / 1000)
+        try:
+            profiler.start()
+        except ValueError as e:
+            logger.warning("Not profiling %s %s: %s", request.method, request.path, e)
+            return self.get_response(request)
+        _active.profiler = profiler
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+            _active.profiler = None
+        elapsed = time.perf_counter() - started
+
+        profile_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{secrets.token_hex(4)}'
+        try:
+            profiler.save(_spool_path(profile_id, profiler.extension))
+            _prune_spool()
+        except OSError as e:
+            logger.warning("Couldn't save the profile of %s: %s", request.path, e)
+            return response
+        logger.info("Profiled %s %s (%.0f ms, %s): %s", request.method, request.path, elapsed * 1000, mode, profile_id)
+        response[HEADER] = profile_id
+        return response
@@ -0,0 +1,109 @@
+"""
+Per-request query accounting and budgets.
+
+`track_queries()` records the queries run inside it: how many, how long they
+took in total and how often each query shape repeated. An N+1 pattern shows
+up as one shape run once per row.
+
+`QueryBudgetMiddleware` tracks every request that way (the log is left on
+`request.query_log` for `api.metrics`) and logs a warning when a view runs
+more queries than its budget. The budget is declared on the view class:
+
+    class StatsView(APIView):
+        query_budget = 4
+
+Views without one get `settings.QUERY_BUDGET`; `None` means no budget.
+Budgets cover the whole request with cold caches, looking the token up
+included (see `QueryBudgetTest`).
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# `IN (%s, %s, %s)` has the same shape whatever the number of values
+_PLACEHOLDER_RUN = re.compile(r'%s(?:\s*,\s*%s)+')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def query_shape(sql):
+    """`sql` with its literal numbers and placeholder lists collapsed."""
+    return _NUMBER.sub('N', _PLACEHOLDER_RUN.sub('%s, ...', sql))
+
+
+class QueryLog:
+    """
+    `connection.execute_wrapper` that counts, times and groups queries by
+    shape. Only the queries of the thread that created it are counted: a
+    connection shared between threads (the live test server's in-memory
+    SQLite) would otherwise charge one request with its neighbours' queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.thread = threading.get_ident()
+
+    def __call__(self, execute, sql, params, many, context):
+        if threading.get_ident() != self.thread:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+            self.shapes[sql] += 1
+
+    def duplicates(self):
+        """`[(shape, times)]` of the query shapes run more than once, most repeated first."""
+        shapes = Counter()
+        for sql, times in self.shapes.items():
+            shapes[query_shape(sql)] += times
+        return [(shape, times) for shape, times in shapes.most_common() if times > 1]
+
+
+@contextmanager
+def track_queries(using=DEFAULT_DB_ALIAS):
+    """Yields a `QueryLog` of the queries run on `using` inside the block (in this thread)."""
+    log = QueryLog()
+    with connections[using].execute_wrapper(log):
+        yield log
+
+
+def view_budget(request):
+    """The query budget of the view `request` was routed to."""
+    match = request.resolver_match
+    func = match.func if match else None
+    # Plain views carry it themselves; APIView.as_view() and viewsets point at their class
+    view_class = getattr(func, 'view_class', None) or getattr(func, 'cls', None) or func
+    return getattr(view_class, 'query_budget', getattr(settings, 'QUERY_BUDGET', None))
+
+
+class QueryBudgetMiddleware:
+    """Tracks the queries of every request and logs the ones over their view's budget."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track_queries() as log:
+            request.query_log = log
+            response = self.get_response(request)
+
+        budget = view_budget(request)
+        if budget is not None and log.count > budget:
+            repeated = '; '.join(f'{times}x {shape[:120]}' for shape, times in log.duplicates()[:3])
+            logger.warning(
+                "%s %s ran %d queries (budget %d) taking %.1f ms. Repeated: %s",
+                request.method, request.path, log.count, budget, log.seconds * 1000, repeated or 'none',
+            )
+        return response
@@ -1,35 +1,173 @@
+from operator import attrgetter
+
+from django.db import models
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+from .fieldsets import Fieldset
 from .models import Media, UserMedia, Profile
 from .models import CustomList, CustomListEntry
 
-class MediaSerializer(serializers.ModelSerializer):
+# Field types whose to_representation() is a plain type conversion
+_CONVERSIONS = {
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.CharField: str,
+    serializers.URLField: str,
+}
+
+
+def _plain_reader(field):
+    """Returns `instance -> representation` for one readable field."""
+    if isinstance(field, serializers.Serializer) and _is_plain(field):
+        read = attrgetter(field.source_attrs[0]) if len(field.source_attrs) == 1 else field.get_attribute
+        build = plain_builder(field)
+
+        def read_nested(instance):
+            value = read(instance)
+            return None if value is None else build(value)
+        return read_nested
+
+    convert = _CONVERSIONS.get(type(field))
+    if convert is not None and len(field.source_attrs) == 1:
+        read = attrgetter(field.source_attrs[0])
+
+        def read_simple(instance):
+            value = read(instance)
+            return None if value is None else convert(value)
+        return read_simple
+
+    # Anything else (dates, relations, nested lists...) goes through DRF
+    def read_field(instance):
+        attribute = field.get_attribute(instance)
+        check = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        return None if check is None else field.to_representation(attribute)
+    return read_field
+
+
+def _is_plain(serializer):
+    return type(serializer).to_representation is serializers.Serializer.to_representation
+
+
+def plain_builder(serializer):
+    """
+    Returns a function turning one instance into the same dict `serializer`
+    would produce, with field lookups resolved once up front.
+    """
+    readers = [(field.field_name, _plain_reader(field)) for field in serializer._readable_fields]
+
+    def build(instance):
+        return {name: read(instance) for name, read in readers}
+    return build
+
+
+class PlainListSerializer(serializers.ListSerializer):
+    """
+    `many=True` serializer for read endpoints that return long lists: items
+    are built as plain dicts by `plain_builder()` rather than field by field
+    through DRF, which dominates response time for large libraries.
+    """
+    def to_representation(self, data):
+        if not _is_plain(self.child):
+            return super().to_representation(data)
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        build = plain_builder(self.child)
+        return [build(item) for item in iterable]
+
+
+class SparseFieldsMixin:
+    """Trims the representation to the request's `?fields=` / `?expand=` selection (see api/fieldsets.py)."""
+
+    def assign_fieldset(self, fieldset):
+        self._fieldset = fieldset
+
+    @property
+    def fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            # Only the outermost serializer reads the request; nested ones are assigned their part
+            root = self.parent if isinstance(self.parent, serializers.ListSerializer) else self
+            request = self.context.get('request') if root.parent is None else None
+            self._fieldset = Fieldset.from_request(request) if request is not None else None
+        return self._fieldset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset is None:
+            return fields
+        return self.fieldset.apply(self, fields)
+
+
+class MediaSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Media
         fields = ['id', 'primary_title', 'secondary_title', 'description', 'cover_image_url', 'media_type', 'anilist_id']
-        
-class UserMediaSerializer(serializers.ModelSerializer):
+        # Only sent in sparse responses when asked for; see /api/media/batch for details
+        expandable_fields = ['description']
+        list_serializer_class = PlainListSerializer
+
+
+class MediaDetailSerializer(serializers.ModelSerializer):
+    """Everything stored about a media item, for the batched details endpoint."""
+    class Meta:
+        model = Media
+        fields = [
+            'id', 'media_type', 'primary_title', 'secondary_title', 'description', 'cover_image_url', 'length',
+            'anilist_id', 'mal_id', 'tmdb_id', 'rawg_id', 'steam_appid', 'google_book_id', 'version',
+        ]
+        list_serializer_class = PlainListSerializer
+
+
+class UserMediaSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # We include a nested serializer to show the full media details
     media = MediaSerializer(read_only=True)
 
     class Meta:
         model = UserMedia
         fields = ['id', 'media', 'status', 'score', 'progress']
+        list_serializer_class = PlainListSerializer
 
 class ProfileOptionsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = ["keep_local_on_sync", "dark_mode", "keep_user_logged_in", "use_steam_or_rawg"]
+
+    def update(self, instance, validated_data):
+        # Writes only the options sent: the profile may come from the auth cache
+        # and be older than what another request saved meanwhile
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
         
-class CustomListEntrySerializer(serializers.ModelSerializer):
+class CustomListEntrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_media = UserMediaSerializer(read_only=True)
 
     class Meta:
         model = CustomListEntry
         fields = ['id', 'user_media', 'added_at']
+        list_serializer_class = PlainListSerializer
 
 
-class CustomListSerializer(serializers.ModelSerializer):
+class CustomListEntryChangeSerializer(serializers.ModelSerializer):
+    """Flat entry representation for the library change feed; the user_media rows travel separately."""
+    class Meta:
+        model = CustomListEntry
+        fields = ['id', 'custom_list', 'user_media', 'added_at']
+        list_serializer_class = PlainListSerializer
+
+
+class CustomListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     entries = CustomListEntrySerializer(many=True, read_only=True)
     class Meta:
         model = CustomList
-        fields = ['id', 'name', 'created_at', 'entries']
\ No newline at end of file
+        fields = ['id', 'name', 'created_at', 'entries']
+        list_serializer_class = PlainListSerializer
+
+
+class CustomListSummarySerializer(serializers.ModelSerializer):
+    """List metadata without its entries; `entry_count` comes from a queryset annotation."""
+    entry_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = CustomList
+        fields = ['id', 'name', 'created_at', 'entry_count']
+        list_serializer_class = PlainListSerializer
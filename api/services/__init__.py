@@ -0,0 +1,40 @@
+"""
+Clients for the provider APIs (AniList, MyAnimeList, TMDB, Steam, RAWG and
+Google Books).
+
+Between them they pull in requests, gql and graphql-core, which take longer to
+import than the rest of the backend. `from api.services import tmdb_service`
+hands out a lazy stand-in for the module that imports it on first attribute
+access, so startup doesn't pay for providers until one is used. The stand-in
+forwards attribute writes too, so `mock.patch('api.views.tmdb_service.search_movies')`
+patches the real module.
+
+Loading a module also instruments its public functions, so their latency,
+failures and retries show up in `/api/metrics` (see api/metrics.py).
+"""
+from importlib import import_module
+
+from django.utils.functional import SimpleLazyObject
+
+from .. import metrics
+
+SERVICES = [
+    'anilist_service',
+    'google_books_service',
+    'mal_service',
+    'rawg_service',
+    'steam_service',
+    'tmdb_service',
+]
+
+_lazy_modules = {}
+
+
+def __getattr__(name):
+    if name not in SERVICES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name not in _lazy_modules:
+        _lazy_modules[name] = SimpleLazyObject(
+            lambda: metrics.instrument_provider(import_module(f'{__name__}.{name}'))
+        )
+    return _lazy_modules[name]
@@ -5,8 +5,6 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from django.conf import settings
 
-ANILIST_API_URL = "https://graphql.anilist.co"
-
 def _get_resilient_session():
     """Creates and returns a requests.Session with a retry strategy."""
     session = requests.Session()
@@ -18,6 +16,7 @@ def _get_resilient_session():
     )
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("https://", adapter)
+    session.mount("http://", adapter)
     return session
 
 class ResilientRequestsHTTPTransport(RequestsHTTPTransport):
@@ -31,7 +30,7 @@ class ResilientRequestsHTTPTransport(RequestsHTTPTransport):
         super().__init__(*args, **kwargs)
 
 def search_anime(query_string):
-    transport = ResilientRequestsHTTPTransport(url=ANILIST_API_URL)
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL)
     
     client = Client(transport=transport, fetch_schema_from_transport=False)
     
@@ -39,7 +38,7 @@ def search_anime(query_string):
         query ($search: String) {
             Page(page: 1, perPage: 5) {
                 media(search: $search, type: ANIME, sort: SEARCH_MATCH) {
-                    id,
+                    id, idMal,
                     title { romaji, english },
                     coverImage { large }
                 }
@@ -53,7 +52,7 @@ def search_anime(query_string):
 def get_viewer_profile(access_token):
     headers = {'Authorization': f'Bearer {access_token}'}
 
-    transport = ResilientRequestsHTTPTransport(url=ANILIST_API_URL, headers=headers)
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL, headers=headers)
 
     client = Client(transport=transport, fetch_schema_from_transport=False)
     
@@ -80,7 +79,7 @@ def exchange_code_for_token(auth_code):
 def fetch_full_user_list(access_token):
     headers = {'Authorization': f'Bearer {access_token}'}
 
-    transport = ResilientRequestsHTTPTransport(url=ANILIST_API_URL, headers=headers)
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL, headers=headers)
 
     client = Client(transport=transport, fetch_schema_from_transport=False)
     
@@ -94,7 +93,7 @@ def fetch_full_user_list(access_token):
                 mediaList (userName: $userName, type: ANIME) {
                     status, score, progress,
                     media { 
-                        id,
+                        id, idMal,
                         title { romaji, english },
                         coverImage { large } 
                     }
@@ -114,17 +113,58 @@ def fetch_full_user_list(access_token):
         page += 1
     return all_entries
 
+def get_media_by_ids(media_ids):
+    """Fetches descriptions and lengths for up to 50 AniList media ids in one request."""
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL)
+    client = Client(transport=transport, fetch_schema_from_transport=False)
+
+    query = gql('''
+        query ($ids: [Int]) {
+            Page(page: 1, perPage: 50) {
+                media(id_in: $ids) {
+                    id, idMal, type,
+                    description(asHtml: false),
+                    duration, episodes, chapters
+                }
+            }
+        }
+    ''')
+    result = client.execute(query, variable_values={"ids": list(media_ids)[:50]})
+    return result.get('Page', {}).get('media', [])
+
+def get_media_by_mal_ids(mal_ids, media_type):
+    """
+    Like `get_media_by_ids()`, for up to 50 MyAnimeList ids of one media
+    type ('ANIME' or 'MANGA': MyAnimeList numbers them separately).
+    """
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL)
+    client = Client(transport=transport, fetch_schema_from_transport=False)
+
+    query = gql('''
+        query ($ids: [Int], $type: MediaType) {
+            Page(page: 1, perPage: 50) {
+                media(idMal_in: $ids, type: $type) {
+                    id, idMal, type,
+                    description(asHtml: false),
+                    duration, episodes, chapters
+                }
+            }
+        }
+    ''')
+    result = client.execute(query, variable_values={"ids": list(mal_ids)[:50], "type": media_type})
+    return result.get('Page', {}).get('media', [])
+
 #-------------manga---------------
 def search_manga(query_string):
     
-    transport = ResilientRequestsHTTPTransport(url=ANILIST_API_URL)
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL)
     client = Client(transport=transport, fetch_schema_from_transport=False)
     
     query = gql('''
         query ($search: String) {
             Page(page: 1, perPage: 5) {
                 media(search: $search, type: MANGA, sort: SEARCH_MATCH) { # <-- Changed to MANGA
-                    id
+                    id, idMal
                     title { romaji, english }
                     coverImage { large }
                 }
@@ -139,7 +179,7 @@ def fetch_full_user_manga_list(access_token):
     """
     Fetches all entries from a user's MANGA list, handling pagination.
     """
-    transport = ResilientRequestsHTTPTransport(url=ANILIST_API_URL)
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL)
     client = Client(transport=transport, fetch_schema_from_transport=False) 
        
     viewer_profile = get_viewer_profile(access_token)
@@ -152,7 +192,7 @@ def fetch_full_user_manga_list(access_token):
                 mediaList (userName: $userName, type: MANGA) {
                     status, score, progress,
                     media { 
-                    id,
+                    id, idMal,
                     title { romaji, english },
                     coverImage { large } 
                     }
@@ -174,7 +214,7 @@ def fetch_full_user_manga_list(access_token):
 
 #-------- Trends --------------
 def get_trending_anime():
-    transport = ResilientRequestsHTTPTransport(url=ANILIST_API_URL)
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL)
     client = Client(transport=transport, fetch_schema_from_transport=False) 
     query = gql(''' { Page(page: 1, perPage: 15) { 
                 media(sort: TRENDING_DESC, type: ANIME) { 
@@ -187,7 +227,7 @@ def get_trending_anime():
     return result.get('Page', {}).get('media', [])
 
 def get_trending_manga():
-    transport = ResilientRequestsHTTPTransport(url=ANILIST_API_URL)
+    transport = ResilientRequestsHTTPTransport(url=settings.ANILIST_API_URL)
     client = Client(transport=transport, fetch_schema_from_transport=False) 
     query = gql(''' { Page(page: 1, perPage: 15) 
                 { media(sort: TRENDING_DESC, type: MANGA) { 
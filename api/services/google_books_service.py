@@ -1,31 +1,41 @@
+import logging
 import requests
 import os
 from dotenv import load_dotenv
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 GOOGLE_BOOKS_API_KEY = os.getenv('GOOGLE_BOOKS_API_KEY')
-GOOGLE_BOOKS_API_URL = 'https://www.googleapis.com/books/v1/volumes'
 
 def search_books(query):
     if not GOOGLE_BOOKS_API_KEY:
-        print("ERROR: GOOGLE_BOOKS_API_KEY was not loaded in the service.")
+        logger.error("GOOGLE_BOOKS_API_KEY was not loaded in the service.")
         return []
 
     params = {'q': query, 'key': GOOGLE_BOOKS_API_KEY}
     try:
         # We don't need a resilient session here as Google is very stable
-        response = requests.get(GOOGLE_BOOKS_API_URL, params=params)
+        response = requests.get(settings.GOOGLE_BOOKS_API_URL, params=params)
         response.raise_for_status()
         return response.json().get('items', [])
     except requests.exceptions.RequestException as e:
         # Print the status code if available
         if e.response is not None:
-            print(f"Google Books API error: {e.response.status_code} - {e.response.text}")
+            logger.warning("Google Books API error: %s - %s", e.response.status_code, e.response.text)
         else:
-            print(f"Google Books API error: {e}")
+            logger.warning("Google Books API error: %s", e)
         return []
     
+def get_volume(volume_id):
+    """Gets a single volume by its Google Books id."""
+    params = {'key': GOOGLE_BOOKS_API_KEY} if GOOGLE_BOOKS_API_KEY else {}
+    response = requests.get(f"{settings.GOOGLE_BOOKS_API_URL}/{volume_id}", params=params, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
 def get_newest_books():
     params = {
         'q': 'subject:fiction',
@@ -35,11 +45,11 @@ def get_newest_books():
     }
 
     if not GOOGLE_BOOKS_API_KEY:
-        print("ERROR: GOOGLE_BOOKS_API_KEY was not loaded in the service.")
+        logger.error("GOOGLE_BOOKS_API_KEY was not loaded in the service.")
         return []
 
     try:
-        resp = requests.get(GOOGLE_BOOKS_API_URL, params=params, timeout=10)
+        resp = requests.get(settings.GOOGLE_BOOKS_API_URL, params=params, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         items = data.get('items', [])
@@ -49,7 +59,7 @@ def get_newest_books():
         return []
     except requests.exceptions.RequestException as e:
         if e.response is not None:
-            print(f"Google Books API error: {e.response.status_code} - {e.response.text}")
+            logger.warning("Google Books API error: %s - %s", e.response.status_code, e.response.text)
         else:
-            print(f"Google Books API error: {e}")
+            logger.warning("Google Books API error: %s", e)
         return []
\ No newline at end of file
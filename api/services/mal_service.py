@@ -1,3 +1,4 @@
+import logging
 import requests
 import secrets
 import hashlib
@@ -7,7 +8,8 @@ from django.conf import settings
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-API_URL = "https://api.myanimelist.net/v2"
+logger = logging.getLogger(__name__)
+
 AUTH_URL = "https://myanimelist.net/v1/oauth2/authorize"
 TOKEN_URL = "https://myanimelist.net/v1/oauth2/token"
 
@@ -22,6 +24,7 @@ def _get_resilient_session():
     )
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("https://", adapter)
+    session.mount("http://", adapter)
     return session
 
 def generate_pkce_codes():
@@ -76,9 +79,8 @@ def exchange_code_for_token(code, code_verifier):
     mal_client_secret = getattr(settings, 'MAL_CLIENT_SECRET', None)
     if mal_client_secret:
         payload["client_secret"] = mal_client_secret
-    print("MAL token exchange payload:", payload)
     response = session.post(TOKEN_URL, data=payload, timeout=10)
-    print("MAL token response:", response.status_code, response.text)
+    logger.debug("MAL token response: %s %s", response.status_code, response.text)
     response.raise_for_status()
     return response.json()
 
@@ -86,7 +88,7 @@ def get_user_info(access_token):
     """Fetches the authenticated user's profile information."""
     session = _get_resilient_session()
     headers = {"Authorization": f"Bearer {access_token}"}
-    response = session.get(f"{API_URL}/users/@me", headers=headers)
+    response = session.get(f"{settings.MAL_API_URL}/users/@me", headers=headers)
     response.raise_for_status()
     return response.json()
 
@@ -95,7 +97,7 @@ def fetch_user_list(access_token, media_type):
     session = _get_resilient_session()
     list_type = "animelist" if media_type == "ANIME" else "mangalist"
     
-    url = f"{API_URL}/users/@me/{list_type}"
+    url = f"{settings.MAL_API_URL}/users/@me/{list_type}"
     headers = {"Authorization": f"Bearer {access_token}"}
     
     # Request all relevant fields
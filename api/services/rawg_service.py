@@ -1,10 +1,13 @@
+import logging
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import os
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 RAWG_API_KEY = os.getenv('RAWG_API_KEY')
-RAWG_API_URL = 'https://api.rawg.io/api'
 
 def _get_resilient_session():
     """Creates a requests session with automatic retries."""
@@ -12,16 +15,17 @@ def _get_resilient_session():
     retry_strategy = Retry(total=3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"], backoff_factor=1)
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("https://", adapter)
+    session.mount("http://", adapter)
     return session
 
 def search_games(query):
     """Searches for games on RAWG."""
     if not RAWG_API_KEY:
-        print("RAWG_API_KEY is not set.")
+        logger.error("RAWG_API_KEY is not set.")
         return []
 
     session = _get_resilient_session()
-    search_url = f"{RAWG_API_URL}/games"
+    search_url = f"{settings.RAWG_API_URL}/games"
     params = {
         'key': RAWG_API_KEY,
         'search': query
@@ -31,9 +35,20 @@ def search_games(query):
         response.raise_for_status()
         return response.json().get('results', [])
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while calling RAWG API: {e}")
+        logger.warning("An error occurred while calling RAWG API: %s", e)
         return []
 
+def get_game_details(game_id):
+    """Gets the full RAWG record of a game."""
+    if not RAWG_API_KEY:
+        logger.error("RAWG_API_KEY is not set.")
+        return None
+
+    session = _get_resilient_session()
+    response = session.get(f"{settings.RAWG_API_URL}/games/{game_id}", params={'key': RAWG_API_KEY}, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
 def get_popular_games():
     """Return new & trending games from RAWG.
 
@@ -44,7 +59,7 @@ def get_popular_games():
     titles.
     """
     if not RAWG_API_KEY:
-        print("RAWG_API_KEY is not set.")
+        logger.error("RAWG_API_KEY is not set.")
         return []
 
 
@@ -52,7 +67,7 @@ def get_popular_games():
 
 
     session = _get_resilient_session()
-    url = f"{RAWG_API_URL}/games"
+    url = f"{settings.RAWG_API_URL}/games"
 
 
     # Look back ~90 days to surface new/recent titles
@@ -91,5 +106,5 @@ def get_popular_games():
 
         return normalized
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while calling RAWG API: {e}")
+        logger.warning("An error occurred while calling RAWG API: %s", e)
         return []
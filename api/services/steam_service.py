@@ -1,12 +1,14 @@
+import logging
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import os
 from typing import Dict, List, Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 STEAM_API_KEY = os.getenv('STEAM_API_KEY')
-STEAM_API_URL = 'https://api.steampowered.com'
-STEAM_STORE_URL = 'https://store.steampowered.com/api'
 
 def get_steam_id_from_username(username: str) -> Optional[str]:
     """Convert Steam username/vanity URL to Steam ID."""
@@ -14,7 +16,7 @@ def get_steam_id_from_username(username: str) -> Optional[str]:
         raise ValueError("Steam API key not configured")
         
     session = _get_resilient_session()
-    url = f"{STEAM_API_URL}/ISteamUser/ResolveVanityURL/v1/"
+    url = f"{settings.STEAM_API_URL}/ISteamUser/ResolveVanityURL/v1/"
     
     try:
         response = session.get(url, params={
@@ -28,7 +30,7 @@ def get_steam_id_from_username(username: str) -> Optional[str]:
             return data['response']['steamid']
         return None
     except Exception as e:
-        print(f"Error resolving Steam vanity URL: {e}")
+        logger.warning("Error resolving Steam vanity URL: %s", e)
         return None
 
 def get_user_library(steam_id: str) -> List[Dict]:
@@ -37,7 +39,7 @@ def get_user_library(steam_id: str) -> List[Dict]:
         raise ValueError("Steam API key not configured")
         
     session = _get_resilient_session()
-    url = f"{STEAM_API_URL}/IPlayerService/GetOwnedGames/v1/"
+    url = f"{settings.STEAM_API_URL}/IPlayerService/GetOwnedGames/v1/"
     
     try:
         response = session.get(url, params={
@@ -60,7 +62,7 @@ def get_user_library(steam_id: str) -> List[Dict]:
             # Get additional game details from store API
             try:
                 details_response = session.get(
-                    f"{STEAM_STORE_URL}/appdetails",
+                    f"{settings.STEAM_STORE_URL}/appdetails",
                     params={'appids': game['appid'], 'cc': 'us', 'l': 'english'}
                 )
                 details_response.raise_for_status()
@@ -76,7 +78,7 @@ def get_user_library(steam_id: str) -> List[Dict]:
                         'description': app_data.get('short_description', '')
                     })
             except Exception as e:
-                print(f"Error fetching details for game {game['appid']}: {e}")
+                logger.warning("Error fetching details for game %s: %s", game['appid'], e)
                 # Add basic info even if detailed fetch fails
                 games.append({
                     'appid': game['appid'],
@@ -88,15 +90,29 @@ def get_user_library(steam_id: str) -> List[Dict]:
                 
         return games
     except Exception as e:
-        print(f"Error fetching Steam library: {e}")
+        logger.warning("Error fetching Steam library: %s", e)
         return []
 
+def get_app_details(appid) -> Optional[Dict]:
+    """Get the store page data of a single app, or None if Steam has none."""
+    session = _get_resilient_session()
+    response = session.get(
+        f"{settings.STEAM_STORE_URL}/appdetails",
+        params={'appids': appid, 'cc': 'us', 'l': 'english'},
+        timeout=10,
+    )
+    response.raise_for_status()
+    details = response.json() or {}
+    entry = details.get(str(appid), {})
+    return entry.get('data') if entry.get('success') else None
+
 def _get_resilient_session():
     """Creates a requests session with automatic retries."""
     session = requests.Session()
     retry_strategy = Retry(total=3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"], backoff_factor=1)
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("https://", adapter)
+    session.mount("http://", adapter)
     return session
 
 def get_user_profile(steam_id: str):
@@ -105,7 +121,7 @@ def get_user_profile(steam_id: str):
         raise ValueError("Steam API key not configured")
     
     session = _get_resilient_session()
-    url = f"{STEAM_API_URL}/ISteamUser/GetPlayerSummaries/v2/"
+    url = f"{settings.STEAM_API_URL}/ISteamUser/GetPlayerSummaries/v2/"
     
     try:
         response = session.get(url, params={
@@ -119,7 +135,7 @@ def get_user_profile(steam_id: str):
             return data['response']['players'][0]
         return None
     except Exception as e:
-        print(f"Error fetching Steam profile: {e}")
+        logger.warning("Error fetching Steam profile: %s", e)
         return None
 
 def search_games(query):
@@ -128,7 +144,7 @@ def search_games(query):
         return []
 
     session = _get_resilient_session()
-    search_url = f"{STEAM_STORE_URL}/storesearch/"
+    search_url = f"{settings.STEAM_STORE_URL}/storesearch/"
     params = {
         'term': query,
         'cc': 'us',
@@ -142,7 +158,7 @@ def search_games(query):
         data = response.json()
         
         if 'items' not in data:
-            print(f"No results found for query: {query}")
+            logger.debug("No results found for query: %s", query)
             return []
             
         # Filter out non-game items and ensure required fields exist
@@ -154,16 +170,16 @@ def search_games(query):
                 item.get('tiny_image')):        # Ensure image exists
                 games.append(item)
         
-        print(f"Found {len(games)} valid games from Steam search for '{query}'")
+        logger.debug("Found %d valid games from Steam search for %r", len(games), query)
         return games[:10]  # Return max 10 results
         
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while calling Steam API: {e}")
+        logger.warning("An error occurred while calling Steam API: %s", e)
         if 'response' in locals():
-            print(f"Response content: {response.text}")
+            logger.warning("Response content: %s", response.text)
         return []
     except Exception as e:
-        print(f"Unexpected error searching Steam games: {str(e)}")
+        logger.exception("Unexpected error searching Steam games: %s", e)
         return []
 
 def get_popular_games():
@@ -173,13 +189,13 @@ def get_popular_games():
     try:
         # First, get list of top selling apps
         response = session.get(
-            f"{STEAM_API_URL}/ISteamChartsService/GetMostPlayedGames/v1/"
+            f"{settings.STEAM_API_URL}/ISteamChartsService/GetMostPlayedGames/v1/"
         )
         response.raise_for_status()
         data = response.json()
         
         if 'response' not in data or 'ranks' not in data['response']:
-            print("No trending games found in Steam response")
+            logger.warning("No trending games found in Steam response")
             return []
         
         # Get appids of top 15 games
@@ -188,7 +204,7 @@ def get_popular_games():
             return []
 
         # Get details for these games from store API
-        app_details_url = f"{STEAM_STORE_URL}/appdetails"
+        app_details_url = f"{settings.STEAM_STORE_URL}/appdetails"
         games = []
         
         for appid in top_appids:
@@ -209,17 +225,17 @@ def get_popular_games():
                             'header_image': app_data.get('header_image', '')
                         })
             except Exception as e:
-                print(f"Error fetching details for game {appid}: {str(e)}")
+                logger.warning("Error fetching details for game %s: %s", appid, e)
                 continue
                 
-        print(f"Found {len(games)} valid trending games")
+        logger.debug("Found %d valid trending games", len(games))
         return games
         
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching popular games from Steam: {e}")
+        logger.warning("Error fetching popular games from Steam: %s", e)
         if 'response' in locals():
-            print(f"Response content: {response.text}")
+            logger.warning("Response content: %s", response.text)
         return []
     except Exception as e:
-        print(f"Unexpected error getting popular games: {str(e)}")
+        logger.exception("Unexpected error getting popular games: %s", e)
         return []
\ No newline at end of file
@@ -1,10 +1,13 @@
+import logging
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import os
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 TMDB_API_KEY = os.getenv('TMDB_API_KEY')
-TMDB_API_URL = 'https://api.themoviedb.org/3'
 
 def _get_resilient_session():
     """Creates a requests session with automatic retries."""
@@ -17,12 +20,13 @@ def _get_resilient_session():
     )
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("https://", adapter)
+    session.mount("http://", adapter)
     return session
 
 def search_movies(query):
     """Searches for movies on TMDB in English using a resilient session."""
     session = _get_resilient_session()
-    search_url = f"{TMDB_API_URL}/search/movie"
+    search_url = f"{settings.TMDB_API_URL}/search/movie"
     params = {
         'api_key': TMDB_API_KEY,
         'query': query,
@@ -33,13 +37,13 @@ def search_movies(query):
         response.raise_for_status()
         return response.json().get('results', []) # Return empty list on failure
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while calling TMDB API: {e}")
+        logger.warning("An error occurred while calling TMDB API: %s", e)
         return [] # Return an empty list to prevent crashes
 
 def search_tv_shows(query):
     """Searches for non-anime TV shows on TMDB in English using a resilient session."""
     session = _get_resilient_session()
-    search_url = f"{TMDB_API_URL}/search/tv"
+    search_url = f"{settings.TMDB_API_URL}/search/tv"
     params = {
         'api_key': TMDB_API_KEY,
         'query': query,
@@ -50,12 +54,22 @@ def search_tv_shows(query):
         response.raise_for_status()
         return response.json().get('results', []) # Return empty list on failure
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while calling TMDB API: {e}")
+        logger.warning("An error occurred while calling TMDB API: %s", e)
         return [] # Return an empty list to prevent crashes
     
+def get_details(tmdb_id, media_type):
+    """Gets the full record of a movie (`media_type` 'MOVIE') or TV show ('TV_SHOW')."""
+    session = _get_resilient_session()
+    kind = 'movie' if media_type == 'MOVIE' else 'tv'
+    url = f"{settings.TMDB_API_URL}/{kind}/{tmdb_id}"
+    params = {'api_key': TMDB_API_KEY, 'language': 'en-US'}
+    response = session.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
 def create_request_token():
     """Step 1 of TMDB auth: Get a temporary request token."""
-    url = f"{TMDB_API_URL}/authentication/token/new"
+    url = f"{settings.TMDB_API_URL}/authentication/token/new"
     params = {'api_key': TMDB_API_KEY}
     response = requests.get(url, params=params)
     response.raise_for_status()
@@ -63,7 +77,7 @@ def create_request_token():
 
 def create_session_id(request_token):
     """Step 3 of TMDB auth: Exchange an approved token for a session_id."""
-    url = f"{TMDB_API_URL}/authentication/session/new"
+    url = f"{settings.TMDB_API_URL}/authentication/session/new"
     params = {'api_key': TMDB_API_KEY}
     json_body = {'request_token': request_token}
     response = requests.post(url, params=params, json=json_body)
@@ -73,7 +87,7 @@ def create_session_id(request_token):
 def get_account_details(session_id):
     """Gets the TMDB account details to find the account_id."""
     session = _get_resilient_session()
-    url = f"{TMDB_API_URL}/account"
+    url = f"{settings.TMDB_API_URL}/account"
     params = {'api_key': TMDB_API_KEY, 'session_id': session_id}
     response = session.get(url, params=params)
     response.raise_for_status()
@@ -82,7 +96,7 @@ def get_account_details(session_id):
 def get_movie_watchlist(account_id, session_id):
     """Gets a user's movie watchlist."""
     session = _get_resilient_session()
-    url = f"{TMDB_API_URL}/account/{account_id}/watchlist/movies"
+    url = f"{settings.TMDB_API_URL}/account/{account_id}/watchlist/movies"
     params = {'api_key': TMDB_API_KEY, 'session_id': session_id, 'language': 'en-US'}
     response = session.get(url, params=params)
     response.raise_for_status()
@@ -91,7 +105,7 @@ def get_movie_watchlist(account_id, session_id):
 def get_tv_watchlist(account_id, session_id):
     """Gets a user's TV show watchlist."""
     session = _get_resilient_session()
-    url = f"{TMDB_API_URL}/account/{account_id}/watchlist/tv"
+    url = f"{settings.TMDB_API_URL}/account/{account_id}/watchlist/tv"
     params = {'api_key': TMDB_API_KEY, 'session_id': session_id, 'language': 'en-US'}
     response = session.get(url, params=params)
     response.raise_for_status()
@@ -100,7 +114,7 @@ def get_tv_watchlist(account_id, session_id):
 def get_rated_movies(account_id, session_id):
     """Gets a user's rated movies."""
     session = _get_resilient_session()
-    url = f"{TMDB_API_URL}/account/{account_id}/rated/movies"
+    url = f"{settings.TMDB_API_URL}/account/{account_id}/rated/movies"
     params = {'api_key': TMDB_API_KEY, 'session_id': session_id, 'language': 'en-US'}
     response = session.get(url, params=params)
     response.raise_for_status()
@@ -109,7 +123,7 @@ def get_rated_movies(account_id, session_id):
 def get_rated_tv(account_id, session_id):
     """Gets a user's rated TV shows."""
     session = _get_resilient_session()
-    url = f"{TMDB_API_URL}/account/{account_id}/rated/tv"
+    url = f"{settings.TMDB_API_URL}/account/{account_id}/rated/tv"
     params = {'api_key': TMDB_API_KEY, 'session_id': session_id, 'language': 'en-US'}
     response = session.get(url, params=params)
     response.raise_for_status()
@@ -117,7 +131,7 @@ def get_rated_tv(account_id, session_id):
 
 def get_trending_movies():
     session = _get_resilient_session()
-    url = f"{TMDB_API_URL}/trending/movie/week"
+    url = f"{settings.TMDB_API_URL}/trending/movie/week"
     params = {'api_key': TMDB_API_KEY, 'language': 'en-US'}
     response = session.get(url, params=params)
     response.raise_for_status()
@@ -125,7 +139,7 @@ def get_trending_movies():
 
 def get_trending_tv():
     session = _get_resilient_session()
-    url = f"{TMDB_API_URL}/trending/tv/week"
+    url = f"{settings.TMDB_API_URL}/trending/tv/week"
     params = {'api_key': TMDB_API_KEY, 'language': 'en-US'}
     response = session.get(url, params=params)
     response.raise_for_status()
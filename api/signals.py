@@ -0,0 +1,198 @@
+"""
+Model signal handlers, connected in `ApiConfig.ready()`.
+"""
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import enrichment, identity, stats, title_index
+from .authentication import auth_cache
+from .caching import mark_library_changed
+from .changes import allocate_change_seq, record_tombstones
+from .library import media_changed, signals_suppressed
+from .models import CustomList, CustomListEntry, LibraryTombstone, Media, Profile, UserMedia
+
+
+def _skip_library_bookkeeping(kwargs):
+    """
+    True inside bulk library writes, and when a delete cascades from the user
+    or profile itself so there is no library left to track.
+    """
+    if signals_suppressed():
+        # Bulk writes in api.library do the bookkeeping for the whole batch
+        return True
+    origin = kwargs.get('origin')
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (User, Profile)
+
+
+@receiver(pre_save, sender=UserMedia)
+def remember_previous_stats_contribution(sender, instance, **kwargs):
+    """Captures the stored row before it is overwritten so its old stats contribution can be removed."""
+    instance._previous_stats_row = None
+    if not stats.summary_table_enabled() or instance.pk is None or signals_suppressed():
+        return
+    instance._previous_stats_row = (
+        UserMedia.objects.filter(pk=instance.pk)
+        .values('media__media_type', 'media__length', 'status', 'score', 'progress')
+        .first()
+    )
+
+
+@receiver(post_save, sender=UserMedia)
+def update_stats_on_save(sender, instance, **kwargs):
+    if not stats.summary_table_enabled() or signals_suppressed():
+        return
+    previous = getattr(instance, '_previous_stats_row', None)
+    if previous:
+        stats.apply_contribution(
+            instance.profile_id, previous['media__media_type'],
+            stats.contribution(previous['media__media_type'], previous['status'], previous['score'],
+                               previous['progress'], previous['media__length']),
+            sign=-1,
+        )
+    media_type, length = (
+        Media.objects.filter(pk=instance.media_id).values_list('media_type', 'length').first() or (None, None)
+    )
+    stats.apply_contribution(
+        instance.profile_id, media_type,
+        stats.contribution(media_type, instance.status, instance.score, instance.progress, length),
+    )
+
+
+@receiver(post_delete, sender=UserMedia)
+def update_stats_on_delete(sender, instance, **kwargs):
+    if not stats.summary_table_enabled() or _skip_library_bookkeeping(kwargs):
+        return
+    media_type, length = (
+        Media.objects.filter(pk=instance.media_id).values_list('media_type', 'length').first() or (None, None)
+    )
+    stats.apply_contribution(
+        instance.profile_id, media_type,
+        stats.contribution(media_type, instance.status, instance.score, instance.progress, length),
+        sign=-1,
+    )
+
+
+@receiver(pre_save, sender=Media)
+def remember_previous_media_shape(sender, instance, raw=False, **kwargs):
+    """Captures the stored length and media type, which every owner's buckets are computed from."""
+    instance._previous_stats_shape = None
+    if not stats.summary_table_enabled() or instance.pk is None or raw:
+        return
+    instance._previous_stats_shape = (
+        Media.objects.filter(pk=instance.pk).values_list('media_type', 'length').first()
+    )
+
+
+@receiver(post_save, sender=Media)
+def rebuild_stats_on_media_shape_change(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_stats_shape', None)
+    if previous and previous != (instance.media_type, instance.length):
+        stats.rebuild_owner_stats([instance.pk])
+
+
+# ------------------------------------------------------------------------------
+# Library version bumps (cache / ETag invalidation). UserMedia and
+# CustomListEntry writes bump it through their change sequence below.
+# ------------------------------------------------------------------------------
+
+def _profile_id_for_user(user_id):
+    return Profile.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+
+
+def _profile_id_for_custom_list(custom_list_id):
+    return Profile.objects.filter(user__custom_lists=custom_list_id).values_list('pk', flat=True).first()
+
+
+@receiver(post_save, sender=CustomList)
+@receiver(post_delete, sender=CustomList)
+def bump_version_on_custom_list_change(sender, instance, **kwargs):
+    if _skip_library_bookkeeping(kwargs):
+        return
+    mark_library_changed(_profile_id_for_user(instance.user_id))
+
+
+@receiver(post_save, sender=Media)
+def bump_version_on_media_update(sender, instance, created, **kwargs):
+    if created:
+        return
+    media_changed([instance.pk])
+
+
+@receiver(post_save, sender=Media)
+def queue_new_media_for_enrichment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        enrichment.notify()
+
+
+@receiver(post_save, sender=Media)
+def index_media_identities(sender, instance, raw=False, **kwargs):
+    if not raw:
+        identity.index_media([instance])
+
+
+@receiver(post_save, sender=Media)
+def index_media_titles(sender, instance, raw=False, **kwargs):
+    if not raw:
+        title_index.update([instance])
+
+
+@receiver(post_delete, sender=Media)
+def unindex_media_titles(sender, instance, **kwargs):
+    title_index.remove([instance.pk])
+
+
+# ------------------------------------------------------------------------------
+# Change sequence stamps and tombstones (client-side library mirroring)
+# ------------------------------------------------------------------------------
+
+@receiver(pre_save, sender=UserMedia)
+def stamp_user_media_change(sender, instance, **kwargs):
+    if signals_suppressed():
+        return
+    instance.change_seq = allocate_change_seq(instance.profile_id)
+
+
+@receiver(pre_save, sender=CustomListEntry)
+def stamp_custom_list_entry_change(sender, instance, **kwargs):
+    if signals_suppressed():
+        return
+    profile_id = _profile_id_for_custom_list(instance.custom_list_id)
+    if profile_id is not None:
+        instance.change_seq = allocate_change_seq(profile_id)
+
+
+@receiver(post_delete, sender=UserMedia)
+def tombstone_user_media(sender, instance, **kwargs):
+    if _skip_library_bookkeeping(kwargs):
+        return
+    record_tombstones(instance.profile_id, LibraryTombstone.USER_MEDIA, [instance.pk])
+
+
+@receiver(post_delete, sender=CustomListEntry)
+def tombstone_custom_list_entry(sender, instance, **kwargs):
+    if _skip_library_bookkeeping(kwargs):
+        return
+    profile_id = _profile_id_for_custom_list(instance.custom_list_id)
+    if profile_id is not None:
+        record_tombstones(profile_id, LibraryTombstone.CUSTOM_LIST_ENTRY, [instance.pk])
+
+
+# ------------------------------------------------------------------------------
+# Authentication cache invalidation
+# ------------------------------------------------------------------------------
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    auth_cache.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=User)
+def evict_changed_user(sender, instance, **kwargs):
+    auth_cache.invalidate_user(instance.user_id if sender is Profile else instance.pk)
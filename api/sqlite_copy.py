@@ -0,0 +1,122 @@
+"""
+Copies every row of a SQLite database file into the configured database,
+typically when a deployment moves from SQLite to PostgreSQL
+(`python manage.py copy_sqlite db.sqlite3`).
+
+Both databases must be migrated to the current code first. Rows are streamed
+table by table in primary key order: read in chunks from SQLite and written
+with PostgreSQL's `COPY ... FROM STDIN` (bulk inserts on other backends),
+so memory use stays flat whatever the size of the file. Everything is
+written in one transaction; foreign keys are only checked at commit, so the
+order of the tables doesn't matter.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import startup
+from .models import Media
+
+logger = logging.getLogger(__name__)
+
+SOURCE_ALIAS = 'sqlite_source'
+DEFAULT_BATCH_SIZE = 2000
+
+
+class CopyError(Exception):
+    pass
+
+
+def register_sqlite(path, alias=SOURCE_ALIAS):
+    """Makes the SQLite file at `path` available as database `alias`."""
+    # configure_settings() fills in the defaults Django expects of a database
+    connections.settings[alias] = connections.configure_settings({
+        DEFAULT_DB_ALIAS: {},
+        alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path)},
+    })[alias]
+    return alias
+
+
+def copied_models():
+    """Models with a table of their own, including many-to-many tables."""
+    return [
+        model for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy and not model._meta.swapped
+    ]
+
+
+def _has_user_data(using):
+    user_model = apps.get_model('auth', 'User')
+    return user_model.objects.using(using).exists() or Media.objects.using(using).exists()
+
+
+def _write_copy(connection, model, columns, rows):
+    """Streams `rows` into `model`'s table with PostgreSQL's COPY."""
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(column) for column in columns]
+    sql = f"COPY {quote(model._meta.db_table)} ({', '.join(quote(f.column) for f in fields)}) FROM STDIN"
+    written = 0
+    with connection.cursor() as cursor, cursor.copy(sql) as copy:
+        for row in rows:
+            copy.write_row([field.get_db_prep_save(value, connection) for field, value in zip(fields, row)])
+            written += 1
+    return written
+
+
+def _write_bulk(using, model, columns, rows, batch_size):
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(model(**dict(zip(columns, row))))
+        if len(batch) == batch_size:
+            model._base_manager.using(using).bulk_create(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        model._base_manager.using(using).bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def copy_database(source, target=DEFAULT_DB_ALIAS, batch_size=DEFAULT_BATCH_SIZE, replace=False):
+    """
+    Copies all rows from database `source` into `target`, replacing
+    whatever `target` holds (after `migrate` that is only content types and
+    permissions; with user data in it `replace` must be set). Returns
+    `{table: rows}`.
+    """
+    for alias in (source, target):
+        if not startup.migrations_up_to_date(alias):
+            raise CopyError(f"Database {alias!r} is missing migrations; run `manage.py migrate` on it first.")
+    if _has_user_data(target) and not replace:
+        raise CopyError(f"Database {target!r} already holds users or media; pass replace=True to overwrite them.")
+
+    connection = connections[target]
+    models = copied_models()
+    copied = {}
+    with transaction.atomic(using=target):
+        tables = [model._meta.db_table for model in models]
+        connection.ops.execute_sql_flush(
+            connection.ops.sql_flush(no_style(), tables, reset_sequences=False, allow_cascade=True)
+        )
+        for model in models:
+            started = time.monotonic()
+            columns = [field.attname for field in model._meta.concrete_fields]
+            rows = model._base_manager.using(source).order_by('pk').values_list(*columns).iterator(
+                chunk_size=batch_size
+            )
+            if connection.vendor == 'postgresql':
+                written = _write_copy(connection, model, columns, rows)
+            else:
+                written = _write_bulk(target, model, columns, rows, batch_size)
+            copied[model._meta.db_table] = written
+            logger.info("Copied %d rows of %s in %.1fs", written, model._meta.db_table, time.monotonic() - started)
+
+        # Explicit ids leave PostgreSQL's sequences behind the copied rows
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+    return copied
@@ -0,0 +1,121 @@
+"""
+Startup helpers for run_backend.py's fast start and the readiness endpoint.
+
+`migrations_up_to_date()` lets the launcher skip `migrate`, which loads and
+plans every migration even when there is nothing to apply: it compares the
+migration names shipped with the code against the ones django_migrations
+records as applied, which takes one query. `warm_up()` does the work the
+first requests would otherwise pay for (importing the URLconf and views,
+building the title index) so it can run in the background once the server
+is listening. Provider clients are left to load on first use (see
+`api.services`).
+"""
+import pkgutil
+import time
+from importlib import import_module
+
+from django.apps import apps
+from django.db import DatabaseError, connection
+
+
+class PhaseTimer:
+    """Collects `(phase, milliseconds, note)` timings for a startup report."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self._note = None
+
+    def phase(self, name, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.phases.append((name, (time.perf_counter() - start) * 1000, self._note))
+            self._note = None
+
+    def note(self, text):
+        """Annotates the running phase, e.g. `skipped`."""
+        self._note = text
+
+    def report(self):
+        parts = [f"{name} {ms:.0f} ms" + (f" ({note})" if note else '') for name, ms, note in self.phases]
+        total = (time.perf_counter() - self.started) * 1000
+        return f"{', '.join(parts)}; {total:.0f} ms total"
+
+
+def code_migrations():
+    """`(app_label, name)` of every migration of the installed apps, without importing them."""
+    from django.db.migrations.loader import MigrationLoader
+
+    found = set()
+    for app_config in apps.get_app_configs():
+        module_name, _explicit = MigrationLoader.migrations_module(app_config.label)
+        if module_name is None:
+            continue
+        try:
+            module = import_module(module_name)
+        except ModuleNotFoundError:
+            continue
+        if not hasattr(module, '__path__'):
+            continue
+        found.update(
+            (app_config.label, name) for _finder, name, is_pkg in pkgutil.iter_modules(module.__path__)
+            if not is_pkg and name[0] not in '_~'
+        )
+    return found
+
+
+def applied_migrations(using='default'):
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+
+    return set(MigrationRecorder(connections[using]).applied_migrations())
+
+
+def migrations_up_to_date(using='default'):
+    """
+    True when every migration in the code has been applied to the database.
+    Errors (no database yet, unreadable table) count as not up to date.
+    """
+    try:
+        return code_migrations() <= applied_migrations(using)
+    except (DatabaseError, ImportError):
+        return False
+
+
+_migrated = False
+
+
+def readiness():
+    """
+    `(ready, checks)` for the readiness endpoint: whether the database
+    answers and has every migration applied. Once the migrations are found
+    applied they aren't checked again.
+    """
+    global _migrated
+    checks = {'database': True, 'migrations': _migrated}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError:
+        checks['database'] = False
+    if checks['database'] and not _migrated:
+        _migrated = checks['migrations'] = migrations_up_to_date()
+    return all(checks.values()), checks
+
+
+def warm_up():
+    """Loads what the first requests need. Returns the `PhaseTimer`."""
+    from django.urls import get_resolver
+
+    from . import title_index
+
+    timer = PhaseTimer()
+    try:
+        timer.phase('urls and views', lambda: get_resolver().url_patterns)
+        if not title_index.uses_database():
+            timer.phase('title index', title_index.get_index)
+    finally:
+        connection.close()
+    return timer
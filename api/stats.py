@@ -0,0 +1,222 @@
+"""
+Library statistics computed inside the database.
+
+`StatsView` used to walk every `UserMedia` row in Python (and follow
+`item.media` for each one). The helpers here express the same minute
+weighting as SQL `Case/When` expressions so the whole computation runs as a
+single grouped aggregate query.
+
+An optional per-profile summary table (`ProfileStatsBucket`) can hold the
+aggregated numbers. When `STATS_SUMMARY_TABLE` is enabled, the UserMedia
+signal handlers in `api.signals` keep it up to date incrementally (and
+rebuild it when a Media row's length or type changes) and the
+stats endpoint reads at most six small rows instead of scanning the library.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Sum, Value, When
+
+from .models import Media, Profile, ProfileStatsBucket, UserMedia
+
+
+# Minutes spent per unit of progress for each media type. TV shows use a
+# shorter episode length for very long running series.
+MINUTES_PER_UNIT = {
+    Media.ANIME: 25,
+    Media.MOVIE: 120,
+    Media.GAME: 1,  # Steam playtime is already stored in minutes
+    Media.BOOK: 360,
+    Media.MANGA: 10,
+}
+TV_SHOW_LONG_RUNNING_THRESHOLD = 100
+TV_SHOW_MINUTES_SHORT = 20
+TV_SHOW_MINUTES_LONG = 45
+
+# Types whose `Media.length` (minutes per episode or movie, pages per book at
+# about a page a minute) replaces the constants above once it is known. The
+# enrichment worker (api/enrichment.py) fills it in from the providers.
+LENGTH_AWARE_TYPES = [Media.ANIME, Media.MOVIE, Media.TV_SHOW, Media.BOOK]
+
+COMPLETED_SCORED = Q(status=UserMedia.COMPLETED, score__isnull=False)
+
+
+def minutes_for(media_type, progress, length=None):
+    """Python twin of `minutes_expression()` used for incremental updates."""
+    if length and media_type in LENGTH_AWARE_TYPES:
+        return progress * length
+    if media_type == Media.TV_SHOW:
+        if progress > TV_SHOW_LONG_RUNNING_THRESHOLD:
+            return progress * TV_SHOW_MINUTES_SHORT
+        return progress * TV_SHOW_MINUTES_LONG
+    return progress * MINUTES_PER_UNIT.get(media_type, 0)
+
+
+def minutes_expression():
+    """SQL expression for the minutes represented by a UserMedia row's progress."""
+    progress = F('progress')
+    whens = [
+        When(media__media_type__in=LENGTH_AWARE_TYPES, media__length__gt=0, then=progress * F('media__length')),
+        When(media__media_type=Media.TV_SHOW, progress__gt=TV_SHOW_LONG_RUNNING_THRESHOLD,
+             then=progress * TV_SHOW_MINUTES_SHORT),
+        When(media__media_type=Media.TV_SHOW, then=progress * TV_SHOW_MINUTES_LONG),
+    ]
+    whens += [
+        When(media__media_type=media_type, then=progress * minutes)
+        for media_type, minutes in MINUTES_PER_UNIT.items()
+    ]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def weight_expression():
+    """Score weight of a row: its minutes, or 1 when it has no progress."""
+    return Case(When(progress=0, then=Value(1)), default=minutes_expression(), output_field=IntegerField())
+
+
+def contribution(media_type, status, score, progress, length=None):
+    """
+    The amounts a single UserMedia row adds to its type's summary bucket.
+    Mirrors the columns produced by `aggregate_by_type()`.
+    """
+    minutes = minutes_for(media_type, progress, length)
+    row = {
+        'progress_minutes': minutes if progress > 0 else 0,
+        'completed_count': 0,
+        'weight_sum': 0,
+        'weighted_score_sum': 0.0,
+    }
+    if status == UserMedia.COMPLETED and score is not None:
+        weight = minutes if minutes != 0 else 1
+        row['completed_count'] = 1
+        row['weight_sum'] = weight
+        row['weighted_score_sum'] = float(score) * weight
+    return row
+
+
+def aggregate_by_type(profile):
+    """
+    Runs one grouped query and returns `{media_type: bucket_dict}` with the
+    same keys as `contribution()`.
+    """
+    minutes = minutes_expression()
+    weight = weight_expression()
+    rows = (
+        UserMedia.objects.filter(profile=profile)
+        .values('media__media_type')
+        .order_by()
+        .annotate(
+            progress_minutes=Sum(Case(When(progress__gt=0, then=minutes), default=Value(0),
+                                      output_field=IntegerField())),
+            completed_count=Count('id', filter=COMPLETED_SCORED),
+            weight_sum=Sum(weight, filter=COMPLETED_SCORED),
+            weighted_score_sum=Sum(F('score') * weight, filter=COMPLETED_SCORED,
+                                   output_field=FloatField()),
+        )
+    )
+    return {
+        row['media__media_type']: {
+            'progress_minutes': row['progress_minutes'] or 0,
+            'completed_count': row['completed_count'] or 0,
+            'weight_sum': row['weight_sum'] or 0,
+            'weighted_score_sum': row['weighted_score_sum'] or 0.0,
+        }
+        for row in rows
+    }
+
+
+def summary_table_enabled():
+    return getattr(settings, 'STATS_SUMMARY_TABLE', False)
+
+
+def rebuild_profile_stats(profile):
+    """
+    Recomputes the summary buckets of a profile from scratch. A row is stored
+    for every media type (zeros included) so incremental updates never have
+    to create buckets, and "no rows" reliably means "never built".
+    """
+    buckets = aggregate_by_type(profile)
+    empty = {'progress_minutes': 0, 'completed_count': 0, 'weight_sum': 0, 'weighted_score_sum': 0.0}
+    with transaction.atomic():
+        ProfileStatsBucket.objects.filter(profile=profile).delete()
+        ProfileStatsBucket.objects.bulk_create([
+            ProfileStatsBucket(profile=profile, media_type=media_type, **buckets.get(media_type, empty))
+            for media_type, _label in Media.MEDIA_TYPE_CHOICES
+        ])
+    return buckets
+
+
+def rebuild_owner_stats(media_ids):
+    """
+    Rebuilds the buckets of every profile holding one of `media_ids`, whose
+    length or media type changed under the rows counted in them.
+    """
+    if not summary_table_enabled():
+        return
+    owners = UserMedia.objects.filter(media_id__in=media_ids).values('profile_id').distinct()
+    for profile in Profile.objects.filter(pk__in=owners):
+        rebuild_profile_stats(profile)
+
+
+def apply_contribution(profile_id, media_type, delta, sign=1):
+    """
+    Adds (`sign=1`) or removes (`sign=-1`) a row contribution from a bucket.
+    Profiles whose buckets were never built are left alone; they are
+    computed from scratch on their first stats request.
+    """
+    if not any(delta.values()):
+        return
+    ProfileStatsBucket.objects.filter(profile_id=profile_id, media_type=media_type).update(
+        progress_minutes=F('progress_minutes') + sign * delta['progress_minutes'],
+        completed_count=F('completed_count') + sign * delta['completed_count'],
+        weight_sum=F('weight_sum') + sign * delta['weight_sum'],
+        weighted_score_sum=F('weighted_score_sum') + sign * delta['weighted_score_sum'],
+    )
+
+
+def load_buckets(profile):
+    """Returns the profile's buckets, using the summary table when enabled."""
+    if not summary_table_enabled():
+        return aggregate_by_type(profile)
+
+    stored = ProfileStatsBucket.objects.filter(profile=profile).values(
+        'media_type', 'progress_minutes', 'completed_count', 'weight_sum', 'weighted_score_sum'
+    )
+    buckets = {row.pop('media_type'): row for row in stored}
+    if not buckets:
+        buckets = rebuild_profile_stats(profile)
+    return buckets
+
+
+def build_stats_payload(buckets):
+    """Turns per-type buckets into the `/api/stats/` response shape."""
+    time_spent_minutes = {
+        'OVERALL': 0, Media.ANIME: 0, Media.MOVIE: 0, Media.TV_SHOW: 0,
+        Media.MANGA: 0, Media.BOOK: 0, Media.GAME: 0,
+    }
+    per_type_stats = {}
+    total_completed = 0
+    total_weight = 0
+    total_weighted_score = 0.0
+
+    for media_type, bucket in buckets.items():
+        # Completed items count their weight towards time spent as well
+        time_spent_minutes[media_type] += bucket['progress_minutes'] + bucket['weight_sum']
+
+        if bucket['completed_count'] == 0:
+            continue
+        total_completed += bucket['completed_count']
+        total_weight += bucket['weight_sum']
+        total_weighted_score += bucket['weighted_score_sum']
+        per_type_stats[media_type] = {'total_completed': bucket['completed_count'], 'weighted_average_score': 0}
+        if bucket['weight_sum'] > 0:
+            per_type_stats[media_type]['weighted_average_score'] = round(
+                bucket['weighted_score_sum'] / bucket['weight_sum'], 2
+            )
+
+    overall_stats = {'total_completed': total_completed, 'weighted_average_score': 0}
+    if total_weight > 0:
+        overall_stats['weighted_average_score'] = round(total_weighted_score / total_weight, 2)
+
+    time_spent_minutes['OVERALL'] = sum(time_spent_minutes.values())
+    time_spent_hours = {key: round(value / 60, 1) for key, value in time_spent_minutes.items()}
+
+    return {'overall': overall_stats, 'by_type': per_type_stats, 'time_spent_hours': time_spent_hours}
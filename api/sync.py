@@ -0,0 +1,199 @@
+"""
+Imports a profile's lists from AniList, MyAnimeList, TMDB and Steam.
+
+The sync views fetch the provider lists and turn each entry into a
+`(record, values)` pair: an `api.identity.upsert_media()` record for the title
+and the UserMedia status, score and progress. `import_entries()` then resolves
+every title through the identity index in one pass, so an anime synced from
+both AniList and MyAnimeList lands on the same Media row, and writes the
+library rows with one upsert in a single `bulk_library_write()`.
+"""
+import logging
+
+from django.db import connection
+
+from . import identity
+from .batch import parse_score
+from .library import bulk_library_write
+from .models import Media, UserMedia
+
+ANILIST_STATUSES = {
+    'CURRENT': UserMedia.IN_PROGRESS,
+    'PLANNING': UserMedia.PLANNED,
+    'COMPLETED': UserMedia.COMPLETED,
+    'DROPPED': UserMedia.DROPPED,
+    'PAUSED': UserMedia.PAUSED,
+}
+
+MAL_STATUSES = {
+    'watching': UserMedia.IN_PROGRESS, 'reading': UserMedia.IN_PROGRESS,
+    'completed': UserMedia.COMPLETED,
+    'on_hold': UserMedia.PAUSED,
+    'dropped': UserMedia.DROPPED,
+    'plan_to_watch': UserMedia.PLANNED, 'plan_to_read': UserMedia.PLANNED,
+}
+
+LIBRARY_FIELDS = ['status', 'score', 'progress']
+
+logger = logging.getLogger(__name__)
+
+
+def anilist_entry(entry, media_type):
+    media = entry['media']
+    record = {
+        'ids': {'ANILIST': media['id'], 'MAL': media.get('idMal')},
+        'media_type': media_type,
+        'primary_title': media['title']['romaji'],
+        'secondary_title': media['title']['english'],
+        'cover_image_url': media['coverImage']['large'],
+    }
+    values = {
+        'status': ANILIST_STATUSES.get(entry['status'], UserMedia.PLANNED),
+        'score': entry['score'],
+        'progress': entry['progress'],
+    }
+    return record, values
+
+
+def mal_entry(entry):
+    node, list_status = entry['node'], entry['list_status']
+    media_type = Media.ANIME if 'num_episodes_watched' in list_status else Media.MANGA
+    record = {
+        'ids': {'MAL': node['id']},
+        'media_type': media_type,
+        'primary_title': node['title'],
+        'cover_image_url': node.get('main_picture', {}).get('large'),
+    }
+    values = {
+        'status': MAL_STATUSES.get(list_status['status'], UserMedia.PLANNED),
+        'score': list_status['score'],
+        'progress': list_status.get('num_episodes_watched') or list_status.get('num_chapters_read', 0),
+    }
+    return record, values
+
+
+def tmdb_entry(item, media_type, item_status, score):
+    """
+    None for items without a poster, which the library can't show, and for
+    malformed ones, which are logged and skipped rather than failing the sync.
+    """
+    try:
+        if not item.get('poster_path') or not item.get('id'):
+            return None
+        title = item.get('title') or item.get('name')
+        if not isinstance(item['id'], int) or isinstance(item['id'], bool) or not isinstance(title, str):
+            raise ValueError("id must be an integer and the title a string.")
+        record = {
+            'ids': {'TMDB': item['id']},
+            'media_type': media_type,
+            'primary_title': title,
+            'secondary_title': item.get('original_title') or item.get('original_name'),
+            'cover_image_url': f"https://image.tmdb.org/t/p/w500{item.get('poster_path')}",
+            'description': item.get('overview'),
+        }
+        return record, {'status': item_status, 'score': parse_score(score), 'progress': 0}
+    except (AttributeError, TypeError, ValueError) as e:
+        logger.warning("Skipping malformed TMDB item %.200r: %s", item, e)
+        return None
+
+
+def import_entries(profile, entries, overwrite):
+    """
+    Adds the `(record, values)` entries to `profile`'s library. Items that
+    are already in it keep their local values unless `overwrite` is set.
+    Returns `(created, updated)` counts.
+    """
+    with bulk_library_write(profile) as batch:
+        media = identity.upsert_media([record for record, _values in entries])
+        existing = {
+            row.media_id: row
+            for row in UserMedia.objects.filter(profile=profile, media_id__in={item.pk for item in media})
+        }
+        to_create, to_update = {}, {}
+        for item, (_record, values) in zip(media, entries):
+            row = existing.get(item.pk)
+            if row is None:
+                to_create.setdefault(item.pk, UserMedia(profile=profile, media=item, **values))
+            elif overwrite and any(getattr(row, name) != value for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(row, name, value)
+                to_update[row.pk] = row
+        _write_library_rows(profile, batch, to_create, to_update, overwrite)
+    return len(to_create), len(to_update)
+
+
+def steam_entry(game):
+    return {
+        'ids': {'STEAM': game['appid']},
+        'media_type': Media.GAME,
+        'primary_title': game['name'],
+        'cover_image_url': game['header_image'],
+        'description': game.get('description', ''),
+    }
+
+
+def import_steam_library(profile, games):
+    """
+    Adds the games of a Steam library (`steam_service.get_user_library()`)
+    to `profile`'s library. Playtime always replaces the progress, and
+    planned games that have been played move to in progress. Returns
+    `(created, updated)` counts.
+    """
+    with bulk_library_write(profile) as batch:
+        media = identity.upsert_media([steam_entry(game) for game in games])
+        existing = {
+            row.media_id: row
+            for row in UserMedia.objects.filter(profile=profile, media_id__in={item.pk for item in media})
+        }
+        to_create, to_update = {}, {}
+        for item, game in zip(media, games):
+            minutes = game['playtime_minutes']
+            row = existing.get(item.pk)
+            if row is None:
+                status = UserMedia.IN_PROGRESS if minutes > 0 else UserMedia.PLANNED
+                to_create.setdefault(item.pk, UserMedia(profile=profile, media=item, status=status, progress=minutes))
+                continue
+            status = UserMedia.IN_PROGRESS if minutes > 0 and row.status == UserMedia.PLANNED else row.status
+            if (row.progress, row.status) != (minutes, status):
+                row.progress, row.status = minutes, status
+                to_update[row.pk] = row
+        _write_library_rows(profile, batch, to_create, to_update)
+    return len(to_create), len(to_update)
+
+
+def _write_library_rows(profile, batch, to_create, to_update, overwrite=True):
+    """
+    Writes the new and changed library rows. A row to create that another
+    write added in the meantime is updated too when `overwrite` is set, and
+    otherwise keeps its local values.
+    """
+    batch.stamp([*to_create.values(), *to_update.values()])
+    if connection.features.supports_update_conflicts_with_target:
+        if overwrite:
+            _upsert_library_rows(profile, [*to_create.values(), *to_update.values()])
+            return
+        UserMedia.objects.bulk_create(list(to_create.values()), ignore_conflicts=True)
+        _upsert_library_rows(profile, list(to_update.values()))
+    else:
+        UserMedia.objects.bulk_create(list(to_create.values()), ignore_conflicts=not overwrite)
+        UserMedia.objects.bulk_update(list(to_update.values()), [*LIBRARY_FIELDS, 'change_seq'])
+
+
+def _upsert_library_rows(profile, rows):
+    """
+    Writes new and changed library rows with one `INSERT ... ON CONFLICT
+    (profile, media) DO UPDATE` per batch (PostgreSQL, SQLite 3.24+), which
+    also lets a row another sync created in the meantime be updated instead
+    of failing the unique constraint.
+    """
+    UserMedia.objects.bulk_create(
+        [
+            # Without the pk, so the (profile, media) constraint is the one that conflicts
+            UserMedia(profile=profile, media_id=row.media_id, change_seq=row.change_seq,
+                      **{name: getattr(row, name) for name in LIBRARY_FIELDS})
+            for row in rows
+        ],
+        update_conflicts=True,
+        unique_fields=['profile', 'media'],
+        update_fields=[*LIBRARY_FIELDS, 'change_seq'],
+    )
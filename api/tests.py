@@ -1,11 +1,20 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.core.servers.basehttp import WSGIServer
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
 from unittest.mock import patch
 
 
+from . import enrichment, metrics, query_budget, sqlite_copy, title_index
+from .authentication import auth_cache
+from .changes import purge_tombstones
 from .models import Profile, CustomList, Media, UserMedia, CustomListEntry
 
 
@@ -29,6 +38,8 @@ class CustomListModelTest(TestCase):
 
 class CustomListAPITest(TestCase):
     def setUp(self):
+        # Cached library payloads are keyed by profile id, which test rollbacks reuse
+        cache.clear()
         self.user = User.objects.create_user(username='apitest', password='apipass')
         self.profile = Profile.objects.create(user=self.user)
         self.client = APIClient()
@@ -132,6 +143,7 @@ class SearchAndSyncAPITest(TestCase):
 
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='syncuser', password='syncpass')
         self.profile = Profile.objects.create(user=self.user)
         self.client = APIClient()
@@ -236,3 +248,1908 @@ class SearchAndSyncAPITest(TestCase):
         self.assertTrue(Media.objects.filter(steam_appid=555).exists())
         self.assertTrue(UserMedia.objects.filter(profile=self.profile, media__steam_appid=444).exists())
 
+
+    @patch('api.views.tmdb_service.get_rated_tv', return_value=[])
+    @patch('api.views.tmdb_service.get_rated_movies')
+    @patch('api.views.tmdb_service.get_tv_watchlist', return_value=[])
+    @patch('api.views.tmdb_service.get_movie_watchlist')
+    @patch('api.views.tmdb_service.get_account_details', return_value={'id': 42})
+    def test_tmdb_sync_skips_malformed_items(self, _account, mock_watchlist, _tv, mock_rated, _rated_tv):
+        self.profile.tmdb_session_id = 'tmdb'
+        self.profile.save()
+        mock_watchlist.return_value = [
+            'not an item', {'id': 'abc', 'title': 'Bad id', 'poster_path': '/p.jpg'},
+            {'id': 1, 'title': 'Good', 'poster_path': '/p.jpg'},
+        ]
+        mock_rated.return_value = [
+            {'id': 2, 'title': 'Bad rating', 'poster_path': '/p.jpg', 'rating': 'great'},
+            {'id': 3, 'title': 'Rated', 'poster_path': '/p.jpg', 'rating': 8},
+        ]
+
+        with self.assertLogs('api.sync', 'WARNING') as logs:
+            resp = self.client.post(reverse('sync-tmdb'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(logs.output), 3)
+        self.assertEqual(
+            set(UserMedia.objects.filter(profile=self.profile).values_list('media__tmdb_id', 'score')), {(1, None), (3, 8)}
+        )
+
+
+    @patch('api.views.mal_service.fetch_user_list')
+    def test_keep_local_sync_leaves_rows_added_meanwhile_alone(self, mock_mal):
+        from . import identity
+
+        self.profile.mal_access_token = 'mal'
+        self.profile.save()
+        mock_mal.side_effect = lambda token, media_type: [
+            {'node': {'id': 30, 'title': 'Evangelion', 'main_picture': {'large': 'http://mal'}},
+             'list_status': {'status': 'watching', 'score': 5, 'num_episodes_watched': 3}},
+        ] if media_type == 'ANIME' else []
+        upsert_media = identity.upsert_media
+
+        def added_meanwhile(items):
+            # Another request adds the title between the sync's lookup and its write
+            rows = upsert_media(items)
+            UserMedia.objects.create(profile=self.profile, media=rows[0], status='COMPLETED', score=10, progress=26)
+            return rows
+
+        with patch('api.sync.identity.upsert_media', side_effect=added_meanwhile):
+            self.assertEqual(self.client.post(reverse('sync-mal')).status_code, 200)
+        row = UserMedia.objects.get(profile=self.profile, media__mal_id=30)
+        self.assertEqual((row.status, row.score, row.progress), ('COMPLETED', 10, 26))
+
+
+
+class StatsAPITest(TestCase):
+    """Stats are aggregated in the database and optionally kept in a summary table."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='statsuser', password='statspass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        anime = Media.objects.create(media_type=Media.ANIME, primary_title='Stats Anime')
+        show = Media.objects.create(media_type=Media.TV_SHOW, primary_title='Stats Show')
+        game = Media.objects.create(media_type=Media.GAME, primary_title='Stats Game')
+        # 12 episodes * 25 min, completed with score 8
+        UserMedia.objects.create(profile=self.profile, media=anime, status='COMPLETED', score=8, progress=12)
+        # 10 episodes * 45 min, in progress
+        UserMedia.objects.create(profile=self.profile, media=show, status='IN_PROGRESS', progress=10)
+        # no progress, completed with score 6 (weight 1)
+        self.game_entry = UserMedia.objects.create(profile=self.profile, media=game, status='COMPLETED', score=6, progress=0)
+
+
+    def test_stats_match_minute_weighting(self):
+        resp = self.client.get(reverse('stats'))
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data['overall']['total_completed'], 2)
+        self.assertEqual(data['overall']['weighted_average_score'], round((8 * 300 + 6 * 1) / 301, 2))
+        self.assertEqual(data['by_type']['ANIME'], {'total_completed': 1, 'weighted_average_score': 8.0})
+        self.assertNotIn('TV_SHOW', data['by_type'])
+        # Completed items count their weight on top of their progress minutes
+        self.assertEqual(data['time_spent_hours']['ANIME'], 10.0)
+        self.assertEqual(data['time_spent_hours']['TV_SHOW'], 7.5)
+
+
+    def test_stats_summary_table_tracks_writes(self):
+        with self.settings(STATS_SUMMARY_TABLE=True):
+            first = self.client.get(reverse('stats')).json()
+            self.assertEqual(self.profile.stats_buckets.count(), len(Media.MEDIA_TYPE_CHOICES))
+
+            self.game_entry.progress = 90
+            self.game_entry.score = 9
+            self.game_entry.save()
+            UserMedia.objects.filter(profile=self.profile, media__media_type=Media.TV_SHOW).get().delete()
+
+            incremental = self.client.get(reverse('stats')).json()
+            self.profile.stats_buckets.all().delete()
+            rebuilt = self.client.get(reverse('stats')).json()
+
+        self.assertNotEqual(first, incremental)
+        self.assertEqual(incremental, rebuilt)
+
+
+    def test_stats_summary_table_follows_media_edits(self):
+        with self.settings(STATS_SUMMARY_TABLE=True):
+            first = self.client.get(reverse('stats')).json()
+
+            # As the admin or a merge would: plain saves of the Media rows
+            anime = Media.objects.get(primary_title='Stats Anime')
+            anime.length = 50
+            anime.save()
+            show = Media.objects.get(primary_title='Stats Show')
+            show.media_type = Media.ANIME
+            show.save()
+
+            edited = self.client.get(reverse('stats')).json()
+            self.profile.stats_buckets.all().delete()
+            rebuilt = self.client.get(reverse('stats')).json()
+
+        self.assertNotEqual(first, edited)
+        self.assertEqual(edited, rebuilt)
+
+
+class LibraryVersionCacheTest(TestCase):
+    """Library endpoints are cached per library version and answer If-None-Match with 304."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='etaguser', password='etagpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        media = Media.objects.create(media_type=Media.MOVIE, primary_title='Cached Movie')
+        self.entry = UserMedia.objects.create(profile=self.profile, media=media, status='PLANNED')
+
+
+    def test_unchanged_library_returns_304(self):
+        url = reverse('user-media-list')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+
+
+    def test_writes_change_the_etag(self):
+        for url in (reverse('user-media-list'), reverse('stats'), reverse('custom-list-list')):
+            etag = self.client.get(url)['ETag']
+            self.client.patch(reverse('user-media-update', args=[self.entry.pk]), {'status': 'COMPLETED'}, format='json')
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp['ETag'], etag)
+
+        etag = self.client.get(reverse('custom-list-list'))['ETag']
+        CustomList.objects.create(user=self.user, name='New List')
+        resp = self.client.get(reverse('custom-list-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([item['name'] for item in resp.json()], ['New List'])
+
+
+class LibraryPageAPITest(TestCase):
+    """The paginated library endpoint walks the library with keyset cursors."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='pageuser', password='pagepass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        for i in range(7):
+            media = Media.objects.create(media_type=Media.ANIME if i % 2 else Media.BOOK, primary_title=f'Title {i}')
+            UserMedia.objects.create(profile=self.profile, media=media, status='COMPLETED', score=i % 3, progress=i)
+
+
+    def _walk(self, **params):
+        seen = []
+        cursor = None
+        while True:
+            query = dict(params, limit=2)
+            if cursor:
+                query['cursor'] = cursor
+            resp = self.client.get(reverse('user-media-page'), query)
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen.extend(data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                return seen
+
+
+    def test_pages_cover_library_in_sort_order(self):
+        items = self._walk(sort='-score')
+        self.assertEqual(len(items), 7)
+        self.assertEqual(len({item['id'] for item in items}), 7)
+        scores = [item['score'] for item in items]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        titles = [item['media']['primary_title'] for item in self._walk(sort='title')]
+        self.assertEqual(titles, sorted(titles))
+
+
+    def test_unscored_items_sort_below_every_score(self):
+        for i in range(3):
+            media = Media.objects.create(media_type=Media.BOOK, primary_title=f'Unscored {i}')
+            UserMedia.objects.create(profile=self.profile, media=media, status='PLANNED')
+
+        items = self._walk(sort='-score')
+        self.assertEqual(len({item['id'] for item in items}), 10)
+        self.assertEqual([item['score'] for item in items[7:]], [None] * 3)
+        self.assertNotIn(None, [item['score'] for item in items[:7]])
+
+        items = self._walk(sort='score')
+        self.assertEqual(len({item['id'] for item in items}), 10)
+        self.assertEqual([item['score'] for item in items[:3]], [None] * 3)
+        scores = [item['score'] for item in items[3:]]
+        self.assertEqual(scores, sorted(scores))
+
+
+    def test_filters_and_invalid_params(self):
+        items = self._walk(media_type='ANIME', min_score=1)
+        self.assertTrue(items)
+        self.assertTrue(all(i['media']['media_type'] == 'ANIME' and i['score'] >= 1 for i in items))
+
+        resp = self.client.get(reverse('user-media-page'), {'sort': 'colour'})
+        self.assertEqual(resp.status_code, 400)
+
+
+    def test_cursors_must_match_the_sort_key(self):
+        from .pagination import encode_cursor
+
+        url = reverse('user-media-page')
+        for sort, cursor in [('score', encode_cursor('abc', 1)), ('-progress', encode_cursor([1], 1)),
+                             ('title', encode_cursor(3, 1)), ('title', encode_cursor('a', 'b')), ('score', 'bm90IGpzb24')]:
+            self.assertEqual(self.client.get(url, {'sort': sort, 'cursor': cursor}).status_code, 400, (sort, cursor))
+        # Numbers in a score cursor written as strings still work
+        self.assertEqual(self.client.get(url, {'sort': 'score', 'cursor': encode_cursor('1', 0)}).status_code, 200)
+
+
+class LibraryChangesAPITest(TestCase):
+    """The change feed returns only writes and deletes after a given sequence."""
+
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='mirroruser', password='mirrorpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.custom_list = CustomList.objects.create(user=self.user, name='Mirror')
+        self.items = [
+            UserMedia.objects.create(
+                profile=self.profile, media=Media.objects.create(media_type=Media.BOOK, primary_title=f'Book {i}')
+            )
+            for i in range(3)
+        ]
+        self.entry = CustomListEntry.objects.create(custom_list=self.custom_list, user_media=self.items[0])
+
+
+    def _changes(self, since):
+        resp = self.client.get(reverse('user-media-changes'), {'since': since})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+
+    def test_initial_feed_then_incremental_changes(self):
+        initial = self._changes(0)
+        self.assertEqual(len(initial['user_media']), 3)
+        self.assertEqual([e['id'] for e in initial['custom_list_entries']], [self.entry.id])
+
+        self.assertEqual(self._changes(initial['seq'])['user_media'], [])
+
+        self.items[1].score = 7
+        self.items[1].save()
+        deleted_id = self.items[0].id
+        self.items[0].delete()
+
+        delta = self._changes(initial['seq'])
+        self.assertEqual([item['id'] for item in delta['user_media']], [self.items[1].id])
+        self.assertEqual(delta['deleted']['user_media'], [deleted_id])
+        # The entry cascaded with its UserMedia
+        self.assertEqual(delta['deleted']['custom_list_entry'], [self.entry.id])
+        self.assertGreater(delta['seq'], initial['seq'])
+
+
+    def test_purged_tombstones_force_reset(self):
+        seq = self._changes(0)['seq']
+        self.items[2].delete()
+        self.assertEqual(purge_tombstones(older_than_days=-1), 1)
+        self.assertTrue(self._changes(seq)['reset'])
+
+
+    def test_deleting_user_removes_library(self):
+        self.user.delete()
+        self.assertFalse(UserMedia.objects.filter(pk__in=[i.pk for i in self.items]).exists())
+
+
+
+class LibraryChangesConcurrencyTest(TransactionTestCase):
+    """A change sequence commits together with its row, so a mirror never skips a slower writer's row."""
+
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("The in-memory test database fails concurrent writers instead of making them wait.")
+        self.user = User.objects.create_user(username='racer', password='racerpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.slow_media = Media.objects.create(media_type=Media.BOOK, primary_title='Slow')
+        self.fast_media = Media.objects.create(media_type=Media.BOOK, primary_title='Fast')
+
+
+    def test_interleaved_writers(self):
+        import threading
+        from django.db.models.signals import pre_save
+        from .changes import changes_since
+
+        stamped, release = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+        committed = []
+
+        def pause_after_stamping(sender, instance, **kwargs):
+            # Connected after api.signals' handler, so the row already has its sequence
+            if instance.media_id == self.slow_media.pk:
+                stamped.set()
+                release.wait(10)
+
+        def write(media, name):
+            try:
+                UserMedia.objects.create(profile=self.profile, media=media)
+                committed.append(name)
+            finally:
+                connection.close()
+
+        pre_save.connect(pause_after_stamping, sender=UserMedia)
+        self.addCleanup(pre_save.disconnect, pause_after_stamping, sender=UserMedia)
+        slow = threading.Thread(target=write, args=(self.slow_media, 'slow'))
+        slow.start()
+        self.assertTrue(stamped.wait(10))
+        fast = threading.Thread(target=write, args=(self.fast_media, 'fast'))
+        fast.start()
+        fast.join(0.5)
+        # The second writer waits for the first one's sequence to commit...
+        self.assertTrue(fast.is_alive())
+        # ...and a mirror refreshing meanwhile gets neither row
+        during = changes_since(self.profile, 0)
+        self.assertEqual(during['user_media'], [])
+        release.set()
+        slow.join(10)
+        fast.join(10)
+
+        self.assertEqual(committed, ['slow', 'fast'])
+        after = changes_since(self.profile, during['seq'])
+        self.assertEqual([item.media_id for item in after['user_media']], [self.slow_media.pk, self.fast_media.pk])
+
+
+class CustomListQueryCountTest(TestCase):
+    """Custom list endpoints run a fixed number of queries however many entries there are."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='prefetchuser', password='prefetchpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.first_list = self._add_list('First', entries=1)
+
+
+    def _add_list(self, name, entries):
+        custom_list = CustomList.objects.create(user=self.user, name=name)
+        for i in range(entries):
+            media = Media.objects.create(media_type=Media.GAME, primary_title=f'{name} game {i}')
+            um = UserMedia.objects.create(profile=self.profile, media=media)
+            CustomListEntry.objects.create(custom_list=custom_list, user_media=um)
+        return custom_list
+
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(queries), resp.json()
+
+
+    def test_list_queries_do_not_grow_with_entries(self):
+        urls = [
+            reverse('custom-list-list'),
+            reverse('custom-list-list') + '?summary=1',
+            reverse('custom-list-entries', args=[self.first_list.id]),
+            reverse('custom-list-entry-list'),
+        ]
+        small = [self._count_queries(url)[0] for url in urls]
+        for i in range(4):
+            self._add_list(f'More {i}', entries=5)
+        for i in range(6):
+            media = Media.objects.create(media_type=Media.GAME, primary_title=f'Extra {i}')
+            CustomListEntry.objects.create(
+                custom_list=self.first_list, user_media=UserMedia.objects.create(profile=self.profile, media=media)
+            )
+        large = [self._count_queries(url)[0] for url in urls]
+        self.assertEqual(small, large)
+
+
+    def test_summary_and_paginated_entries(self):
+        self._add_list('Big', entries=3)
+        _, summary = self._count_queries(reverse('custom-list-list') + '?summary=1')
+        self.assertEqual({item['name']: item['entry_count'] for item in summary}, {'First': 1, 'Big': 3})
+        self.assertTrue(all('entries' not in item for item in summary))
+
+        big = CustomList.objects.get(name='Big')
+        _, page = self._count_queries(reverse('custom-list-entries', args=[big.id]) + '?limit=2')
+        self.assertEqual(page['count'], 3)
+        self.assertEqual(len(page['results']), 2)
+        self.assertIsNotNone(page['next'])
+
+
+class BatchMutationAPITest(TestCase):
+    """Batch endpoints validate everything first and apply it in one transaction."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='batchuser', password='batchpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.items = [
+            UserMedia.objects.create(
+                profile=self.profile, media=Media.objects.create(media_type=Media.MOVIE, primary_title=f'Movie {i}')
+            )
+            for i in range(3)
+        ]
+
+
+    def _add_op(self, api_id, **extra):
+        media = {'api_source': 'TMDB', 'api_id': api_id, 'primary_title': f'Batch {api_id}', 'media_type': Media.MOVIE}
+        return dict({'media': media, 'status': 'PLANNED'}, **extra)
+
+
+    def test_batch_applies_adds_updates_and_deletes(self):
+        payload = {
+            'add': [self._add_op(1), self._add_op(2, score=7), self._add_op(1)],
+            'update': [{'id': self.items[0].id, 'status': 'COMPLETED', 'score': 9}],
+            'delete': [self.items[1].id],
+        }
+        resp = self.client.post(reverse('user-media-batch'), payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        results = [r['result'] for r in resp.json()['results']]
+        self.assertEqual(results, ['created', 'created', 'duplicate', 'updated', 'deleted'])
+
+        self.assertEqual(UserMedia.objects.filter(profile=self.profile, media__tmdb_id__in=[1, 2]).count(), 2)
+        self.items[0].refresh_from_db()
+        self.assertEqual((self.items[0].status, self.items[0].score), ('COMPLETED', 9))
+        self.assertFalse(UserMedia.objects.filter(pk=self.items[1].id).exists())
+
+        # Bulk writes still feed the change feed
+        changes = self.client.get(reverse('user-media-changes'), {'since': 0}).json()
+        self.assertEqual(changes['deleted']['user_media'], [self.items[1].id])
+
+
+    def test_invalid_batch_writes_nothing(self):
+        other_user = User.objects.create_user(username='otherbatch', password='x')
+        other = UserMedia.objects.create(
+            profile=Profile.objects.create(user=other_user),
+            media=Media.objects.create(media_type=Media.MOVIE, primary_title='Not yours'),
+        )
+        payload = {
+            'add': [self._add_op(5)],
+            'update': [{'id': self.items[0].id, 'score': 11}],
+            'delete': [other.id],
+        }
+        resp = self.client.post(reverse('user-media-batch'), payload, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual([(e['op'], e['index']) for e in resp.json()['errors']], [('update', 0), ('delete', 0)])
+        self.assertFalse(Media.objects.filter(tmdb_id=5).exists())
+        self.assertTrue(UserMedia.objects.filter(pk=other.id).exists())
+
+
+    def test_malformed_operations_are_reported_per_operation(self):
+        untitled = self._add_op(6)
+        del untitled['media']['primary_title']
+        payload = {
+            'add': [self._add_op('abc'), untitled, self._add_op(7, status=['PLANNED'])],
+            'update': [{'id': [self.items[0].id], 'score': 5}, {'id': {'pk': 1}}, {'id': True}],
+            'delete': [{'a': 1}, 'x'],
+        }
+        resp = self.client.post(reverse('user-media-batch'), payload, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(
+            [(e['op'], e['index']) for e in resp.json()['errors']],
+            [('add', 0), ('add', 1), ('add', 2), ('update', 0), ('update', 1), ('update', 2), ('delete', 0), ('delete', 1)],
+        )
+        self.assertFalse(Media.objects.filter(tmdb_id__in=[6, 7]).exists())
+
+        # Numeric strings are still taken as ids
+        resp = self.client.post(reverse('user-media-batch'), {'add': [self._add_op('8')]}, format='json')
+        self.assertEqual(resp.json()['results'][0]['result'], 'created')
+        self.assertTrue(Media.objects.filter(tmdb_id=8).exists())
+
+        custom_list = CustomList.objects.create(user=self.user, name='Malformed')
+        payload = {'add': [{'custom_list': [custom_list.id], 'user_media': self.items[0].id}], 'delete': [{'a': 1}]}
+        resp = self.client.post(reverse('custom-list-entry-batch'), payload, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual([(e['op'], e['index']) for e in resp.json()['errors']], [('add', 0), ('delete', 0)])
+
+
+    @patch('api.views.mal_service.fetch_user_list')
+    def test_added_media_is_linked_like_single_adds(self, mock_mal):
+        from .models import MediaIdentity
+
+        anilist = {'api_source': 'ANILIST', 'api_id': 21, 'mal_id': 21, 'primary_title': 'One Piece',
+                   'media_type': Media.ANIME}
+        resp = self.client.post(reverse('user-media-batch'), {'add': [{'media': anilist}]}, format='json')
+        self.assertEqual(resp.json()['results'][0]['result'], 'created')
+        media = Media.objects.get(anilist_id=21)
+        self.assertEqual(
+            set(MediaIdentity.objects.filter(media=media).values_list('key', flat=True)), {'ANILIST:21', 'MAL:ANIME:21'}
+        )
+
+        # A MyAnimeList sync of the same title finds the batch-added row
+        self.profile.mal_access_token = 'mal'
+        self.profile.save()
+        mock_mal.side_effect = lambda token, media_type: [
+            {'node': {'id': 21, 'title': 'One Piece', 'main_picture': {'large': 'http://mal'}},
+             'list_status': {'status': 'watching', 'score': 8, 'num_episodes_watched': 1000}},
+        ] if media_type == 'ANIME' else []
+        self.assertEqual(self.client.post(reverse('sync-mal')).status_code, 200)
+        self.assertEqual(Media.objects.filter(primary_title='One Piece').count(), 1)
+        self.assertEqual(UserMedia.objects.filter(profile=self.profile, media=media).count(), 1)
+
+
+    def test_custom_list_entry_batch(self):
+        custom_list = CustomList.objects.create(user=self.user, name='Batch List')
+        existing = CustomListEntry.objects.create(custom_list=custom_list, user_media=self.items[2])
+        payload = {
+            'add': [{'custom_list': custom_list.id, 'user_media': um.id} for um in [*self.items[:2], self.items[0]]],
+            'delete': [existing.id],
+        }
+        resp = self.client.post(reverse('custom-list-entry-batch'), payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()['results']
+        self.assertEqual([r['result'] for r in results], ['created', 'created', 'duplicate', 'deleted'])
+        self.assertEqual(results[2]['id'], results[0]['id'])
+        self.assertEqual(
+            set(CustomListEntry.objects.filter(custom_list=custom_list).values_list('user_media_id', flat=True)),
+            {self.items[0].id, self.items[1].id},
+        )
+
+
+
+@override_settings(AUTH_CACHE_TTL_SECONDS=60)
+class CachedTokenAuthenticationTest(TestCase):
+    """Token authentication is served from an in-process cache that writes invalidate."""
+
+
+    def setUp(self):
+        auth_cache.clear()
+        self.user = User.objects.create_user(username='authcacheuser', password='authpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+    def test_repeated_requests_skip_auth_queries(self):
+        url = reverse('mal-status')
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 0)
+
+
+    def test_profile_changes_and_revoked_tokens_are_seen(self):
+        url = reverse('mal-status')
+        self.assertFalse(self.client.get(url).json()['linked'])
+        self.profile.mal_access_token = 'linked'
+        self.profile.save()
+        self.assertTrue(self.client.get(url).json()['linked'])
+
+        resp = self.client.post(reverse('profile-options'), {'keep_user_logged_in': False}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+
+    def test_saving_a_cached_profile_keeps_other_writes(self):
+        self.client.get(reverse('mal-status'))
+        # Another worker links MyAnimeList; this process's cached profile doesn't know
+        Profile.objects.filter(pk=self.profile.pk).update(mal_access_token='from-another-worker')
+        resp = self.client.post(reverse('profile-options'), {'dark_mode': False}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.dark_mode, self.profile.mal_access_token), (False, 'from-another-worker'))
+
+
+    @override_settings(AUTH_CACHE_TTL_SECONDS=0)
+    def test_zero_ttl_authenticates_from_the_database(self):
+        url = reverse('mal-status')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # Deleted without this process's signals, as by another worker
+        Token.objects.filter(pk=self.token.pk)._raw_delete(connection.alias)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+
+class MaintenanceTest(TestCase):
+    """The janitor removes expired tokens and abandoned OAuth handshakes only."""
+
+
+    def test_purges_expired_tokens_and_stale_handshakes(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .maintenance import run_maintenance
+        from .models import MALAuthRequest, TMDBRequestToken
+
+        keep = User.objects.create_user(username='keepme', password='x')
+        Profile.objects.create(user=keep, keep_user_logged_in=True)
+        short = User.objects.create_user(username='shortlived', password='x')
+        Profile.objects.create(user=short, keep_user_logged_in=False)
+        old = timezone.now() - timedelta(days=3)
+        kept_token = Token.objects.create(user=keep)
+        Token.objects.filter(pk=kept_token.pk).update(created=old)
+        expired_token = Token.objects.create(user=short)
+        Token.objects.filter(pk=expired_token.pk).update(created=old)
+
+        stale = MALAuthRequest.objects.create(state='stale', code_verifier='v')
+        MALAuthRequest.objects.filter(pk=stale.pk).update(created_at=old)
+        fresh = TMDBRequestToken.objects.create(user=keep, token='fresh')
+
+        report = run_maintenance(chunk_size=1)
+        self.assertEqual(report['expired_tokens']['rows'], 1)
+        self.assertEqual(report['stale_handshakes']['rows'], 1)
+        self.assertNotIn('error', report['optimize'])
+        self.assertTrue(Token.objects.filter(pk=kept_token.pk).exists())
+        self.assertFalse(Token.objects.filter(pk=expired_token.pk).exists())
+        self.assertTrue(TMDBRequestToken.objects.filter(pk=fresh.pk).exists())
+
+
+    def test_step_timings_are_exported_as_metrics(self):
+        import time
+        from .maintenance import run_maintenance
+
+        before = time.time()
+        report = run_maintenance()
+        body = metrics.render()
+        for step in report:
+            self.assertIn(f'maintenance_step_duration_seconds{{step="{step}"}}', body)
+        finished = next(line for line in body.splitlines() if line.startswith('maintenance_last_run_timestamp_seconds '))
+        self.assertGreaterEqual(float(finished.split()[1]), before)
+
+
+class RendererTest(TestCase):
+    """Library payloads are built as plain dicts and rendered by the negotiated renderer."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='renderuser', password='renderpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        items = [
+            UserMedia.objects.create(
+                profile=self.profile, status='COMPLETED', score=8 if i else None, progress=i,
+                media=Media.objects.create(media_type=Media.ANIME, primary_title=f'Título {i}', anilist_id=i),
+            )
+            for i in range(3)
+        ]
+        self.custom_list = CustomList.objects.create(user=self.user, name='Rendered')
+        for item in items:
+            CustomListEntry.objects.create(custom_list=self.custom_list, user_media=item)
+
+
+    def test_plain_list_serializer_matches_drf(self):
+        from rest_framework import serializers
+        from .serializers import CustomListSerializer, UserMediaSerializer
+
+        rows = UserMedia.objects.filter(profile=self.profile).select_related('media')
+        fast = UserMediaSerializer(rows, many=True).data
+        slow = serializers.ListSerializer(rows, child=UserMediaSerializer()).data
+        self.assertEqual(list(fast), [dict(item) for item in slow])
+
+        lists = CustomList.objects.filter(pk=self.custom_list.pk)
+        fast = CustomListSerializer(lists, many=True).data
+        slow = serializers.ListSerializer(lists, child=CustomListSerializer()).data
+        self.assertEqual(fast[0]['entries'][0]['added_at'], slow[0]['entries'][0]['added_at'])
+        self.assertEqual(JSONRenderer().render(list(fast)), JSONRenderer().render(slow))
+
+
+    def test_json_is_the_default_rendering(self):
+        import json
+        resp = self.client.get(reverse('user-media-list'))
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertEqual(len(json.loads(resp.content)), 3)
+        self.assertIn('Título', resp.content.decode('utf-8'))
+
+
+    def test_msgpack_is_negotiated_through_accept(self):
+        from .renderers import msgpack
+        resp = self.client.get(reverse('user-media-list'), HTTP_ACCEPT='application/x-msgpack')
+        if msgpack is None:
+            self.assertEqual(resp.status_code, 406)
+            return
+        self.assertEqual(resp['Content-Type'], 'application/x-msgpack')
+        self.assertEqual(len(msgpack.unpackb(resp.content)), 3)
+
+
+class ColumnarLayoutTest(TestCase):
+    """`?layout=columnar` carries the same data as the regular responses in column arrays."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='columnaruser', password='columnarpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.items = [
+            UserMedia.objects.create(
+                profile=self.profile, status=status, score=9 - i, progress=2,
+                media=Media.objects.create(media_type=Media.GAME, primary_title=f'Game {i}'),
+            )
+            for i, status in enumerate(['COMPLETED', 'PLANNED', 'COMPLETED'])
+        ]
+        self.lists = [CustomList.objects.create(user=self.user, name=name) for name in ('A', 'B')]
+        for custom_list in self.lists:
+            CustomListEntry.objects.create(custom_list=custom_list, user_media=self.items[0])
+        CustomListEntry.objects.create(custom_list=self.lists[1], user_media=self.items[1])
+
+
+    def _decode_user_media(self, payload):
+        enums = payload['enums']
+        media = [dict(zip(payload['media'], row)) for row in zip(*payload['media'].values())]
+        for row in media:
+            row['media_type'] = enums['media_type'][row['media_type']]
+        items = [dict(zip(payload['user_media'], row)) for row in zip(*payload['user_media'].values())]
+        for row in items:
+            row['media'] = media[row['media']]
+            row['status'] = enums['status'][row['status']]
+        return items
+
+
+    def test_library_list_round_trips(self):
+        regular = self.client.get(reverse('user-media-list')).json()
+        compact = self.client.get(reverse('user-media-list'), {'layout': 'columnar'}).json()
+        self.assertEqual(compact['layout'], 'columnar')
+        self.assertEqual(compact['user_media']['status'], [1, 4, 1])
+        self.assertEqual(self._decode_user_media(compact), regular)
+
+
+    def test_sparse_fieldsets_encode_only_the_selected_columns(self):
+        url = reverse('user-media-list')
+        compact = self.client.get(url, {'layout': 'columnar', 'fields': 'id'}).json()
+        self.assertEqual(compact['user_media'], {'id': [item.id for item in self.items]})
+        self.assertEqual(compact['media'], {})
+
+        compact = self.client.get(url, {'layout': 'columnar', 'fields': 'score,media.primary_title'}).json()
+        self.assertEqual(compact['user_media'], {'score': [9, 8, 7], 'media': [0, 1, 2]})
+        self.assertEqual(compact['media'], {'primary_title': ['Game 0', 'Game 1', 'Game 2']})
+
+        page = self.client.get(
+            reverse('custom-list-entries', args=[self.lists[1].id]), {'layout': 'columnar', 'fields': 'id'}
+        )
+        self.assertEqual(page.status_code, 200)
+
+
+    def test_custom_lists_dedupe_shared_items(self):
+        regular = self.client.get(reverse('custom-list-list')).json()
+        compact = self.client.get(reverse('custom-list-list'), {'layout': 'columnar'}).json()
+        # items[0] is in both lists but sent once
+        self.assertEqual(len(compact['user_media']['id']), 2)
+        self.assertEqual(compact['custom_lists']['name'], ['A', 'B'])
+        self.assertEqual(compact['entries']['custom_list'], [0, 1, 1])
+
+        items = self._decode_user_media(compact)
+        entries = zip(compact['entries']['custom_list'], compact['entries']['user_media'])
+        decoded = [[], []]
+        for list_index, item_index in entries:
+            decoded[list_index].append(items[item_index])
+        self.assertEqual(decoded, [[entry['user_media'] for entry in l['entries']] for l in regular])
+
+        page = self.client.get(reverse('custom-list-entries', args=[self.lists[1].id]), {'layout': 'columnar'}).json()
+        self.assertEqual(page['count'], 2)
+        self.assertEqual(page['results']['entries']['user_media'], [0, 1])
+
+
+class SparseFieldsetTest(TestCase):
+    """`?fields=` / `?expand=` trim list responses and the columns behind them."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='sparseuser', password='sparsepass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.items = [
+            UserMedia.objects.create(
+                profile=self.profile, status='PLANNED', score=5 + i,
+                media=Media.objects.create(
+                    media_type=Media.BOOK, primary_title=f'Book {i}', description='A very long synopsis'
+                ),
+            )
+            for i in range(3)
+        ]
+        self.custom_list = CustomList.objects.create(user=self.user, name='Sparse')
+        for item in self.items:
+            CustomListEntry.objects.create(custom_list=self.custom_list, user_media=item)
+
+
+    def _get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.query_count = len(queries)
+        return resp.json(), ' '.join(q['sql'] for q in queries.captured_queries)
+
+
+    def test_fields_select_output_and_columns(self):
+        data, sql = self._get(reverse('user-media-list'), {'fields': 'id,score,media.primary_title'})
+        self.assertEqual(data[0], {'id': self.items[2].id, 'score': 7.0, 'media': {'primary_title': 'Book 2'}})
+        self.assertNotIn('description', sql)
+        self.assertNotIn('cover_image_url', sql)
+
+
+    def test_description_is_only_sent_when_asked_for(self):
+        full, _ = self._get(reverse('user-media-list'), {})
+        self.assertIn('description', full[0]['media'])
+
+        sparse, sql = self._get(reverse('user-media-list'), {'fields': 'id,media'})
+        self.assertEqual(set(sparse[0]['media']), {'id', 'primary_title', 'secondary_title', 'cover_image_url',
+                                                   'media_type', 'anilist_id'})
+        self.assertNotIn('description', sql)
+
+        expanded, _ = self._get(reverse('user-media-list'), {'expand': 'media.description'})
+        self.assertEqual(expanded[0]['media']['description'], 'A very long synopsis')
+        self.assertEqual(set(expanded[0]), {'id', 'media', 'status', 'score', 'progress'})
+
+
+    def test_custom_list_entries_are_trimmed_without_extra_queries(self):
+        params = {'fields': 'id,entries.user_media.media.primary_title'}
+        data, sql = self._get(reverse('custom-list-list'), params)
+        self.assertEqual(data, [{'id': self.custom_list.id, 'entries': [
+            {'user_media': {'media': {'primary_title': f'Book {i}'}}} for i in range(3)
+        ]}])
+        self.assertNotIn('description', sql)
+
+        # Deferred columns must not be loaded row by row later on
+        queries = self.query_count
+        for i in range(3):
+            CustomListEntry.objects.create(
+                custom_list=CustomList.objects.create(user=self.user, name=f'More {i}'), user_media=self.items[i]
+            )
+        self._get(reverse('custom-list-list'), params)
+        self.assertEqual(self.query_count, queries)
+
+        page, _ = self._get(reverse('custom-list-entries', args=[self.custom_list.id]), {'fields': 'id,added_at'})
+        self.assertEqual(set(page['results'][0]), {'id', 'added_at'})
+
+
+    def test_unknown_fields_are_rejected(self):
+        resp = self.client.get(reverse('user-media-list'), {'fields': 'id,media.colour'})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('media.colour', resp.json()['detail'])
+
+
+class MediaBatchAPITest(TestCase):
+    """`/api/media/batch` serves many media details per request from a per-row versioned cache."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='batchdetails', password='batchpass')
+        Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.media = [
+            Media.objects.create(media_type=Media.ANIME, primary_title=f'Show {i}', anilist_id=100 + i)
+            for i in range(3)
+        ]
+
+
+    def test_details_are_cached_until_the_row_changes(self):
+        ids = f'{self.media[2].id},{self.media[0].id},999999'
+        resp = self.client.get(reverse('media-batch'), {'ids': ids})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([item['id'] for item in resp.json()['results']], [self.media[2].id, self.media[0].id])
+        self.assertEqual(resp.json()['missing'], [999999])
+
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(reverse('media-batch'), {'ids': ids})
+        self.assertEqual(len(cached), 1)
+
+        self.media[0].description = 'Now with a synopsis'
+        self.media[0].save()
+        item = self.client.get(reverse('media-batch'), {'ids': ids}).json()['results'][1]
+        self.assertEqual((item['description'], item['version']), ('Now with a synopsis', 2))
+
+
+    @patch('api.enrichment.anilist_service.get_media_by_ids')
+    def test_enrich_fills_missing_details_with_one_request_per_batch(self, mock_fetch):
+        mock_fetch.return_value = [
+            {'id': media.anilist_id, 'description': f'About {media.primary_title}', 'duration': 24}
+            for media in self.media
+        ]
+        ids = ','.join(str(media.id) for media in self.media)
+        results = self.client.get(reverse('media-batch'), {'ids': ids, 'enrich': 1}).json()['results']
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertEqual([(r['description'], r['length']) for r in results], [(f'About Show {i}', 24) for i in range(3)])
+        self.assertEqual(Media.objects.filter(length=24).count(), 3)
+
+        # Already enriched: served without asking the provider again
+        self.client.get(reverse('media-batch'), {'ids': ids, 'enrich': 1})
+        self.assertEqual(mock_fetch.call_count, 1)
+
+
+    @patch('api.media_details.ENRICH_TIMEOUT_SECONDS', 0.2)
+    @patch('api.enrichment.notify')
+    @patch('api.enrichment.anilist_service.get_media_by_ids')
+    def test_enrich_leaves_slow_lookups_to_the_worker(self, mock_fetch, mock_notify):
+        import threading
+        import time
+
+        release = threading.Event()
+        self.addCleanup(release.set)
+        mock_fetch.side_effect = lambda ids: release.wait(5) and []
+        ids = ','.join(str(media.id) for media in self.media)
+
+        started = time.monotonic()
+        results = self.client.get(reverse('media-batch'), {'ids': ids, 'enrich': 1}).json()['results']
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([r['description'] for r in results], [None] * 3)
+        mock_notify.assert_called_once()
+        # Not looked up, so the rows stay queued for the worker
+        self.assertEqual(Media.objects.filter(enriched_at__isnull=True).count(), 3)
+
+
+    def test_rejects_bad_or_too_many_ids(self):
+        self.assertEqual(self.client.get(reverse('media-batch'), {'ids': 'a,b'}).status_code, 400)
+        too_many = ','.join(str(i) for i in range(1, 102))
+        self.assertEqual(self.client.get(reverse('media-batch'), {'ids': too_many}).status_code, 400)
+
+
+class EnrichmentQueueTest(TestCase):
+    """Media rows missing details are queued and enriched in bulk in the background."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='enrichuser', password='enrichpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.anime = Media.objects.create(media_type=Media.ANIME, primary_title='Long Episodes', anilist_id=500)
+        self.other = Media.objects.create(media_type=Media.ANIME, primary_title='Unknown', anilist_id=501)
+        # Nothing to look it up with
+        Media.objects.create(media_type=Media.GAME, primary_title='Homebrew')
+        UserMedia.objects.create(profile=self.profile, media=self.anime, status='IN_PROGRESS', progress=10)
+
+
+    @patch('api.enrichment.anilist_service.get_media_by_ids')
+    def test_process_queue_enriches_in_bulk_and_updates_stats(self, mock_fetch):
+        mock_fetch.return_value = [{'id': 500, 'description': 'Double-length episodes', 'duration': 48}]
+        self.assertEqual(set(enrichment.pending_media()), {self.anime, self.other})
+
+        with self.settings(STATS_SUMMARY_TABLE=True):
+            # 10 episodes at the default 25 minutes
+            self.assertEqual(self.client.get(reverse('stats')).json()['time_spent_hours']['ANIME'], 4.2)
+            self.assertEqual(enrichment.process_queue(), 1)
+            self.assertEqual(self.client.get(reverse('stats')).json()['time_spent_hours']['ANIME'], 8.0)
+
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.anime.refresh_from_db()
+        self.assertEqual((self.anime.length, self.anime.version), (48, 2))
+        # Looked up but not found: left alone until the retry window passes
+        self.assertFalse(enrichment.pending_media().exists())
+        self.assertEqual(enrichment.process_queue(), 0)
+        self.assertEqual(mock_fetch.call_count, 1)
+
+
+    @patch('api.enrichment.anilist_service.get_media_by_ids', return_value=[])
+    @patch('api.enrichment.anilist_service.get_media_by_mal_ids')
+    def test_mal_only_rows_are_enriched_by_their_mal_id(self, mock_fetch, _mock_anilist):
+        mock_fetch.side_effect = lambda mal_ids, media_type: [
+            {'id': 9000 + mal_id, 'idMal': mal_id, 'type': media_type, 'description': f'{media_type} {mal_id}',
+             'duration': 24 if media_type == Media.ANIME else None}
+            for mal_id in mal_ids
+        ]
+        anime = Media.objects.create(media_type=Media.ANIME, primary_title='From MAL', mal_id=21)
+        manga = Media.objects.create(media_type=Media.MANGA, primary_title='Also from MAL', mal_id=21)
+        self.assertIn(anime, enrichment.pending_media())
+
+        enrichment.process_queue()
+
+        # MyAnimeList numbers anime and manga separately: one lookup per media type
+        self.assertEqual(
+            sorted(call.args for call in mock_fetch.call_args_list), [([21], Media.ANIME), ([21], Media.MANGA)]
+        )
+        anime.refresh_from_db()
+        manga.refresh_from_db()
+        self.assertEqual((anime.description, anime.length), ('ANIME 21', 24))
+        self.assertEqual(manga.description, 'MANGA 21')
+
+
+class MediaIdentityTest(TestCase):
+    """The same title synced from AniList and MyAnimeList resolves to one Media row."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='identityuser', password='identitypass')
+        self.profile = Profile.objects.create(
+            user=self.user, anilist_access_token='ani', mal_access_token='mal', keep_local_on_sync=False
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+
+    @patch('api.views.anilist_service.fetch_full_user_manga_list')
+    @patch('api.views.anilist_service.fetch_full_user_list')
+    @patch('api.views.mal_service.fetch_user_list')
+    def test_syncs_from_both_providers_share_a_row(self, mock_mal, mock_anilist, mock_anilist_manga):
+        mock_mal.side_effect = lambda token, media_type: [
+            {'node': {'id': 5114, 'title': 'FMA: Brotherhood', 'main_picture': {'large': 'http://mal'}},
+             'list_status': {'status': 'watching', 'score': 7, 'num_episodes_watched': 10}},
+        ] if media_type == 'ANIME' else []
+        mock_anilist.return_value = [
+            {'status': 'COMPLETED', 'score': 9, 'progress': 64, 'media': {
+                'id': 9001, 'idMal': 5114, 'title': {'romaji': 'Hagane no Renkinjutsushi', 'english': None},
+                'coverImage': {'large': 'http://anilist'}}},
+        ]
+        mock_anilist_manga.return_value = []
+
+        self.assertEqual(self.client.post(reverse('sync-mal')).status_code, 200)
+        with CaptureQueriesContext(connection) as sync_queries:
+            self.assertEqual(self.client.post(reverse('sync-anilist')).status_code, 200)
+
+        media = Media.objects.get()
+        self.assertEqual((media.anilist_id, media.mal_id), (9001, 5114))
+        # MAL's row now also belongs to AniList, which fills in what was empty
+        self.assertEqual(media.primary_title, 'FMA: Brotherhood')
+        item = UserMedia.objects.get(profile=self.profile)
+        self.assertEqual((item.status, item.score, item.progress), ('COMPLETED', 9, 64))
+        # Resolved and written in bulk, not per list entry
+        self.assertLess(len(sync_queries), 20)
+
+        self.assertEqual(self.client.post(reverse('sync-mal')).status_code, 200)
+        self.assertEqual(Media.objects.count(), 1)
+
+
+    @patch('api.enrichment.anilist_service.get_media_by_ids')
+    def test_merge_command_rewires_library_rows_and_list_entries(self, mock_fetch):
+        from io import StringIO
+        from django.core.management import call_command
+
+        anilist_row = Media.objects.create(media_type=Media.ANIME, primary_title='Mushishi', anilist_id=457)
+        mal_row = Media.objects.create(media_type=Media.ANIME, primary_title='Mushi-Shi', mal_id=457,
+                                       description='Ginko travels.')
+        mock_fetch.return_value = [{'id': 457, 'idMal': 457, 'description': None, 'duration': 25}]
+
+        # This profile has the title twice, each copy in a custom list
+        older = UserMedia.objects.create(profile=self.profile, media=anilist_row, status='PLANNED')
+        newer = UserMedia.objects.create(profile=self.profile, media=mal_row, status='COMPLETED', score=9)
+        favourites = CustomList.objects.create(user=self.user, name='Favourites')
+        calm = CustomList.objects.create(user=self.user, name='Calm')
+        CustomListEntry.objects.create(custom_list=favourites, user_media=older)
+        CustomListEntry.objects.create(custom_list=favourites, user_media=newer)
+        CustomListEntry.objects.create(custom_list=calm, user_media=older)
+        other = User.objects.create_user(username='other', password='x')
+        other_item = UserMedia.objects.create(profile=Profile.objects.create(user=other), media=mal_row)
+
+        call_command('merge_duplicate_media', stdout=StringIO())
+
+        media = Media.objects.get()
+        self.assertEqual((media.pk, media.anilist_id, media.mal_id), (anilist_row.pk, 457, 457))
+        self.assertEqual(media.description, 'Ginko travels.')
+        self.assertEqual(list(UserMedia.objects.filter(profile=self.profile)), [newer])
+        self.assertEqual(UserMedia.objects.get(pk=newer.pk).media, media)
+        self.assertEqual(UserMedia.objects.get(pk=other_item.pk).media, media)
+        self.assertEqual(
+            sorted(CustomListEntry.objects.values_list('custom_list__name', 'user_media_id')),
+            [('Calm', newer.pk), ('Favourites', newer.pk)],
+        )
+        self.assertEqual(sorted(media.identities.values_list('key', flat=True)), ['ANILIST:457', 'MAL:ANIME:457'])
+
+
+    def test_anime_and_manga_sharing_a_mal_id_stay_apart(self):
+        from . import sync
+
+        def entry(anilist_id, title):
+            return {'status': 'COMPLETED', 'score': 8, 'progress': 1, 'media': {
+                'id': anilist_id, 'idMal': 1, 'title': {'romaji': title, 'english': None},
+                'coverImage': {'large': 'http://anilist'}}}
+
+        # MyAnimeList numbers anime and manga separately: both of these are its id 1
+        sync.import_entries(self.profile, [
+            sync.anilist_entry(entry(1, 'Cowboy Bebop'), Media.ANIME),
+            sync.anilist_entry(entry(30001, 'Monster'), Media.MANGA),
+        ], overwrite=True)
+        self.assertEqual(
+            sorted(Media.objects.values_list('media_type', 'mal_id', 'primary_title')),
+            [('ANIME', 1, 'Cowboy Bebop'), ('MANGA', 1, 'Monster')],
+        )
+        self.assertEqual(UserMedia.objects.filter(profile=self.profile).count(), 2)
+
+        # Arriving in separate syncs, they aren't merged either
+        sync.import_entries(self.profile, [sync.anilist_entry(entry(30001, 'Monster'), Media.MANGA)], overwrite=True)
+        sync.import_entries(self.profile, [sync.anilist_entry(entry(1, 'Cowboy Bebop'), Media.ANIME)], overwrite=True)
+        self.assertEqual(Media.objects.count(), 2)
+        self.assertEqual(UserMedia.objects.filter(profile=self.profile).count(), 2)
+
+
+class TitleIndexTest(TestCase):
+    """The trigram title index finds misspelt titles and follows Media writes."""
+
+
+    def setUp(self):
+        cache.clear()
+        title_index.reset()
+        self.user = User.objects.create_user(username='fuzzyuser', password='fuzzypass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.steins = Media.objects.create(media_type=Media.ANIME, primary_title='Steins;Gate', anilist_id=9253)
+        self.mushishi = Media.objects.create(media_type=Media.ANIME, primary_title='Mushishi',
+                                             secondary_title='Mushi-Shi')
+        Media.objects.create(media_type=Media.BOOK, primary_title='Steinbeck: A Life')
+
+
+    def tearDown(self):
+        title_index.reset()
+
+
+    def test_lookup_tolerates_typos_and_follows_writes(self):
+        self.assertEqual(title_index.lookup('stiens gate')[0][1], self.steins.pk)
+        self.assertEqual(title_index.lookup('mushi shi', media_types=[Media.ANIME])[0][1], self.mushishi.pk)
+        self.assertEqual(title_index.lookup('zzzz'), [])
+
+        # The built index is updated in place by saves, bulk upserts and deletes
+        self.steins.primary_title = 'Steins;Gate 0'
+        self.steins.save()
+        self.assertEqual(title_index.lookup('steins gate 0')[0][2], 'Steins;Gate 0')
+        from . import identity
+        identity.upsert_media([{'ids': {'RAWG': 2}, 'media_type': Media.GAME, 'primary_title': 'Chaos;Child'}])
+        self.assertEqual(title_index.lookup('chaos chlid')[0][2], 'Chaos;Child')
+        self.mushishi.delete()
+        self.assertEqual(title_index.lookup('mushishi'), [])
+
+
+    @patch('api.views.anilist_service.search_anime')
+    def test_search_suggests_local_titles_on_request(self, mock_anilist):
+        mock_anilist.return_value = []
+        url = reverse('media-search')
+        self.assertEqual(self.client.get(url, {'q': 'steins gat', 'sources': 'ANIME'}).json(), [])
+
+        data = self.client.get(url, {'q': 'steins gat', 'sources': 'ANIME', 'suggest': 1}).json()
+        self.assertEqual(data['results'], [])
+        self.assertEqual([s['title'] for s in data['suggestions']], ['Steins;Gate'])
+
+
+    def test_library_page_fuzzy_title_filter(self):
+        UserMedia.objects.create(profile=self.profile, media=self.steins, status='COMPLETED', score=9)
+        UserMedia.objects.create(profile=self.profile, media=self.mushishi, status='COMPLETED', score=8)
+        # Built at startup by warm_up(), not by the first page request
+        title_index.get_index()
+        resp = self.client.get(reverse('user-media-page'), {'fuzzy_title': 'mushisi'})
+        self.assertEqual([item['media']['id'] for item in resp.json()['results']], [self.mushishi.pk])
+
+
+    def test_fuzzy_title_filter_finds_every_library_match_in_a_crowded_catalog(self):
+        catalog = Media.objects.bulk_create([
+            Media(media_type=Media.ANIME, primary_title=f'Mobile Suit Gundam {i}') for i in range(300)
+        ])
+        owned = catalog[::10]
+        UserMedia.objects.bulk_create([UserMedia(profile=self.profile, media=media) for media in owned])
+        title_index.get_index()
+        resp = self.client.get(reverse('user-media-page'), {'fuzzy_title': 'gundam', 'limit': 200})
+        self.assertEqual({item['media']['id'] for item in resp.json()['results']}, {media.pk for media in owned})
+
+
+    @override_settings(TITLE_INDEX_REFRESH_SECONDS=30)
+    def test_refresh_picks_up_other_workers_writes(self):
+        from django.db.models import F
+
+        self.assertEqual(title_index.lookup('zetsuen'), [])
+        self.assertFalse(title_index.refresh())
+        # Written without this process's signals, as by another worker
+        Media.objects.bulk_create([Media(media_type=Media.ANIME, primary_title='Zetsuen no Tempest')])
+        Media.objects.filter(pk=self.mushishi.pk).update(primary_title='Mushishi Zoku Shou', version=F('version') + 1)
+        # PostgreSQL looks titles up in the table itself, so only the in-memory index is rebuilt
+        self.assertEqual(title_index.refresh(), not title_index.uses_database())
+        self.assertEqual(title_index.lookup('zetsuen')[0][2], 'Zetsuen no Tempest')
+        self.assertEqual(title_index.lookup('mushishi zoku')[0][1], self.mushishi.pk)
+
+
+class FastStartTest(TestCase):
+    """run_backend.py's fast start: the migration check and the lazy provider modules."""
+
+
+    def test_migrations_up_to_date_compares_code_and_database(self):
+        from . import startup
+
+        self.assertTrue(startup.migrations_up_to_date())
+        self.assertIn(('api', '0001_initial'), startup.code_migrations())
+        with patch.object(startup, 'applied_migrations', return_value=set()):
+            self.assertFalse(startup.migrations_up_to_date())
+
+
+    def test_provider_modules_are_shared_lazy_stand_ins(self):
+        import sys
+        from . import services, views
+        from .services import tmdb_service
+
+        self.assertIs(views.tmdb_service, tmdb_service)
+        with patch('api.views.tmdb_service.search_movies') as mock_search:
+            self.assertIs(sys.modules['api.services.tmdb_service'].search_movies, mock_search)
+        self.assertIsNot(sys.modules['api.services.tmdb_service'].search_movies, mock_search)
+        with self.assertRaises(AttributeError):
+            services.missing_service
+
+
+class ProductionServingTest(TestCase):
+    """The readiness endpoint and the per-process request limit used by `run_backend.py --production`."""
+
+
+    def setUp(self):
+        from . import startup
+        startup._migrated = False
+
+
+    def test_readiness_reports_database_and_migrations(self):
+        from . import startup
+
+        with patch.object(startup, 'migrations_up_to_date', return_value=False):
+            resp = self.client.get(reverse('readiness'))
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.json()['checks'], {'database': True, 'migrations': False})
+
+        resp = self.client.get(reverse('readiness'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.json()['ready'])
+        # Not checked again once applied
+        with patch.object(startup, 'migrations_up_to_date') as mock_check:
+            self.assertEqual(self.client.get(reverse('readiness')).status_code, 200)
+        mock_check.assert_not_called()
+
+
+    def test_limit_concurrency_queues_requests_over_the_limit(self):
+        import asyncio
+        from backend.asgi import limit_concurrency
+
+        running, peak = 0, 0
+
+        async def app(scope, receive, send):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        limited = limit_concurrency(app, 2)
+
+        async def main():
+            await asyncio.gather(*(limited({'type': 'http', 'path': '/api/stats/'}, None, None) for _ in range(6)))
+            self.assertEqual(peak, 2)
+            await asyncio.gather(*(limited({'type': 'http', 'path': '/api/ready/'}, None, None) for _ in range(3)))
+            self.assertEqual(peak, 3)
+
+        asyncio.run(main())
+
+
+class SettingsProfileTest(TestCase):
+    """The two-level cache of the server profile and the performance self-check."""
+
+
+    def test_tiered_cache_reads_through_and_writes_both_tiers(self):
+        from django.core.cache import caches
+        from django.test import override_settings
+
+        tiers = {
+            'default': {'BACKEND': 'api.cache_backends.TieredCache', 'OPTIONS': {'LOCAL': 'local', 'SHARED': 'shared'}},
+            'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-local'},
+            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-shared'},
+        }
+        with override_settings(CACHES=tiers):
+            tiered, local, shared = caches['default'], caches['local'], caches['shared']
+            tiered.set('payload', {'v': 1})
+            self.assertEqual((local.get('payload'), shared.get('payload')), ({'v': 1}, {'v': 1}))
+
+            # Another worker's write is picked up from the shared tier and kept locally
+            shared.set_many({'a': 1, 'b': 2})
+            self.assertEqual(tiered.get('a'), 1)
+            self.assertEqual(local.get('a'), 1)
+            self.assertEqual(tiered.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+            self.assertEqual(local.get('b'), 2)
+
+            tiered.delete('payload')
+            self.assertIsNone(tiered.get('payload'))
+            self.assertIsNone(shared.get('payload'))
+            tiered.clear()
+
+
+    def test_performance_check_flags_hostile_settings(self):
+        import warnings
+        from django.core.checks import run_checks
+        from django.test import override_settings
+        from backend.settings.base import DEBUG_REST_FRAMEWORK, REST_FRAMEWORK
+
+        with override_settings(DEBUG=False, REST_FRAMEWORK=REST_FRAMEWORK):
+            self.assertEqual(run_checks(tags=['performance']), [])
+        # The test runner's own DEBUG=False is left alone
+        with override_settings(DEBUG=False, REST_FRAMEWORK=DEBUG_REST_FRAMEWORK):
+            self.assertEqual(run_checks(tags=['performance']), [])
+        with override_settings(DEBUG=False, REST_FRAMEWORK=DEBUG_REST_FRAMEWORK, TESTING=False):
+            self.assertEqual([message.id for message in run_checks(tags=['performance'])], ['api.W006'])
+        # The SQLite checks, whichever database the suite runs on
+        databases = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:', 'OPTIONS': {'timeout': 1}}}
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with warnings.catch_warnings():
+            # Only the checks read the overridden DATABASES; no connection is opened to it
+            warnings.filterwarnings('ignore', 'Overriding setting DATABASES', UserWarning)
+            with override_settings(DEBUG=True, DATABASES=databases, CACHES=caches, PROFILE='server', ASGI_THREADS=0):
+                ids = {message.id for message in run_checks(tags=['performance'])}
+        self.assertEqual(ids, {'api.W001', 'api.W002', 'api.W003', 'api.W005', 'api.W008'})
+
+
+class SQLiteCopyTest(TransactionTestCase):
+    """`copy_sqlite` moves every row of a SQLite file into the configured database."""
+
+    @classmethod
+    def setUpClass(cls):
+        import tempfile
+        from pathlib import Path
+
+        cls.tmp = tempfile.TemporaryDirectory()
+        # Registered here rather than in `databases`: the test runner would look for it before it exists
+        cls.databases = {'default', sqlite_copy.register_sqlite(Path(cls.tmp.name) / 'old.sqlite3')}
+        super().setUpClass()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        from django.db import connections
+
+        super().tearDownClass()
+        connections[sqlite_copy.SOURCE_ALIAS].close()
+        del connections.settings[sqlite_copy.SOURCE_ALIAS]
+        cls.tmp.cleanup()
+
+
+    def test_copies_users_library_and_tokens(self):
+        from django.core.management import call_command
+
+        source = sqlite_copy.SOURCE_ALIAS
+        call_command('migrate', database=source, verbosity=0)
+        # Bulk writes: signal handlers would write to the default database
+        user = User(username='olduser')
+        user.set_password('oldpass')
+        User.objects.using(source).bulk_create([user])
+        user = User.objects.using(source).get()
+        profile = Profile.objects.using(source).bulk_create([Profile(user=user, dark_mode=True)])[0]
+        media = Media.objects.using(source).bulk_create([
+            Media(media_type=Media.ANIME, primary_title=f'Show {i}', anilist_id=i) for i in range(5)
+        ])
+        UserMedia.objects.using(source).bulk_create([
+            UserMedia(profile=profile, media=item, status='COMPLETED', score=i) for i, item in enumerate(media)
+        ])
+        Token.objects.using(source).bulk_create([Token(key='a' * 40, user=user)])
+
+        User.objects.create_user(username='newuser', password='x')
+        with self.assertRaises(sqlite_copy.CopyError):
+            sqlite_copy.copy_database(source)
+        copied = sqlite_copy.copy_database(source, batch_size=2, replace=True)
+
+        self.assertEqual(copied['api_media'], 5)
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['olduser'])
+        self.assertTrue(User.objects.get().check_password('oldpass'))
+        self.assertTrue(Profile.objects.get().dark_mode)
+        self.assertEqual(sorted(UserMedia.objects.values_list('score', flat=True)), [0, 1, 2, 3, 4])
+        self.assertEqual(Token.objects.get().user.username, 'olduser')
+        # New rows don't collide with the copied ids
+        new_media = Media.objects.create(media_type=Media.ANIME, primary_title='New')
+        self.assertGreater(new_media.pk, max(item.pk for item in media))
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+class MetricsTest(TestCase):
+    """`/api/metrics` reports request, provider, cache and queue metrics in the Prometheus format."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='metricsuser', password='metricspass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        media = Media.objects.create(media_type=Media.MOVIE, primary_title='Measured Movie')
+        UserMedia.objects.create(profile=self.profile, media=media, status='PLANNED')
+
+
+    def test_requests_are_timed_by_url_name(self):
+        def observed():
+            # [bucket counts..., sum]: the number of requests and the queries they ran
+            counts = metrics.request_queries.collect().get(('user-media-list', ), [0, 0])
+            return sum(counts[:-1]), counts[-1]
+
+        requests_before, queries_before = observed()
+        self.client.get(reverse('user-media-list'))
+        self.client.get(reverse('user-media-list'))
+        requests_after, queries_after = observed()
+        self.assertEqual(requests_after - requests_before, 2)
+        self.assertGreater(queries_after, queries_before)
+
+        resp = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = resp.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{view="user-media-list",method="GET",status="2xx",le="+Inf"}', body
+        )
+
+
+    def test_only_scrapers_holding_the_token_are_answered(self):
+        # A logged-in user is no scraper
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer guess').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+    def test_finished_threads_shards_are_folded_away_without_a_scrape(self):
+        import threading
+
+        counter = metrics.cache_requests
+        for _ in range(200):
+            thread = threading.Thread(target=counter.inc, args=('short-lived', 'hit'))
+            thread.start()
+            thread.join()
+        # Each new thread retires the shards of those that finished before it
+        self.assertLess(len(counter._shards), 10)
+        self.assertEqual(counter.collect()[('short-lived', 'hit')], 200)
+
+
+    def test_cache_hits_and_misses(self):
+        hits = metrics.cache_requests.collect().get(('library', 'hit'), 0)
+        misses = metrics.cache_requests.collect().get(('library', 'miss'), 0)
+        self.client.get(reverse('user-media-list'))
+        self.client.get(reverse('user-media-list'))
+
+        counts = metrics.cache_requests.collect()
+        self.assertEqual(counts[('library', 'hit')] - hits, 1)
+        self.assertEqual(counts[('library', 'miss')] - misses, 1)
+        body = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+        self.assertIn('cache_hit_ratio{cache="library"}', body)
+
+
+    def test_provider_calls_record_latency_errors_and_retries(self):
+        import types
+        from types import SimpleNamespace
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        class FlakyAdapter(HTTPAdapter):
+            # An upstream that answered 503 after two retries
+            def send(self, request, **kwargs):
+                response = requests.Response()
+                response.status_code = 503
+                response._content = b''
+                response.raw = SimpleNamespace(retries=SimpleNamespace(history=['first', 'second']))
+                response.request = request
+                return response
+
+        def fetch():
+            session = requests.Session()
+            session.mount('https://', FlakyAdapter())
+            try:
+                session.get('https://provider.invalid/items').raise_for_status()
+            except requests.exceptions.HTTPError:
+                return []
+
+        def explode():
+            raise ValueError('boom')
+
+        module = types.ModuleType('api.services.fake_service')
+        fetch.__module__ = explode.__module__ = module.__name__
+        module.fetch, module.explode = fetch, explode
+        metrics.instrument_provider(module)
+
+        self.assertEqual(module.fetch(), [])
+        with self.assertRaises(ValueError):
+            module.explode()
+
+        self.assertEqual(metrics.provider_errors.collect()[('fake', 'fetch')], 1)
+        self.assertEqual(metrics.provider_retries.collect()[('fake', 'fetch')], 2)
+        self.assertEqual(metrics.provider_errors.collect()[('fake', 'explode')], 1)
+        self.assertEqual(metrics.provider_seconds.collect()[('fake', 'fetch')][-2], 0)
+        self.assertEqual(sum(metrics.provider_seconds.collect()[('fake', 'fetch')][:-1]), 1)
+
+
+    def test_thread_shards_survive_their_threads(self):
+        import threading
+
+        counter = metrics.Counter('test_events_total', "Events recorded by test threads.", ('kind',))
+        threads = [threading.Thread(target=counter.inc, args=('a', )) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc('a', amount=5)
+
+        self.assertEqual(counter.collect(), {('a', ): 25})
+        # Finished threads are folded into the running total, not kept around
+        self.assertEqual(len(counter._shards), 1)
+        self.assertEqual(counter.collect(), {('a', ): 25})
+        metrics._registry.remove(counter)
+
+
+class RequestProfilingTest(TestCase):
+    """Requests sending the profiling secret are profiled, thread-pool work included."""
+
+
+    def setUp(self):
+        import tempfile
+
+        cache.clear()
+        self.user = User.objects.create_user(username='profileduser', password='profiledpass')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.spool = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool.cleanup)
+        settings_override = self.settings(
+            PROFILING_SECRET='let-me-profile', PROFILING_DIR=self.spool.name, PROFILING_INTERVAL_MS=1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+    def get_trends(self, **headers):
+        import time
+
+        def slow_trending_anime():
+            time.sleep(0.1)
+            return []
+
+        with patch('api.views.anilist_service.get_trending_anime', side_effect=slow_trending_anime), \
+                patch('api.views.anilist_service.get_trending_manga', return_value=[]), \
+                patch('api.views.tmdb_service.get_trending_movies', return_value=[]), \
+                patch('api.views.tmdb_service.get_trending_tv', return_value=[]), \
+                patch('api.views.steam_service.get_popular_games', return_value=[]), \
+                patch('api.views.google_books_service.get_newest_books', return_value=[]):
+            resp = self.client.get(reverse('trends'), **headers)
+        self.assertEqual(resp.status_code, 200)
+        return resp
+
+
+    def test_sampling_profile_covers_pool_threads(self):
+        import os
+
+        resp = self.get_trends(HTTP_X_PROFILE='let-me-profile')
+        profile_id = resp['X-Profile-Id']
+        with open(os.path.join(self.spool.name, f'{profile_id}.folded')) as f:
+            stacks = f.read().splitlines()
+
+        self.assertTrue(stacks)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in stacks))
+        pool_stacks = [line for line in stacks if line.startswith('ThreadPoolExecutor-')]
+        self.assertTrue(any('slow_trending_anime' in line for line in pool_stacks))
+        self.assertTrue(any(line.startswith('request;') for line in stacks))
+
+
+    def test_tracing_profile_covers_pool_threads(self):
+        import os
+        import pstats
+
+        resp = self.get_trends(HTTP_X_PROFILE='let-me-profile', HTTP_X_PROFILE_MODE='trace')
+        stats = pstats.Stats(os.path.join(self.spool.name, f"{resp['X-Profile-Id']}.prof"))
+        functions = {name for _, _, name in stats.stats}
+        self.assertIn('slow_trending_anime', functions)
+        self.assertIn('get', functions)
+
+
+    def test_unauthorized_requests_are_not_profiled(self):
+        import os
+
+        self.assertNotIn('X-Profile-Id', self.get_trends(HTTP_X_PROFILE='guess'))
+        self.assertNotIn('X-Profile-Id', self.get_trends())
+        # The secret is only taken from the header, never the (logged) query string
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('csrf-token'), {'profile': 'let-me-profile'}))
+        self.assertEqual(os.listdir(self.spool.name), [])
+
+
+    def test_request_is_served_unprofiled_when_the_profiler_cannot_start(self):
+        import os
+        from . import profiling
+
+        # As when another request is being traced on Python 3.12+
+        with (
+            patch.object(profiling.TracingProfiler, 'start', side_effect=ValueError('Another profiling tool is already active')),
+            self.assertLogs('api.profiling', 'WARNING') as logs,
+        ):
+            resp = self.get_trends(HTTP_X_PROFILE='let-me-profile', HTTP_X_PROFILE_MODE='trace')
+        self.assertIn('Not profiling GET', logs.output[0])
+        self.assertNotIn('X-Profile-Id', resp)
+        self.assertEqual(os.listdir(self.spool.name), [])
+
+
+    def test_spool_keeps_the_newest_profiles(self):
+        import os
+
+        with self.settings(PROFILING_SECRET='', PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_FILES=2):
+            ids = [self.client.get(reverse('csrf-token'))['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertLessEqual(len(os.listdir(self.spool.name)), 2)
+
+
+class QueryBudgetTest(TestCase):
+    """Requests are checked against their view's query budget; list, stats and sync endpoints don't grow N+1 queries."""
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='budgetuser', password='budgetpass')
+        self.profile = Profile.objects.create(
+            user=self.user, anilist_access_token='ani', mal_access_token='mal', tmdb_session_id='tmdb',
+            steam_id='STEAM_1', keep_local_on_sync=False,
+        )
+        # Real token authentication, so the budgets pay for looking the token up
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.custom_list = CustomList.objects.create(user=self.user, name='Favourites')
+
+
+    def assertConstantQueries(self, request, grow, sizes=(2, 12)):
+        """
+        Brings the data to each of `sizes` with `grow(size)` and asserts that
+        `request()`, with cold caches, runs the same number of queries at
+        every size and stays within its view's budget.
+        """
+        counts = {}
+        for size in sizes:
+            grow(size)
+            cache.clear()
+            auth_cache.clear()
+            with query_budget.track_queries() as log:
+                resp = request()
+            self.assertLess(resp.status_code, 400, resp.content)
+            counts[size] = log.count
+            budget = query_budget.view_budget(resp.wsgi_request)
+            if budget is not None:
+                self.assertLessEqual(log.count, budget, f"{resp.wsgi_request.path} is over its query budget")
+        self.assertEqual(len(set(counts.values())), 1, f"Query count grows with the data: {counts}")
+
+
+    def grow_library(self, size):
+        for i in range(UserMedia.objects.filter(profile=self.profile).count(), size):
+            media = Media.objects.create(media_type=Media.ANIME, primary_title=f'Budget show {i}', anilist_id=i + 1)
+            item = UserMedia.objects.create(profile=self.profile, media=media, status='COMPLETED', score=i % 10, progress=i)
+            CustomListEntry.objects.create(custom_list=self.custom_list, user_media=item)
+
+
+    def test_list_and_stats_queries_stay_constant(self):
+        urls = [
+            reverse('user-media-list'),
+            reverse('user-media-page'),
+            reverse('user-media-page') + '?fuzzy_title=Budgt+show',
+            reverse('user-media-changes') + '?since=0',
+            reverse('stats'),
+            reverse('custom-list-list'),
+            reverse('custom-list-entries', args=[self.custom_list.pk]),
+        ]
+        # The title index is built once per process, not per request
+        title_index.get_index()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertConstantQueries(lambda: self.client.get(url), self.grow_library)
+
+
+    def test_sync_queries_stay_constant(self):
+        size = 0
+
+        def anilist_list(token):
+            return [
+                {'status': 'CURRENT', 'score': 7, 'progress': i, 'media': {
+                    'id': 1000 + i, 'idMal': 2000 + i, 'title': {'romaji': f'Synced {i}', 'english': None},
+                    'coverImage': {'large': 'http://cover'}}}
+                for i in range(size)
+            ]
+
+        def mal_list(token, media_type):
+            return [
+                {'node': {'id': (3000 if media_type == 'ANIME' else 6000) + i, 'title': f'MAL {media_type} {i}',
+                          'main_picture': {'large': 'http://mal'}},
+                 'list_status': {'status': 'completed', 'score': 8, 'num_episodes_watched': 12}
+                 if media_type == 'ANIME' else {'status': 'completed', 'score': 8, 'num_chapters_read': 30}}
+                for i in range(size)
+            ]
+
+        def tmdb_list(account_id, session_id):
+            return [{'id': 4000 + i, 'title': f'Movie {i}', 'poster_path': '/p.jpg', 'rating': 7} for i in range(size)]
+
+        def steam_library(steam_id):
+            return [
+                {'appid': 5000 + i, 'name': f'Game {i}', 'header_image': 'http://game', 'playtime_minutes': i}
+                for i in range(size)
+            ]
+
+        def resize(new_size):
+            nonlocal size
+            size = new_size
+
+        with patch('api.views.anilist_service.fetch_full_user_list', side_effect=anilist_list), \
+                patch('api.views.anilist_service.fetch_full_user_manga_list', return_value=[]), \
+                patch('api.views.mal_service.fetch_user_list', side_effect=mal_list), \
+                patch('api.views.tmdb_service.get_account_details', return_value={'id': 42}), \
+                patch('api.views.tmdb_service.get_movie_watchlist', return_value=[]), \
+                patch('api.views.tmdb_service.get_tv_watchlist', return_value=[]), \
+                patch('api.views.tmdb_service.get_rated_movies', side_effect=tmdb_list), \
+                patch('api.views.tmdb_service.get_rated_tv', return_value=[]), \
+                patch('api.views.steam_service.get_user_library', side_effect=steam_library), \
+                patch('api.enrichment.notify'):
+            for name in ('sync-anilist', 'sync-mal', 'sync-tmdb', 'steam-sync'):
+                with self.subTest(endpoint=name):
+                    # Measured syncs then all find some rows already there and add others
+                    resize(1)
+                    self.client.post(reverse(name))
+                    self.assertConstantQueries(lambda: self.client.post(reverse(name)), resize)
+                    # Syncing an unchanged list again
+                    self.assertConstantQueries(lambda: self.client.post(reverse(name)), resize, sizes=(12, 12))
+
+
+    def test_requests_over_budget_are_logged(self):
+        from .views import StatsView
+
+        self.grow_library(3)
+        with patch.object(StatsView, 'query_budget', 1), self.assertLogs('api.query_budget', 'WARNING') as logs:
+            self.client.get(reverse('stats'))
+        self.assertIn('/api/stats/ ran', logs.output[0])
+        self.assertIn('(budget 1)', logs.output[0])
+
+
+    def test_repeated_query_shapes_are_reported(self):
+        self.grow_library(4)
+        with query_budget.track_queries() as log:
+            for item in UserMedia.objects.filter(profile=self.profile):
+                item.media.primary_title
+        self.assertEqual(log.count, 5)
+        (shape, times), = log.duplicates()
+        self.assertEqual(times, 4)
+        self.assertIn('"api_media"."id" = %s', shape)
+
+
+class ProviderReplayTest(TestCase):
+    """The recorded provider responses the endpoint benchmark replays (api/benchmarks/providers.py)."""
+
+    def setUp(self):
+        cache.clear()
+
+
+    def replay(self, list_size):
+        from .benchmarks.providers import ProviderReplay, parse_latency
+
+        return ProviderReplay(latency=parse_latency(['all=0']), list_size=list_size)
+
+
+    def test_library_lists_are_paginated_to_the_requested_size(self):
+        from .services import anilist_service, mal_service, steam_service
+
+        with self.replay(120) as replay:
+            anime = mal_service.fetch_user_list('token', 'ANIME')
+            self.assertEqual(replay.calls['mal'], 2)
+            self.assertEqual(len(anilist_service.fetch_full_user_manga_list('token')), 120)
+            # Viewer, then three pages of 50
+            self.assertEqual(replay.calls['anilist'], 4)
+            games = steam_service.get_user_library('76561197960287930')
+        self.assertEqual(len(anime), 120)
+        self.assertEqual(len({entry['node']['id'] for entry in anime}), 120)
+        self.assertEqual(len(games), 120)
+        self.assertTrue(all(game['header_image'] for game in games))
+        self.assertEqual(replay.unmatched, {})
+
+
+    def test_endpoints_are_served_from_the_recordings(self):
+        from requests.adapters import HTTPAdapter
+
+        send = HTTPAdapter.send
+        user = User.objects.create_user(username='replayuser', password='testpass')
+        Profile.objects.create(user=user, mal_access_token='token', keep_local_on_sync=False)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+        with self.replay(30) as replay, patch('api.enrichment.notify'):
+            search = client.get(reverse('media-search'), {'q': 'fullmetal'})
+            trends = client.get(reverse('trends'))
+            sync = client.post(reverse('sync-mal'))
+        self.assertEqual(search.status_code, 200)
+        self.assertEqual({item['media_type'] for item in search.data}, {'ANIME', 'MANGA', 'MOVIE', 'TV_SHOW', 'GAME', 'BOOK'})
+        self.assertTrue(all(trends.data[key] for key in ('ANIME', 'MANGA', 'MOVIE', 'TV_SHOW', 'GAME', 'BOOK')))
+        self.assertEqual(sync.status_code, 200)
+        self.assertEqual(UserMedia.objects.filter(profile=user.profile).count(), 60)
+        self.assertEqual(replay.unmatched, {})
+        self.assertIs(HTTPAdapter.send, send)
+
+
+class ProviderStandinTest(TestCase):
+    """The local provider stand-in (api/benchmarks/standin.py) and configurable provider URLs."""
+
+    def setUp(self):
+        import threading
+        from .benchmarks.providers import parse_latency
+        from .benchmarks.standin import make_server
+
+        self.server = make_server(port=0, latency=parse_latency(['all=0']), list_size=130)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+
+    def test_services_call_the_configured_urls(self):
+        from django.test import override_settings
+        from .services import mal_service, tmdb_service
+
+        with override_settings(
+            MAL_API_URL=f'{self.base}/api.myanimelist.net/v2',
+            TMDB_API_URL=f'{self.base}/api.themoviedb.org/3',
+        ):
+            manga = mal_service.fetch_user_list('token', 'MANGA')
+            movies = tmdb_service.search_movies('inception')
+        self.assertEqual(len(manga), 130)
+        self.assertEqual(movies[0]['title'], 'Inception')
+        self.assertEqual(self.server.responses[('mal', 200)], 2)
+        self.assertEqual(self.server.responses[('tmdb', 200)], 1)
+
+
+    def test_throttling_and_errors_are_injected(self):
+        import requests
+
+        url = f'{self.base}/api.rawg.io/api/games'
+        self.server.throttle_rate = 1.0
+        response = requests.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+        self.server.throttle_rate, self.server.error_rate = 0.0, 1.0
+        self.assertEqual(requests.get(url).status_code, 503)
+
+        self.server.error_rate = 0.0
+        self.assertEqual(requests.get(url).json()['results'][0]['name'], 'Grand Theft Auto V')
+        self.assertEqual(requests.get(f'{self.base}/example.com/').status_code, 404)
+
+
+class SingleThreadLiveServerThread(LiveServerThread):
+    # The live server shares the in-memory SQLite connection with its request threads, where
+    # two concurrent requests trip over each other's transactions; one request at a time
+    def _create_server(self, connections_override=None):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class LoadTestHarnessTest(LiveServerTestCase):
+    """The closed-loop load generator (api/benchmarks/load.py) against a live server."""
+
+    server_thread_class = SingleThreadLiveServerThread
+
+    def setUp(self):
+        cache.clear()
+        auth_cache.clear()
+
+
+    def test_users_sign_up_and_drive_the_mix(self):
+        from .benchmarks.load import LoadTest, parse_mix
+
+        lines = []
+        load = LoadTest(
+            self.live_server_url, users=2, duration=1.5, ramp_up=0, think_seconds=0, interval=0.5,
+            mix=parse_mix('library-page=1,update=1,stats=1,library-changes=1'), link=False, out=lines.append,
+        )
+        report = load.run()
+
+        self.assertEqual(report['users'], 2)
+        self.assertEqual(report['setup']['register']['statuses'], {'201': 2})
+        self.assertEqual(report['setup']['login']['statuses'], {'200': 2})
+        self.assertLessEqual(set(report['summary']), {'library-page', 'update', 'stats', 'library-changes'})
+        self.assertIn('stats', report['summary'])
+        self.assertEqual(report['total']['error_rate'], 0)
+        self.assertGreaterEqual(len(report['timeline']), 3)
+        self.assertIn('2 of 2 users signed up', '\n'.join(lines))
+        self.assertEqual(load.remove_users(), 2)
+
+
+    def test_mix_is_validated(self):
+        from .benchmarks.load import parse_mix
+
+        self.assertEqual(parse_mix('search=2,stats=1'), {'search': 2.0, 'stats': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix('checkout=1')
+        with self.assertRaises(ValueError):
+            parse_mix('search=0')
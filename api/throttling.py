@@ -0,0 +1,22 @@
+"""
+DRF throttles that count requests in the `THROTTLE_CACHE` alias, which the
+server profile points at the cache shared by all worker processes, so a
+client's rate is enforced across workers rather than per process.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import throttling
+
+
+class _ThrottleCacheMixin:
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+
+class AnonRateThrottle(_ThrottleCacheMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(_ThrottleCacheMixin, throttling.UserRateThrottle):
+    pass
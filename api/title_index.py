@@ -0,0 +1,381 @@
+"""
+In-memory trigram index over Media titles for typo-tolerant lookups.
+
+Titles are normalized (accents stripped, case folded, punctuation dropped)
+and split into words padded like PostgreSQL's pg_trgm does (`"  word "`), and
+each distinct trigram keeps an ascending `array('I')` posting list of the
+documents (titles) that contain it. Each Media row contributes one document
+per title (primary and secondary). Similarity is the Jaccard index of the two
+trigram sets, as pg_trgm's `similarity()`.
+
+Lookups count the query's rarest posting lists first and only read the more
+common ones when nothing good turned up, so their cost depends on how
+selective the query is rather than on the size of the catalog; a lookup on
+100k titles typically takes a fraction of a millisecond (see
+`python manage.py benchmark title_index`).
+
+The index is built from the database on first use and then kept up to date
+by the Media signals and the bulk write paths calling `update()`/`remove()`.
+Those only reach the process that wrote; where several workers share a
+SQLite database, TITLE_INDEX_REFRESH_SECONDS has each one rebuild its index
+when the Media table changed (see `get_index()`).
+Changed and deleted rows leave dead documents behind that lookups skip; the
+arrays are compacted once they make up a quarter of the index.
+
+On PostgreSQL, lookups run in the database instead, with pg_trgm's `%`
+operator against the GIN indexes of migration 0029, so several worker
+processes share one up-to-date index rather than each building its own.
+pg_trgm only matches above its `similarity_threshold` (0.3 by default), so
+lower thresholds find nothing more there.
+"""
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from itertools import chain
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Sum
+
+from .models import Media
+
+# Posting entries counted before checking whether the best match is good enough
+FIRST_PASS_POSTINGS = 1000
+MAX_POSTINGS = 3000
+# A match this similar ends the lookup after the first pass
+GOOD_SIMILARITY = 0.5
+# Documents whose exact similarity is computed, by number of shared rare trigrams
+CANDIDATES = 32
+DEFAULT_THRESHOLD = 0.3
+
+MEDIA_TYPES = [choice for choice, _label in Media.MEDIA_TYPE_CHOICES]
+_TYPE_CODES = {media_type: code for code, media_type in enumerate(MEDIA_TYPES)}
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(title):
+    """`"Kaguya-sama: Love Is War"` -> `"kaguya sama love is war"`."""
+    decomposed = unicodedata.normalize('NFKD', title or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(_NON_ALNUM.sub(' ', stripped.casefold()).split())
+
+
+def trigrams(normalized):
+    grams = set()
+    for word in normalized.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TitleIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._trigram_ids = {}
+        self._postings = []
+        # Trigram ids of every document, back to back; document d owns [offsets[d], offsets[d + 1])
+        self._doc_trigrams = array('I')
+        self._doc_offsets = array('I', [0])
+        self._doc_media = array('q')
+        self._doc_types = bytearray()
+        self._doc_titles = []
+        self._live = bytearray()
+        self._media_docs = {}
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._doc_titles) - self._dead
+
+    def _add(self, media_id, media_type, titles):
+        docs = []
+        for title in dict.fromkeys(title for title in titles if title):
+            grams = trigrams(normalize(title))
+            if not grams:
+                continue
+            doc = len(self._doc_titles)
+            for gram in grams:
+                trigram_id = self._trigram_ids.get(gram)
+                if trigram_id is None:
+                    trigram_id = self._trigram_ids[gram] = len(self._postings)
+                    self._postings.append(array('I'))
+                self._postings[trigram_id].append(doc)
+                self._doc_trigrams.append(trigram_id)
+            self._doc_offsets.append(len(self._doc_trigrams))
+            self._doc_media.append(media_id)
+            self._doc_types.append(_TYPE_CODES.get(media_type, 255))
+            self._doc_titles.append(title)
+            self._live.append(1)
+            docs.append(doc)
+        if docs:
+            self._media_docs[media_id] = docs
+
+    def _remove(self, media_id):
+        for doc in self._media_docs.pop(media_id, ()):
+            self._live[doc] = 0
+            self._dead += 1
+
+    def _compact(self):
+        live = [
+            (self._doc_media[doc], MEDIA_TYPES[code] if code < len(MEDIA_TYPES) else None, self._doc_titles[doc])
+            for doc, code in enumerate(self._doc_types) if self._live[doc]
+        ]
+        self._clear()
+        by_media = {}
+        for media_id, media_type, title in live:
+            by_media.setdefault((media_id, media_type), []).append(title)
+        for (media_id, media_type), titles in by_media.items():
+            self._add(media_id, media_type, titles)
+
+    def load(self, rows):
+        """Replaces the contents with `(media_id, media_type, primary_title, secondary_title)` rows."""
+        with self._lock:
+            self._clear()
+            for media_id, media_type, *titles in rows:
+                self._add(media_id, media_type, titles)
+
+    def update(self, media_list):
+        """(Re)indexes the titles of `media_list`."""
+        with self._lock:
+            for media in media_list:
+                self._remove(media.pk)
+                self._add(media.pk, media.media_type, [media.primary_title, media.secondary_title])
+            if self._dead > len(self._doc_titles) // 4:
+                self._compact()
+
+    def remove(self, media_ids):
+        with self._lock:
+            for media_id in media_ids:
+                self._remove(media_id)
+
+    def _score(self, query_ids, query_size, counts, media_types, threshold, within=None):
+        offsets, doc_trigrams = self._doc_offsets, self._doc_trigrams
+        if within is None:
+            candidates = counts.most_common(CANDIDATES)
+        else:
+            # Every document of the allowed rows: they are few enough to score all
+            candidates = [(doc, shared) for doc, shared in counts.items() if self._doc_media[doc] in within]
+        matches = []
+        for doc, _shared in candidates:
+            if not self._live[doc] or (media_types is not None and self._doc_types[doc] not in media_types):
+                continue
+            start, end = offsets[doc], offsets[doc + 1]
+            shared = len(query_ids.intersection(doc_trigrams[start:end]))
+            similarity = shared / (query_size + end - start - shared)
+            if similarity >= threshold:
+                matches.append((similarity, doc))
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return matches
+
+    def search(self, query, limit=10, threshold=DEFAULT_THRESHOLD, media_types=None, within=None):
+        """
+        Returns up to `limit` (None for all) `(similarity, media_id, title)`
+        matches for `query`, best first, one per Media row. `within`, a set
+        of media ids, restricts the matches to those rows; all of their
+        titles sharing a trigram with the query are then scored, however
+        common the trigram.
+        """
+        grams = trigrams(normalize(query))
+        if not grams:
+            return []
+        codes = None if media_types is None else {_TYPE_CODES[t] for t in media_types if t in _TYPE_CODES}
+        with self._lock:
+            postings = self._postings
+            known = sorted(
+                (self._trigram_ids[gram] for gram in grams if gram in self._trigram_ids),
+                key=lambda trigram_id: len(postings[trigram_id]),
+            )
+            query_ids = set(known)
+            counts = Counter()
+            budget, scanned, position = FIRST_PASS_POSTINGS, 0, 0
+            if within is not None:
+                budget = float('inf')
+            while True:
+                # Rarest lists first; always at least one more list per pass
+                end = position
+                while end < len(known) and (end == position or scanned + len(postings[known[end]]) <= budget):
+                    scanned += len(postings[known[end]])
+                    end += 1
+                counts.update(chain.from_iterable(postings[trigram_id] for trigram_id in known[position:end]))
+                matches = self._score(query_ids, len(grams), counts, codes, threshold, within)
+                if end >= len(known) or budget >= MAX_POSTINGS or (matches and matches[0][0] >= GOOD_SIMILARITY):
+                    break
+                position, budget = end, MAX_POSTINGS
+
+            results, seen = [], set()
+            for similarity, doc in matches:
+                media_id = self._doc_media[doc]
+                if media_id not in seen:
+                    seen.add(media_id)
+                    results.append((similarity, media_id, self._doc_titles[doc]))
+                    if len(results) == limit:
+                        break
+            return results
+
+
+_index = None
+_build_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+# Media table fingerprint the index was built from, and when it was last compared
+_built_from = None
+_checked_at = 0.0
+
+
+def _fingerprint():
+    """Changes with every created, deleted or renamed (version bumped) Media row."""
+    totals = Media.objects.aggregate(rows=Count('pk'), last=Max('pk'), versions=Sum('version'))
+    return totals['rows'], totals['last'], totals['versions']
+
+
+def _build():
+    global _index, _built_from, _checked_at
+    fingerprint = _fingerprint()
+    index = TitleIndex()
+    index.load(Media.objects.values_list('pk', 'media_type', 'primary_title', 'secondary_title').iterator())
+    _index, _built_from, _checked_at = index, fingerprint, time.monotonic()
+
+
+def refresh():
+    """
+    Rebuilds the index if the Media table changed since it was built:
+    writes by other worker processes never reach this one's index. Returns
+    True if it was rebuilt.
+    """
+    global _checked_at
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        _checked_at = time.monotonic()
+        if _index is None or _fingerprint() == _built_from:
+            return False
+        # Lookups keep using the current index until the new one is swapped in
+        _build()
+        return True
+    finally:
+        _refresh_lock.release()
+
+
+def _refresh_in_background():
+    try:
+        refresh()
+    finally:
+        connection.close()
+
+
+def get_index():
+    """
+    The process-wide index, built from the database on first use. With
+    TITLE_INDEX_REFRESH_SECONDS set (the server profile, whose workers each
+    keep their own index), it is rebuilt in the background when the table
+    has changed, checked at most that often.
+    """
+    global _checked_at
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                _build()
+    interval = getattr(settings, 'TITLE_INDEX_REFRESH_SECONDS', None)
+    if interval and time.monotonic() - _checked_at >= interval and not _refresh_lock.locked():
+        # Set now so concurrent lookups don't start more threads
+        _checked_at = time.monotonic()
+        threading.Thread(target=_refresh_in_background, name='title-index-refresh', daemon=True).start()
+    return _index
+
+
+def update(media_list):
+    """Reindexes saved rows, if the index has been built."""
+    if _index is not None:
+        _index.update(media_list)
+
+
+def remove(media_ids):
+    if _index is not None:
+        _index.remove(media_ids)
+
+
+def reset():
+    """Drops the index; the next lookup rebuilds it from the database."""
+    global _index, _built_from
+    _index = _built_from = None
+
+
+def uses_database():
+    """True when lookups are answered by PostgreSQL rather than the in-memory index."""
+    return connection.vendor == 'postgresql'
+
+
+def _database_lookup(query, limit, threshold, media_types, within):
+    from django.contrib.postgres.search import TrigramSimilarity
+    from django.db.models import Q
+    from django.db.models.functions import Greatest
+
+    matches = Media.objects.filter(Q(primary_title__trigram_similar=query) | Q(secondary_title__trigram_similar=query))
+    if media_types is not None:
+        matches = matches.filter(media_type__in=media_types)
+    if within is not None:
+        matches = matches.filter(pk__in=within)
+    rows = matches.annotate(
+        primary=TrigramSimilarity('primary_title', query),
+        secondary=TrigramSimilarity('secondary_title', query),
+    ).annotate(
+        # GREATEST skips the NULL of a missing secondary title
+        similarity=Greatest('primary', 'secondary'),
+    ).filter(similarity__gte=threshold).order_by('-similarity', 'pk').values_list(
+        'pk', 'primary_title', 'secondary_title', 'primary', 'secondary',
+    )[:limit]
+    return [
+        (max(primary or 0, secondary or 0), media_id,
+         primary_title if (primary or 0) >= (secondary or 0) else secondary_title)
+        for media_id, primary_title, secondary_title, primary, secondary in rows
+    ]
+
+
+def lookup(query, limit=10, threshold=DEFAULT_THRESHOLD, media_types=None, within=None):
+    """
+    `(similarity, media_id, title)` matches, best first; see
+    `TitleIndex.search()`. `within` may be a queryset of media ids, which
+    PostgreSQL runs as a subquery.
+    """
+    if uses_database():
+        if not normalize(query):
+            return []
+        return _database_lookup(query, limit, threshold, media_types, within)
+    if within is not None:
+        within = set(within)
+    return get_index().search(query, limit=limit, threshold=threshold, media_types=media_types, within=within)
+
+
+def suggestions(query, media_types=None, limit=5):
+    """
+    "Did you mean" titles for `query`: close local titles, each title once,
+    leaving out the query itself.
+    """
+    wanted = normalize(query)
+    results, seen = [], {wanted}
+    for similarity, media_id, title in lookup(query, limit=limit * 4, media_types=media_types):
+        key = normalize(title)
+        if key not in seen:
+            seen.add(key)
+            results.append({'title': title, 'media_id': media_id, 'similarity': round(similarity, 3)})
+            if len(results) == limit:
+                break
+    return results
+
+
+def similar_media(media, threshold=0.6, limit=10):
+    """Other rows of `media`'s type with a close title: candidates for cross-provider duplicates."""
+    matches = {}
+    for title in (media.primary_title, media.secondary_title):
+        if not title:
+            continue
+        for similarity, media_id, _title in lookup(title, limit=limit + 1, threshold=threshold,
+                                                   media_types=[media.media_type]):
+            if media_id != media.pk:
+                matches[media_id] = max(similarity, matches.get(media_id, 0))
+    return sorted(matches.items(), key=lambda item: -item[1])[:limit]
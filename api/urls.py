@@ -1,10 +1,10 @@
 from django.urls import path
 from .views import (
-    MediaSearchView, AniListLoginView, AniListCallbackView, UserMediaListView,
-    csrf_token_view, mal_status,
+    MediaSearchView, MediaBatchView, AniListLoginView, AniListCallbackView, UserMediaListView, UserMediaPageView, UserMediaChangesView,
+    csrf_token_view, readiness_view, metrics_view, mal_status,
     RegisterView, LoginView, SyncAniListView, UserMediaAddView,
     UserMediaUpdateView, TMDBLoginView, TMDBCallbackView, SyncTMDBView, 
-    StatsView, UserMediaDeleteView, TrendsView, SyncMALView,
+    StatsView, UserMediaDeleteView, UserMediaBatchView, TrendsView, SyncMALView,
     MALLoginView, MALCallbackView, ProfileOptionsView,
     SteamConnectView, SteamCallbackView, SteamSyncView,
 )
@@ -39,9 +39,12 @@ urlpatterns = [
 
     # User Media List
     path('user/list/', UserMediaListView.as_view(), name='user-media-list'),
+    path('user/library/', UserMediaPageView.as_view(), name='user-media-page'),
+    path('user/list/changes', UserMediaChangesView.as_view(), name='user-media-changes'),
     path('list/add/', UserMediaAddView.as_view(), name='user-media-add'), 
     path('list/update/<int:pk>/', UserMediaUpdateView.as_view(), name='user-media-update'),
     path("list/delete/<int:pk>/", UserMediaDeleteView.as_view(), name="user_media_delete"),
+    path('list/batch/', UserMediaBatchView.as_view(), name='user-media-batch'),
     path('stats/', StatsView.as_view(), name='stats'),
     path("options/", ProfileOptionsView.as_view(), name="profile-options"),
 
@@ -63,8 +66,11 @@ urlpatterns = [
     # ----------------------------------------
 
     path('search/', MediaSearchView.as_view(), name='media-search'),
+    path('media/batch', MediaBatchView.as_view(), name='media-batch'),
     path('trends/', TrendsView.as_view(), name='trends'),
     path('csrf/', csrf_token_view, name='csrf-token'),
+    path('ready/', readiness_view, name='readiness'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Custom Lists & Entries
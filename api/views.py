@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
 from django.utils.decorators import method_decorator
 from django.db.models import Count
 from django.views.decorators.csrf import csrf_exempt
@@ -19,8 +20,13 @@ import traceback
 from .services import (
     anilist_service, tmdb_service, steam_service, google_books_service, mal_service, rawg_service
 )
+from . import (
+    batch, changes, columnar, identity, media_details, metrics, pagination, startup, stats, sync, title_index,
+)
+from .caching import versioned_response
+from .fieldsets import restrict_queryset
 from .models import Media, Profile, UserMedia, TMDBRequestToken, MALAuthRequest
-from .serializers import UserMediaSerializer, ProfileOptionsSerializer
+from .serializers import UserMediaSerializer, ProfileOptionsSerializer, CustomListEntryChangeSerializer
 
 
 # ==============================================================================
@@ -88,7 +94,7 @@ class SteamCallbackView(APIView):
             except Exception as e:
                 print(f"Error getting Steam profile: {e}")
             
-            profile.save()
+            profile.save(update_fields=['steam_id', 'steam_username'])
 
             # Return success response that will trigger the window to close
             return Response(
@@ -102,6 +108,7 @@ class SteamCallbackView(APIView):
 class SteamSyncView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 16
 
     def post(self, request):
         profile = request.user.profile
@@ -110,46 +117,8 @@ class SteamSyncView(APIView):
 
         try:
             games = steam_service.get_user_library(profile.steam_id)
-            games_added = 0
-
-            for game in games:
-                # Create or update the game in our database
-                media, created = Media.objects.get_or_create(
-                    media_type=Media.GAME,
-                    steam_appid=game['appid'],  # Use Steam's appid as the unique identifier
-                    defaults={
-                        'primary_title': game['name'],
-                        'cover_image_url': game['header_image'],
-                        'description': game.get('description', ''),
-                    }
-                )
-                
-                # Update the title and cover image even if the game exists
-                if not created:
-                    media.primary_title = game['name']
-                    media.cover_image_url = game['header_image']
-                    media.description = game.get('description', '')
-                    media.save()
-
-                # Create or update user's game entry with playtime
-                user_media, created = UserMedia.objects.get_or_create(
-                    profile=profile,
-                    media=media,
-                    defaults={
-                        'status': UserMedia.IN_PROGRESS if game['playtime_minutes'] > 0 else UserMedia.PLANNED,
-                        'progress': game['playtime_minutes']  # Already in minutes from Steam
-                    }
-                )
-
-                if not created:
-                    # Update existing entry's playtime
-                    user_media.progress = game['playtime_minutes']
-                    # Update status if needed
-                    if game['playtime_minutes'] > 0 and user_media.status == UserMedia.PLANNED:
-                        user_media.status = UserMedia.IN_PROGRESS
-                    user_media.save()
-
-                games_added += 1
+            sync.import_steam_library(profile, games)
+            games_added = len(games)
 
             return Response({
                 "success": f"Successfully imported {games_added} games from Steam library"
@@ -168,6 +137,29 @@ def csrf_token_view(request):
     return JsonResponse({"detail": "CSRF cookie set."})
 
 
+def readiness_view(request):
+    """
+    Readiness probe for load balancers and process managers: 200 once the
+    database answers and is migrated, 503 until then. Needs no login.
+    """
+    ready, checks = startup.readiness()
+    return JsonResponse({"ready": ready, "checks": checks}, status=200 if ready else 503)
+
+
+def metrics_view(request):
+    """
+    This process's request, provider, cache and queue metrics for Prometheus
+    (see api/metrics.py). Only for scrapers sending `Authorization: Bearer
+    <METRICS_TOKEN>`; a 404 for everyone while no token is set.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        raise Http404
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 class ProfileOptionsView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
@@ -203,97 +195,14 @@ class ProfileOptionsView(APIView):
 class StatsView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 8
 
     def get(self, request):
         profile = request.user.profile
-        
-        # Get all items for time calculation
-        all_items = UserMedia.objects.filter(profile=profile)
-        # Get only completed items with scores for score calculation
-        completed_list = UserMedia.objects.filter(profile=profile, status='COMPLETED', score__isnull=False)
-
-        overall_stats = {'total_completed': completed_list.count(), 'weighted_average_score': 0}
-        per_type_stats = {}
-        
-        time_spent_minutes = {
-            'OVERALL': 0, Media.ANIME: 0, Media.MOVIE: 0, Media.TV_SHOW: 0,
-            Media.MANGA: 0, Media.BOOK: 0, Media.GAME: 0,
-        }
-        total_weighted_score = 0
-        total_weight = 0
-        type_weighted_scores = {}
-        type_weights = {}
-
-        # First calculate time spent from all items
-        for item in all_items:
-            if item.progress <= 0:  # Skip items with no progress
-                continue
-                
-            media_type = item.media.media_type
-            
-            # Calculate time in minutes for this item
-            minutes = 0
-            if media_type == Media.ANIME: minutes = item.progress * 25
-            elif media_type == Media.MOVIE: minutes = item.progress * 120
-            elif media_type == Media.TV_SHOW: minutes = item.progress * (20 if item.progress > 100 else 45)
-            elif media_type == Media.GAME: minutes = item.progress  # Already in minutes from Steam
-            elif media_type == Media.BOOK: minutes = item.progress * 360
-            elif media_type == Media.MANGA: minutes = item.progress * 10
-            
-            # Add to total time if there's any progress
-            if minutes > 0:
-                time_spent_minutes[media_type] += minutes
-
-        # Then calculate scores from completed items
-        for item in completed_list:
-            media_type = item.media.media_type
-            score = item.score
-            
-            # Calculate weight for scoring (keeping original logic)
-            weight = 0
-            if media_type == Media.ANIME: weight = item.progress * 25
-            elif media_type == Media.MOVIE: weight = item.progress * 120
-            elif media_type == Media.TV_SHOW: weight = item.progress * (20 if item.progress > 100 else 45)
-            elif media_type == Media.GAME: weight = item.progress  # Already in minutes from Steam
-            elif media_type == Media.BOOK: weight = item.progress * 360
-            elif media_type == Media.MANGA: weight = item.progress * 10
-            
-            # Use a default weight of 1 for items with 0 progress to include them in the average
-            if weight == 0: weight = 1
-
-            # 2. Add this weight to our totals
-            time_spent_minutes[media_type] += weight
-            total_weight += weight
-            total_weighted_score += score * weight #type: ignore
-
-            # Initialize per-type dictionaries
-            if media_type not in per_type_stats:
-                per_type_stats[media_type] = {'total_completed': 0, 'weighted_average_score': 0}
-                type_weighted_scores[media_type] = 0
-                type_weights[media_type] = 0
-            
-            # Per-type calculation
-            type_weighted_scores[media_type] += score * weight #type: ignore
-            type_weights[media_type] += weight
-            per_type_stats[media_type]['total_completed'] += 1
-
-        # Finalize averages
-        if total_weight > 0:
-            overall_stats['weighted_average_score'] = round(total_weighted_score / total_weight, 2) #type: ignore
-        
-        for media_type, weighted_score in type_weighted_scores.items():
-            if type_weights.get(media_type, 0) > 0:
-                avg = round(weighted_score / type_weights[media_type], 2)
-                per_type_stats[media_type]['weighted_average_score'] = avg
-        
-        time_spent_minutes['OVERALL'] = sum(time_spent_minutes.values())
-        time_spent_hours = {key: round(value / 60, 1) for key, value in time_spent_minutes.items()}
-
-        response_data = {
-            'overall': overall_stats, 'by_type': per_type_stats, 'time_spent_hours': time_spent_hours,
-        }
-        
-        return Response(response_data)
+        # Time spent and weighted scores are aggregated per media type in the database
+        return versioned_response(
+            request, profile, 'stats', lambda: stats.build_stats_payload(stats.load_buckets(profile))
+        )
 
 class TrendsView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
@@ -301,7 +210,7 @@ class TrendsView(APIView):
 
     def get(self, request):
         trends = {}
-        with concurrent.futures.ThreadPoolExecutor() as executor:
+        with metrics.track_pool('trends', concurrent.futures.ThreadPoolExecutor()) as executor:
             # Submit all tasks
             anime_future = executor.submit(anilist_service.get_trending_anime)
             manga_future = executor.submit(anilist_service.get_trending_manga)
@@ -433,7 +342,7 @@ class AniListCallbackView(APIView):
             anilist_profile = anilist_service.get_viewer_profile(access_token)
             profile.anilist_username = anilist_profile['name']
             profile.anilist_access_token = access_token
-            profile.save()
+            profile.save(update_fields=['anilist_username', 'anilist_access_token'])
 
             return Response(
                 "<html><body><script>window.close();</script>Login successful, you can close this window.</body></html>",
@@ -479,7 +388,7 @@ class TMDBCallbackView(APIView):
             session_id = tmdb_service.create_session_id(approved_token)
 
             profile.tmdb_session_id = session_id
-            profile.save()
+            profile.save(update_fields=['tmdb_session_id'])
 
             # Clean up the temporary token from the database
             token_entry.delete()
@@ -544,7 +453,7 @@ class MALCallbackView(APIView):
             profile.mal_username = user_info['name']
             profile.mal_access_token = access_token
             profile.mal_refresh_token = refresh_token
-            profile.save()
+            profile.save(update_fields=['mal_username', 'mal_access_token', 'mal_refresh_token'])
 
             # Clean up the temporary auth request
             auth_request.delete()
@@ -616,6 +525,11 @@ class UserMediaUpdateView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class MediaSearchView(APIView):
+    """
+    Searches the providers selected in `sources`. With `?suggest=1` the
+    response becomes `{"results": [...], "suggestions": [...]}`, adding
+    close titles from the local catalog for misspelt queries.
+    """
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
@@ -629,7 +543,7 @@ class MediaSearchView(APIView):
         sources = sources_str.split(',')
        
         results = []
-        with concurrent.futures.ThreadPoolExecutor() as executor:
+        with metrics.track_pool('search', concurrent.futures.ThreadPoolExecutor()) as executor:
             future_to_source = {}
            
             if 'ANIME' in sources:
@@ -665,7 +579,7 @@ class MediaSearchView(APIView):
                     if source_type == 'ANIME' or source_type == 'MANGA':
                         for item in data:
                             results.append({
-                                "api_source": "ANILIST", "api_id": item['id'],
+                                "api_source": "ANILIST", "api_id": item['id'], "mal_id": item.get('idMal'),
                                 "primary_title": item['title']['romaji'], "secondary_title": item['title']['english'],
                                 "media_type": source_type,
                                 "cover_image_url": item['coverImage']['large']
@@ -740,9 +654,32 @@ class MediaSearchView(APIView):
                             })
                 except Exception as exc:
                     print(f'{source_type} search generated an exception: {exc}')
-       
+
+        if request.query_params.get('suggest', '').lower() in ('1', 'true', 'yes'):
+            # "Did you mean": close titles already in the local catalog
+            media_types = [source for source in sources if source in title_index.MEDIA_TYPES]
+            return Response({"results": results, "suggestions": title_index.suggestions(query, media_types or None)})
         return Response(results)
 
+class MediaBatchView(APIView):
+    """
+    Full details for up to `media_details.MAX_IDS` media: `?ids=1,2,3`.
+    With `?enrich=1`, missing descriptions and lengths are first fetched
+    from the providers the items came from, waiting at most
+    `media_details.ENRICH_TIMEOUT_SECONDS`; the rest arrive later.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            ids = media_details.parse_ids(request.query_params.get('ids', ''))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        enrich = request.query_params.get('enrich', '').lower() in ('1', 'true', 'yes')
+        results, missing = media_details.get_details(ids, enrich=enrich)
+        return Response({"results": results, "missing": missing})
+
 class UserMediaAddView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
@@ -771,16 +708,13 @@ class UserMediaAddView(APIView):
                 'cover_image_url': media_data.get('cover_image_url'),
                 'description': media_data.get('description'),
             }
-            if api_source == 'ANILIST':
-                media_obj, _ = Media.objects.update_or_create(anilist_id=api_id, media_type=media_data.get('media_type'), defaults=defaults)
-            elif api_source == 'TMDB':
-                media_obj, _ = Media.objects.update_or_create(tmdb_id=api_id, media_type=media_data.get('media_type'), defaults=defaults)
-            elif api_source == 'RAWG':
-                media_obj, _ = Media.objects.update_or_create(rawg_id=api_id, media_type=media_data.get('media_type'), defaults=defaults)
-            elif api_source == 'GOOGLE':
-                 media_obj, _ = Media.objects.update_or_create(google_book_id=api_id, media_type=media_data.get('media_type'), defaults=defaults)
-            else:
+            if api_source not in ('ANILIST', 'TMDB', 'RAWG', 'GOOGLE'):
                 return Response({"error": "Invalid api_source"}, status=status.HTTP_400_BAD_REQUEST)
+            ids = {api_source: api_id}
+            if api_source == 'ANILIST':
+                # AniList search results carry the MyAnimeList id, which links them to MAL-synced rows
+                ids['MAL'] = media_data.get('mal_id')
+            [media_obj] = identity.upsert_media([{'ids': ids, 'media_type': media_data.get('media_type'), **defaults}])
 
 
 
@@ -839,16 +773,103 @@ class UserMediaDeleteView(APIView):
         except UserMedia.DoesNotExist:
             return Response({"error": "Item not found in your list."}, status=status.HTTP_404_NOT_FOUND)
         
+class UserMediaBatchView(APIView):
+    """
+    Applies many library changes in one request:
+    `{"add": [<same body as list/add>], "update": [{"id", "status"?, "score"?, "progress"?}], "delete": [ids]}`.
+    Nothing is written unless every operation is valid.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            results = batch.apply_user_media_batch(request.user.profile, request.data)
+        except batch.BatchValidationError as e:
+            return Response({"errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
 class UserMediaListView(APIView):
     # Tell this view to use ExpiringTokenAuthentication instead of SessionAuthentication
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 4
+
+    def get(self, request):
+        user_profile = request.user.profile
+
+        def compute():
+            user_media_list = UserMedia.objects.filter(profile=user_profile).select_related('media').order_by('-score')
+            # `?fields=` / `?expand=` trim both the output and the columns loaded
+            serializer = UserMediaSerializer(many=True, context={'request': request})
+            serializer.instance = restrict_queryset(user_media_list, serializer)
+            data = serializer.data
+            # Opt-in compact layout, see api/columnar.py
+            if columnar.columnar_requested(request):
+                return columnar.encode_user_media(data)
+            return data
+
+        return versioned_response(request, user_profile, 'user-media-list', compute)
+
+class UserMediaPageView(APIView):
+    """
+    One page of the user's library, filtered and sorted on the server.
+
+    Query parameters: `status`, `media_type` (comma separated), `min_score`,
+    `max_score`, `title` (prefix), `fuzzy_title` (typo-tolerant, see
+    api/title_index.py), `sort` (`score`, `title`, `progress`,
+    `-` prefix for descending; default `-score`), `limit` and `cursor`
+    (the `next_cursor` of the previous page), plus `fields` / `expand`
+    (see api/fieldsets.py).
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # A score-sorted page reaching the unscored items reads two index ranges
+    query_budget = 5
 
     def get(self, request):
         user_profile = request.user.profile
-        user_media_list = UserMedia.objects.filter(profile=user_profile).order_by('-score')
-        serializer = UserMediaSerializer(user_media_list, many=True)
-        return Response(serializer.data)
+        params = request.query_params
+
+        def compute():
+            serializer = UserMediaSerializer(many=True, context={'request': request})
+            queryset = restrict_queryset(UserMedia.objects.filter(profile=user_profile).select_related('media'), serializer)
+            serializer.instance, next_cursor = pagination.paginate_library(pagination.filter_library(queryset, params), params)
+            return {'results': serializer.data, 'next_cursor': next_cursor}
+
+        try:
+            return versioned_response(request, user_profile, 'user-media-page', compute)
+        except pagination.InvalidPageRequest as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class UserMediaChangesView(APIView):
+    """
+    Library changes after `?since=<seq>`, for clients keeping a local mirror.
+
+    Returns the changed UserMedia rows and custom list entries, the ids
+    deleted since then, and the `seq` to send on the next call. When `reset`
+    is true the client is too far behind and must reload the full library.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 6
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({"error": "since must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = changes.changes_since(request.user.profile, since)
+        if result['reset']:
+            return Response({'reset': True, 'seq': result['seq']})
+        return Response({
+            'reset': False,
+            'seq': result['seq'],
+            'user_media': UserMediaSerializer(result['user_media'], many=True).data,
+            'custom_list_entries': CustomListEntryChangeSerializer(result['custom_list_entries'], many=True).data,
+            'deleted': result['deleted'],
+        })
 
 # ==============================================================================
 # Synchronization Views (Importing Lists from External APIs)
@@ -857,6 +878,7 @@ class UserMediaListView(APIView):
 class SyncMALView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 16
     
     def post(self, request):
         profile = request.user.profile
@@ -864,7 +886,7 @@ class SyncMALView(APIView):
             return Response({"error": "MyAnimeList account not linked."}, status=400)
 
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
+            with metrics.track_pool('mal-sync', concurrent.futures.ThreadPoolExecutor()) as executor:
                 anime_future = executor.submit(mal_service.fetch_user_list, profile.mal_access_token, "ANIME")
                 manga_future = executor.submit(mal_service.fetch_user_list, profile.mal_access_token, "MANGA")
                 
@@ -872,50 +894,9 @@ class SyncMALView(APIView):
                 manga_list = manga_future.result()
             
             full_list = anime_list + manga_list
-            status_map = {
-                'watching': 'IN_PROGRESS', 'reading': 'IN_PROGRESS',
-                'completed': 'COMPLETED',
-                'on_hold': 'PAUSED',
-                'dropped': 'DROPPED',
-                'plan_to_watch': 'PLANNED', 'plan_to_read': 'PLANNED',
-            }
-
-            for entry in full_list:
-                node = entry['node']
-                list_status = entry['list_status']
-                media_type = Media.ANIME if 'num_episodes_watched' in list_status else Media.MANGA
-
-                media_obj, _ = Media.objects.update_or_create(
-                    mal_id=node['id'],
-                    defaults={
-                        'media_type': media_type,
-                        'primary_title': node['title'],
-                        'cover_image_url': node.get('main_picture', {}).get('large')
-                    }
-                )
-                
-                if profile.keep_local_on_sync:
-                    # Don't overwrite existing entries; only create if missing
-                    UserMedia.objects.get_or_create(
-                        profile=profile,
-                        media=media_obj,
-                        defaults={
-                            'status': status_map.get(list_status['status'], 'PLANNED'),
-                            'score': list_status['score'],
-                            'progress': list_status.get('num_episodes_watched') or list_status.get('num_chapters_read', 0)
-                        }
-                    )
-                else:
-                    # Overwrite with remote data
-                    UserMedia.objects.update_or_create(
-                        profile=profile,
-                        media=media_obj,
-                        defaults={
-                            'status': status_map.get(list_status['status'], 'PLANNED'),
-                            'score': list_status['score'],
-                            'progress': list_status.get('num_episodes_watched') or list_status.get('num_chapters_read', 0)
-                        }
-                    )
+            sync.import_entries(
+                profile, [sync.mal_entry(entry) for entry in full_list], overwrite=not profile.keep_local_on_sync
+            )
 
             return Response({"success": f"MyAnimeList sync complete. Processed {len(full_list)} items."})
         except Exception as e:
@@ -925,6 +906,7 @@ class SyncMALView(APIView):
 class SyncAniListView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 16
 
     def post(self, request):
         profile = request.user.profile
@@ -932,57 +914,18 @@ class SyncAniListView(APIView):
             return Response({"error": "AniList account not linked."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
+            with metrics.track_pool('anilist-sync', concurrent.futures.ThreadPoolExecutor()) as executor:
                 anime_future = executor.submit(anilist_service.fetch_full_user_list, profile.anilist_access_token)
                 manga_future = executor.submit(anilist_service.fetch_full_user_manga_list, profile.anilist_access_token)
 
                 anime_list = anime_future.result()
                 manga_list = manga_future.result()
 
-            full_list = anime_list + manga_list # Combine the results
-
-            # The rest of the logic is the same, but now processes both
-            status_map = { 
-                            'CURRENT': 'IN_PROGRESS',
-                            'PLANNING': 'PLANNED',
-                            'COMPLETED': 'COMPLETED',
-                            'DROPPED': 'DROPPED',
-                            'PAUSED': 'PAUSED', 
-                        }
-
-            for entry in full_list:
-                media_data = entry['media']
-
-                # Determine media type based on which list it came from
-                # (A more robust way would check the 'format' field from AniList)
-                media_type = Media.MANGA if entry in manga_list else Media.ANIME
-
-                media_obj, _ = Media.objects.update_or_create(
-                    anilist_id=media_data['id'],
-                    defaults={
-                        'primary_title': media_data['title']['romaji'],
-                        'secondary_title': media_data['title']['english'],
-                        'media_type': media_type,
-                        'cover_image_url': media_data['coverImage']['large'],
-                    }
-                )
-
-                app_status = status_map.get(entry['status'], 'PLANNED')
-
-                if profile.keep_local_on_sync:
-                    UserMedia.objects.get_or_create(
-                        profile=profile,
-                        media=media_obj,
-                        defaults={'status': app_status, 'score': entry['score'], 'progress': entry['progress']}
-                    )
-                else:
-                    UserMedia.objects.update_or_create(
-                        profile=profile,
-                        media=media_obj,
-                        defaults={'status': app_status, 'score': entry['score'], 'progress': entry['progress']}
-                    )
+            entries = [sync.anilist_entry(entry, Media.ANIME) for entry in anime_list]
+            entries += [sync.anilist_entry(entry, Media.MANGA) for entry in manga_list]
+            sync.import_entries(profile, entries, overwrite=not profile.keep_local_on_sync)
 
-            return Response({"success": f"Sync complete. Processed {len(full_list)} items."}, status=status.HTTP_200_OK)
+            return Response({"success": f"Sync complete. Processed {len(entries)} items."}, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": "An error occurred during sync", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -990,6 +933,7 @@ class SyncAniListView(APIView):
 class SyncTMDBView(APIView):
     authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 18
 
     def post(self, request):
         profile = request.user.profile
@@ -1000,7 +944,7 @@ class SyncTMDBView(APIView):
             account_details = tmdb_service.get_account_details(profile.tmdb_session_id)
             account_id = account_details['id']
             profile.tmdb_account_id = str(account_id) # Store as string for consistency
-            profile.save()
+            profile.save(update_fields=['tmdb_account_id'])
 
             # Fetch all lists
             movie_watchlist = tmdb_service.get_movie_watchlist(account_id, profile.tmdb_session_id)
@@ -1009,51 +953,22 @@ class SyncTMDBView(APIView):
             rated_tv = tmdb_service.get_rated_tv(account_id, profile.tmdb_session_id)
 
             processed_items = {}
-
-            # Process watchlist
-            for item in movie_watchlist: processed_items[f"movie-{item['id']}"] = {'data': item, 'type': Media.MOVIE, 'status': 'PLANNED', 'score': None}
-            for item in tv_watchlist: processed_items[f"tv-{item['id']}"] = {'data': item, 'type': Media.TV_SHOW, 'status': 'PLANNED', 'score': None}
-            
-            # Process rated list (will overwrite watchlist entries if they exist, which is correct)
-            for item in rated_movies: processed_items[f"movie-{item['id']}"] = {'data': item, 'type': Media.MOVIE, 'status': 'COMPLETED', 'score': item.get('rating')}
-            for item in rated_tv: processed_items[f"tv-{item['id']}"] = {'data': item, 'type': Media.TV_SHOW, 'status': 'COMPLETED', 'score': item.get('rating')}
-
-            items_processed_count = 0
-            for _unique_id, item_info in processed_items.items():
-                try:
-                    item_data = item_info['data']
-                    item_type = item_info['type']
-                    
-                    if not item_data.get('poster_path') or not item_data.get('id'):
-                        continue
-
-                    defaults = {
-                        'primary_title': item_data.get('title') or item_data.get('name'),
-                        'secondary_title': item_data.get('original_title') or item_data.get('original_name'),
-                        'cover_image_url': f"https://image.tmdb.org/t/p/w500{item_data.get('poster_path')}",
-                        'description': item_data.get('overview'),
-                    }
-                    media_obj, _ = Media.objects.update_or_create(
-                        tmdb_id=item_data['id'], media_type=item_type, defaults=defaults
-                    )
-
-                    if profile.keep_local_on_sync:
-                        # Only create if missing; do not overwrite existing local data
-                        _, created = UserMedia.objects.get_or_create(
-                            profile=profile, media=media_obj,
-                            defaults={'status': item_info['status'], 'score': item_info['score'], 'progress': 0}
-                        )
-                        if created:
-                            items_processed_count += 1
-                    else:
-                        UserMedia.objects.update_or_create(
-                            profile=profile, media=media_obj,
-                            defaults={'status': item_info['status'], 'score': item_info['score'], 'progress': 0}
-                        )
-                        items_processed_count += 1
-                except Exception as item_error:
-                    print(f"Failed to process item {item_data.get('id')}: {item_error}") #type: ignore
-                    continue # Continue to the next item
+            # Rated lists come last so they overwrite watchlist entries, which is correct
+            lists = [
+                (movie_watchlist, Media.MOVIE, 'PLANNED', False), (tv_watchlist, Media.TV_SHOW, 'PLANNED', False),
+                (rated_movies, Media.MOVIE, 'COMPLETED', True), (rated_tv, Media.TV_SHOW, 'COMPLETED', True),
+            ]
+            for items, media_type, item_status, rated in lists:
+                for item in items:
+                    score = item.get('rating') if rated and isinstance(item, dict) else None
+                    # Malformed items come back as None and are skipped
+                    entry = sync.tmdb_entry(item, media_type, item_status, score)
+                    if entry is not None:
+                        processed_items[(media_type, entry[0]['ids']['TMDB'])] = entry
+
+            entries = list(processed_items.values())
+            created, _updated = sync.import_entries(profile, entries, overwrite=not profile.keep_local_on_sync)
+            items_processed_count = created if profile.keep_local_on_sync else len(entries)
             
             return Response({"success": f"Sync complete. Processed {items_processed_count} items."}, status=status.HTTP_200_OK)
         except Exception as e:
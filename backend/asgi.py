@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
@@ -14,3 +15,37 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+from api import metrics  # noqa: E402
+
+# Answered even while every request slot is taken, so a busy worker still reports ready
+UNLIMITED_PATHS = {'/api/ready/'}
+
+
+def limit_concurrency(app, limit):
+    """Lets at most `limit` HTTP requests into `app` at once; the others queue."""
+    semaphore = asyncio.Semaphore(limit)
+    waiting = 0
+
+    async def limited(scope, receive, send):
+        nonlocal waiting
+        if scope['type'] != 'http' or scope['path'] in UNLIMITED_PATHS:
+            return await app(scope, receive, send)
+        waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            waiting -= 1
+        try:
+            return await app(scope, receive, send)
+        finally:
+            semaphore.release()
+
+    metrics.register_queue('asgi', lambda: waiting)
+    return limited
+
+
+if settings.ASGI_THREADS:
+    application = limit_concurrency(application, settings.ASGI_THREADS)
@@ -0,0 +1,62 @@
+"""
+Gunicorn settings for `run_backend.py --production`.
+
+Runs the ASGI application in several uvicorn worker processes. Everything can
+be overridden from the environment:
+
+    WEB_CONCURRENCY          worker processes (default: 2 per CPU, at most 8)
+    BACKEND_BIND             address to listen on (default: 127.0.0.1:8000)
+    GUNICORN_TIMEOUT         seconds a silent worker gets before it is killed
+    GUNICORN_MAX_REQUESTS    requests after which a worker is replaced (0: never)
+
+`kill -HUP <master pid>` reloads gracefully: new workers load the current code
+and warm up before serving, and the old ones finish their requests (for up to
+`graceful_timeout` seconds) before exiting.
+
+The maintenance scheduler and the enrichment worker run in exactly one worker
+process, whichever holds the background lock; the others wait for it, so
+another worker takes over when that one exits.
+"""
+import importlib.util
+import os
+import tempfile
+import threading
+
+bind = os.getenv('BACKEND_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', min(2 * (os.cpu_count() or 1), 8)))
+worker_class = (
+    'uvicorn_worker.UvicornWorker' if importlib.util.find_spec('uvicorn_worker')
+    else 'uvicorn.workers.UvicornWorker'
+)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycling workers bounds the memory a long-running process accumulates
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+# Each worker imports the application itself, so a reload picks up new code
+preload_app = False
+
+BACKGROUND_LOCK_PATH = os.path.join(tempfile.gettempdir(), f"backend-background-{bind.replace(':', '_')}.lock")
+
+
+def _run_background_jobs(worker):
+    """Waits for the background lock, then starts the jobs; the lock is held until the process exits."""
+    import fcntl
+
+    from api import enrichment, maintenance
+
+    lock = open(BACKGROUND_LOCK_PATH, 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    worker.background_lock = lock
+    maintenance.start_scheduler()
+    enrichment.start_worker()
+    worker.log.info("Background jobs run in worker %s", worker.pid)
+
+
+def post_worker_init(worker):
+    from api import startup
+
+    worker.log.info("Warm-up: %s", startup.warm_up().report())
+    # Also lets a replacement worker take over from one that is still shutting down
+    threading.Thread(target=_run_background_jobs, args=(worker,), name='background-lock', daemon=True).start()
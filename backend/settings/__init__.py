@@ -0,0 +1,25 @@
+"""
+Django settings for backend project, layered by deployment profile:
+
+- base.py     what every profile shares
+- desktop.py  the backend bundled with the Electron app (the default): one
+              process, in-memory cache
+- server.py   multi-user serving (`run_backend.py --production`): DEBUG off,
+              a cache shared by the worker processes, throttling
+
+BACKEND_PROFILE picks the profile; DJANGO_SETTINGS_MODULE stays
+`backend.settings`. `python manage.py check --tag performance` reports
+settings that slow the backend down (see api/checks.py).
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+PROFILE = os.getenv('BACKEND_PROFILE', 'desktop')
+
+if PROFILE == 'desktop':
+    from .desktop import *  # noqa: F401,F403
+elif PROFILE == 'server':
+    from .server import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(f"Unknown BACKEND_PROFILE {PROFILE!r}; use 'desktop' or 'server'")
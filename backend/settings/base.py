@@ -0,0 +1,334 @@
+"""
+Django settings for backend project: what every profile shares (see
+backend/settings/__init__.py).
+
+Generated by 'django-admin startproject' using Django 5.2.6.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.2/ref/settings/
+"""
+
+from pathlib import Path
+import importlib.util
+import os
+import sys
+import tempfile
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+
+def env_flag(name, default=False):
+    value = os.getenv(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes')
+
+
+def provider_url(name, default):
+    """
+    The base URL of a provider API: the `name` environment variable, else
+    `default` mirrored under PROVIDER_STANDIN_URL when that is set, else
+    `default` itself.
+    """
+    if os.getenv(name):
+        return os.getenv(name).rstrip('/')
+    standin = os.getenv('PROVIDER_STANDIN_URL', '').rstrip('/')
+    if standin:
+        # https://api.themoviedb.org/3 -> <standin>/api.themoviedb.org/3
+        return f"{standin}/{default.split('://', 1)[1]}"
+    return default
+
+
+STEAM_API_KEY = os.getenv('STEAM_API_KEY')
+
+ANILIST_CLIENT_ID = os.getenv('ANILIST_CLIENT_ID')
+ANILIST_CLIENT_SECRET = os.getenv('ANILIST_CLIENT_SECRET')
+ANILIST_REDIRECT_URI = 'http://127.0.0.1:8000/api/auth/callback/'
+
+TMDB_API_KEY = os.getenv('TMDB_API_KEY')
+TMDB_REDIRECT_URI = 'http://127.0.0.1:8000/api/auth/tmdb/callback/'
+
+MAL_CLIENT_ID = os.getenv('MAL_CLIENT_ID')
+MAL_REDIRECT_URI = 'http://127.0.0.1:8000/api/auth/mal/callback/'
+MAL_PKCE_METHOD = os.getenv('MAL_PKCE_METHOD', 'S256')  # 'S256' or 'plain'
+
+# Provider APIs, read by api/services on every call. For load tests and
+# offline work, PROVIDER_STANDIN_URL points them all at the local stand-in
+# (`python manage.py provider_standin`, see api/benchmarks/standin.py).
+ANILIST_API_URL = provider_url('ANILIST_API_URL', 'https://graphql.anilist.co')
+MAL_API_URL = provider_url('MAL_API_URL', 'https://api.myanimelist.net/v2')
+TMDB_API_URL = provider_url('TMDB_API_URL', 'https://api.themoviedb.org/3')
+STEAM_API_URL = provider_url('STEAM_API_URL', 'https://api.steampowered.com')
+STEAM_STORE_URL = provider_url('STEAM_STORE_URL', 'https://store.steampowered.com/api')
+RAWG_API_URL = provider_url('RAWG_API_URL', 'https://api.rawg.io/api')
+GOOGLE_BOOKS_API_URL = provider_url('GOOGLE_BOOKS_API_URL', 'https://www.googleapis.com/books/v1/volumes')
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'django-insecure-t(_-(ah2@z&t-zsuap4r7iamr7!__o!2^968&^@v=(!!k%g=x2')
+
+# SECURITY WARNING: don't run with debug turned on in production!
+# DEBUG also makes Django keep every SQL query in memory; the profiles pick
+# the default, DJANGO_DEBUG overrides it.
+DEBUG = env_flag('DJANGO_DEBUG')
+
+# `manage.py test` turns DEBUG off after the profile picked its settings for it
+TESTING = sys.argv[1:2] == ['test']
+
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost', *filter(None, os.getenv('DJANGO_ALLOWED_HOSTS', '').split(','))]
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'rest_framework', 
+    'rest_framework.authtoken',
+    'corsheaders', 
+    'api',            
+]
+if os.getenv('POSTGRES_DB'):
+    # Trigram lookups for title search (see api/title_index.py)
+    INSTALLED_APPS.append('django.contrib.postgres')
+
+MIDDLEWARE = [
+    # First, so request timings include the rest of the middleware
+    'api.metrics.MetricsMiddleware',
+    'api.query_budget.QueryBudgetMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'backend.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'backend.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds a write waits for the lock before "database is locked"
+            'timeout': 20,
+            # WAL lets reads carry on while a write is in progress, and NORMAL
+            # sync is crash-safe with it while skipping an fsync per commit
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+            # Take the write lock when a transaction starts, so concurrent
+            # transactions wait on `timeout` instead of failing to upgrade
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Keep connections for a minute instead of reopening the file and
+        # rerunning init_command for every request. Long-lived threads (the
+        # background workers, the view thread pools, WSGI workers) reuse them;
+        # an ASGI request thread's connection closes when the thread ends.
+        # Health checks replace a connection that went bad in the meantime.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# PostgreSQL instead, when POSTGRES_DB is set (needs psycopg[pool]); it lifts
+# SQLite's single writer when many users sync at once. Copy an existing
+# SQLite database over with `python manage.py copy_sqlite db.sqlite3`.
+if os.getenv('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('POSTGRES_DB'),
+        'USER': os.getenv('POSTGRES_USER', ''),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+        'HOST': os.getenv('POSTGRES_HOST', ''),
+        'PORT': os.getenv('POSTGRES_PORT', ''),
+        'OPTIONS': {
+            # Each worker process borrows connections from a pool instead of
+            # opening one per request. Size it for ASGI_THREADS requests plus
+            # the background jobs.
+            'pool': {
+                'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', 12)),
+                'timeout': 10,
+            },
+        },
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Cached payloads are keyed by library or Media version (see api/caching.py
+# and api/media_details.py), so the cache only needs to be big enough.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'backend',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+# Alias the DRF throttles count requests in (see api/throttling.py)
+THROTTLE_CACHE = 'default'
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
+
+STATIC_ROOT = BASE_DIR / "collected_static"
+
+STATIC_URL = "static/"
+STATICFILES_DIRS = [
+    BASE_DIR / "static",
+]
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# JSON is rendered with orjson (see api/renderers.py); clients may ask for
+# MessagePack with `Accept: application/x-msgpack` when msgpack is installed.
+# The profiles add the browsable API and session logins when DEBUG is on.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        *(['api.renderers.MessagePackRenderer'] if importlib.util.find_spec('msgpack') else []),
+    ],
+    # Token auth is a cached lookup; Basic auth would hash a password on every request
+    'DEFAULT_AUTHENTICATION_CLASSES': ['api.authentication.ExpiringTokenAuthentication'],
+}
+
+DEBUG_REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        *REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'],
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        *REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'],
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+}
+
+CORS_ALLOWED_ORIGINS = [
+    "http://localhost:5173",  # The address of Vite React frontend
+]
+# This allows your Django backend to share cookies with your frontend
+CORS_ALLOW_CREDENTIALS = True 
+# Where a profiled request's profile went (see api/profiling.py)
+CORS_EXPOSE_HEADERS = ['X-Profile-Id']
+
+SESSION_COOKIE_SECURE = False       # disable HTTPS-only in dev
+CSRF_COOKIE_SECURE = False
+SESSION_COOKIE_SAMESITE = "None"
+CSRF_COOKIE_SAMESITE = "None"
+
+CSRF_TRUSTED_ORIGINS = [
+    'http://localhost:5173',
+]
+
+# Keep per-profile library statistics pre-aggregated in ProfileStatsBucket
+# rows, updated incrementally on every UserMedia write (see api/stats.py).
+STATS_SUMMARY_TABLE = os.getenv('STATS_SUMMARY_TABLE', 'False').lower() in ('1', 'true', 'yes')
+
+# Background housekeeping (see api/maintenance.py). Set the interval to 0 to
+# disable the in-process scheduler and run `manage.py run_maintenance` instead.
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('MAINTENANCE_INTERVAL_SECONDS', 6 * 60 * 60))
+OAUTH_HANDSHAKE_MAX_AGE_HOURS = 24
+
+# How often the background worker looks for Media rows missing descriptions or
+# lengths (see api/enrichment.py); it also wakes up when new rows are created.
+# Set to 0 to disable it and run `manage.py enrich_media` instead.
+ENRICHMENT_INTERVAL_SECONDS = int(os.getenv('ENRICHMENT_INTERVAL_SECONDS', 5 * 60))
+
+# HTTP requests each ASGI process handles at once; the rest wait their turn
+# (see backend/asgi.py). Every sync view runs on a thread of its own, so
+# without a limit a burst of slow requests fights over the GIL and the
+# database. 0 means unlimited; the server profile defaults to 8.
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 0))
+
+# `/api/metrics` (see api/metrics.py) answers scrapers sending
+# `Authorization: Bearer <METRICS_TOKEN>`; while the token is empty the
+# endpoint doesn't exist. Its labels name views and providers, and its
+# counters tell how busy the backend is, so it isn't public.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# On-demand request profiling (see api/profiling.py): requests sending
+# `X-Profile: <PROFILING_SECRET>` are profiled, as is a PROFILING_SAMPLE_RATE
+# share (0-1) of all requests. Off while the secret is empty and the rate 0.
+PROFILING_SECRET = os.getenv('PROFILING_SECRET', '')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_INTERVAL_MS = int(os.getenv('PROFILING_INTERVAL_MS', 5))
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'backend-profiles'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', 50))
+
+# Requests running more queries than their view's `query_budget` are logged
+# with their most repeated queries (see api/query_budget.py); this is the
+# budget of views that don't declare one. None: no budget.
+QUERY_BUDGET = 50
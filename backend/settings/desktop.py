@@ -0,0 +1,14 @@
+"""
+Settings for the backend bundled with the Electron app: a single process
+serving one user from a local SQLite file.
+"""
+import sys
+
+from .base import *  # noqa: F401,F403
+from .base import DEBUG_REST_FRAMEWORK, env_flag
+
+# On for development, off in the packaged executable
+DEBUG = env_flag('DJANGO_DEBUG', default=not getattr(sys, 'frozen', False))
+
+if DEBUG:
+    REST_FRAMEWORK = DEBUG_REST_FRAMEWORK
@@ -0,0 +1,57 @@
+"""
+Settings for serving many users from several worker processes
+(`run_backend.py --production`, see backend/gunicorn_conf.py).
+"""
+import os
+import tempfile
+
+from .base import *  # noqa: F401,F403
+from .base import DEBUG_REST_FRAMEWORK, REST_FRAMEWORK, env_flag
+
+DEBUG = env_flag('DJANGO_DEBUG')
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 8))
+
+# Each worker keeps recently used payloads in memory in front of a cache all
+# workers share: a directory of files, or Redis when BACKEND_REDIS_URL is set
+# (needs the redis package). See api/cache_backends.py.
+CACHES = {
+    'default': {
+        'BACKEND': 'api.cache_backends.TieredCache',
+        'OPTIONS': {'LOCAL': 'local', 'SHARED': 'shared'},
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'backend-local',
+        'TIMEOUT': 5 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+    'shared': (
+        {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('BACKEND_REDIS_URL'),
+        } if os.getenv('BACKEND_REDIS_URL') else {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('BACKEND_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'backend-cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_FREQUENCY': 4},
+        }
+    ),
+}
+# Request counts have to be seen by every worker
+THROTTLE_CACHE = 'shared'
+# The token cache is per process and only evicted by its own writes: a token
+# another worker revoked would keep working, so authenticate from the database
+AUTH_CACHE_TTL_SECONDS = int(os.getenv('AUTH_CACHE_TTL_SECONDS', 0))
+# Each worker's in-memory title index (SQLite only) only sees its own writes;
+# check this often whether others changed titles and rebuild it if so
+TITLE_INDEX_REFRESH_SECONDS = int(os.getenv('TITLE_INDEX_REFRESH_SECONDS', 30))
+
+REST_FRAMEWORK = {
+    **(DEBUG_REST_FRAMEWORK if DEBUG else REST_FRAMEWORK),
+    'DEFAULT_THROTTLE_CLASSES': ['api.throttling.AnonRateThrottle', 'api.throttling.UserRateThrottle'],
+    # Empty to turn a throttle off
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.getenv('THROTTLE_ANON_RATE', '300/min') or None,
+        'user': os.getenv('THROTTLE_USER_RATE', '3000/min') or None,
+    },
+}
@@ -5,8 +5,12 @@ const api = axios.create({
   baseURL: 'http://127.0.0.1:8000',
 });
 
+// Library mirrors belong to the logged-in user and are dropped when the token changes
+const libraryMirrors = new Set<{ clear: () => void }>();
+
 // This function will set the token on the api instance for all future requests
 export const setAuthToken = (token: string | null) => {
+  libraryMirrors.forEach((mirror) => mirror.clear());
   if (token) {
     api.defaults.headers.common['Authorization'] = `Token ${token}`;
   } else {
@@ -22,4 +26,232 @@ export const transformSteamData = (response: any) => {
   return [];
 };
 
+export interface LibraryPageResponse<T> {
+  results: T[];
+  next_cursor: string | null;
+}
+
+// Walks /api/user/library/ page by page. `onPage` is called as soon as each
+// page arrives, so the first one can be painted before the rest is loaded.
+export const fetchLibraryPages = async <T,>(
+  onPage: (items: T[], isFirstPage: boolean) => void,
+  params: Record<string, string | number> = {},
+  pageSize = 100,
+) => {
+  let cursor: string | null = null;
+  let isFirstPage = true;
+  do {
+    const response: { data: LibraryPageResponse<T> } = await api.get('/api/user/library/', {
+      params: { ...params, limit: pageSize, ...(cursor ? { cursor } : {}) },
+    });
+    onPage(response.data.results, isFirstPage);
+    isFirstPage = false;
+    cursor = response.data.next_cursor;
+  } while (cursor);
+};
+
+export interface BatchResult {
+  op: 'add' | 'update' | 'delete';
+  index: number;
+  id: number;
+  result: 'created' | 'exists' | 'duplicate' | 'updated' | 'deleted';
+}
+
+// Apply many library edits in one request; nothing is written if any operation is invalid.
+export const batchLibrary = async (ops: {
+  add?: { media: Record<string, unknown>; status?: string; score?: number | null; progress?: number }[];
+  update?: { id: number; status?: string; score?: number | null; progress?: number }[];
+  delete?: number[];
+}) => (await api.post<{ results: BatchResult[] }>('/api/list/batch/', ops)).data.results;
+
+export const batchCustomListEntries = async (ops: {
+  add?: { custom_list: number; user_media: number }[];
+  delete?: number[];
+}) => (await api.post<{ results: BatchResult[] }>('/api/custom-list-entries/batch/', ops)).data.results;
+
+interface LibraryChanges<T> {
+  reset: boolean;
+  seq: number;
+  user_media?: (T & { id: number })[];
+  custom_list_entries?: { id: number; custom_list: number; user_media: number; added_at: string }[];
+  deleted?: { user_media: number[]; custom_list_entry: number[] };
+}
+
+// Local mirror of the user's library kept current through
+// /api/user/list/changes, so a refresh only transfers what changed.
+export class LibraryMirror<T extends { id: number }> {
+  private seq = 0;
+  private items = new Map<number, T>();
+  private entries = new Map<number, { id: number; custom_list: number; user_media: number; added_at: string }>();
+
+  constructor() {
+    libraryMirrors.add(this);
+  }
+
+  async refresh(): Promise<T[]> {
+    const response = await api.get<LibraryChanges<T>>('/api/user/list/changes', { params: { since: this.seq } });
+    let changes = response.data;
+    if (changes.reset) {
+      this.clear();
+      changes = (await api.get<LibraryChanges<T>>('/api/user/list/changes', { params: { since: 0 } })).data;
+    }
+    changes.user_media?.forEach((item) => this.items.set(item.id, item));
+    changes.custom_list_entries?.forEach((entry) => this.entries.set(entry.id, entry));
+    changes.deleted?.user_media.forEach((id) => this.items.delete(id));
+    changes.deleted?.custom_list_entry.forEach((id) => this.entries.delete(id));
+    this.seq = changes.seq;
+    return this.list();
+  }
+
+  list(): T[] {
+    return Array.from(this.items.values());
+  }
+
+  entriesFor(customListId: number) {
+    return Array.from(this.entries.values()).filter((entry) => entry.custom_list === customListId);
+  }
+
+  clear() {
+    this.seq = 0;
+    this.items.clear();
+    this.entries.clear();
+  }
+}
+
+export interface MediaRecord {
+  id: number;
+  primary_title: string;
+  secondary_title: string | null;
+  description: string | null;
+  cover_image_url: string | null;
+  media_type: string;
+  anilist_id: number | null;
+}
+
+export interface LibraryItemRecord {
+  id: number;
+  media: MediaRecord;
+  status: string;
+  score: number | null;
+  progress: number;
+}
+
+export interface CustomListEntryRecord {
+  id: number;
+  user_media: LibraryItemRecord;
+  added_at: string;
+}
+
+export interface CustomListRecord {
+  id: number;
+  name: string;
+  created_at: string;
+  entries?: CustomListEntryRecord[];
+  entry_count?: number;
+}
+
+// Compact `?layout=columnar` responses (see api/columnar.py): one array per
+// field, enums sent as indexes into `enums`, and each media / library item
+// sent once and referenced by row index.
+type Columns<T> = { [K in keyof T]: T[K][] };
+
+export interface ColumnarLibrary {
+  layout: 'columnar';
+  enums: { status: string[]; media_type: string[] };
+  media: Columns<Omit<MediaRecord, 'media_type'> & { media_type: number }>;
+  user_media: Columns<Omit<LibraryItemRecord, 'media' | 'status'> & { media: number; status: number }>;
+}
+
+export interface ColumnarEntries extends ColumnarLibrary {
+  entries: Columns<{ id: number; user_media: number; added_at: string }>;
+}
+
+export interface ColumnarCustomLists extends ColumnarLibrary {
+  custom_lists: Columns<Omit<CustomListRecord, 'entries'>>;
+  entries: Columns<{ id: number; custom_list: number; user_media: number; added_at: string }>;
+}
+
+// Turns column arrays back into one object per row (typed by the callers)
+const zipColumns = (columns: Record<string, unknown[] | undefined>): any[] => {
+  const keys = Object.keys(columns);
+  const length = keys.length ? columns[keys[0]]!.length : 0;
+  const rows = new Array(length);
+  for (let i = 0; i < length; i++) {
+    const row: Record<string, any> = {};
+    for (const key of keys) row[key] = columns[key]![i];
+    rows[i] = row;
+  }
+  return rows;
+};
+
+const decodeLibraryRows = (payload: ColumnarLibrary) => {
+  const { status, media_type } = payload.enums;
+  const media = zipColumns(payload.media);
+  // With `fields` a column may be left out altogether
+  if ('media_type' in payload.media) media.forEach((row) => { row.media_type = media_type[row.media_type]; });
+  const items = zipColumns(payload.user_media);
+  items.forEach((row) => {
+    if ('media' in row) row.media = media[row.media];
+    if ('status' in row) row.status = status[row.status];
+  });
+  return items;
+};
+
+// The decoders are generic so pages can decode straight into their own view types
+export const decodeColumnarLibrary = <T = LibraryItemRecord,>(payload: ColumnarLibrary): T[] =>
+  decodeLibraryRows(payload) as T[];
+
+export const decodeColumnarEntries = <T = CustomListEntryRecord,>(payload: ColumnarEntries): T[] => {
+  const items = decodeLibraryRows(payload);
+  const entries = zipColumns(payload.entries);
+  entries.forEach((row) => { row.user_media = items[row.user_media]; });
+  return entries as T[];
+};
+
+export const decodeColumnarCustomLists = <T = CustomListRecord,>(payload: ColumnarCustomLists): T[] => {
+  const items = decodeLibraryRows(payload);
+  const lists = zipColumns(payload.custom_lists);
+  // Summary responses (`?summary=1`) carry entry_count instead of entries
+  if (payload.custom_lists.entry_count === undefined) lists.forEach((list) => { list.entries = []; });
+  zipColumns(payload.entries).forEach((entry) => {
+    const list = lists[entry.custom_list];
+    delete entry.custom_list;
+    entry.user_media = items[entry.user_media];
+    list.entries.push(entry);
+  });
+  return lists as T[];
+};
+
+export const fetchLibraryColumnar = async <T = LibraryItemRecord,>() =>
+  decodeColumnarLibrary<T>((await api.get<ColumnarLibrary>('/api/user/list/', { params: { layout: 'columnar' } })).data);
+
+export const fetchCustomListsColumnar = async <T = CustomListRecord,>() =>
+  decodeColumnarCustomLists<T>(
+    (await api.get<ColumnarCustomLists>('/api/custom-lists/', { params: { layout: 'columnar' } })).data,
+  );
+
+export interface MediaDetails extends MediaRecord {
+  length: number | null;
+  mal_id: number | null;
+  tmdb_id: number | null;
+  rawg_id: number | null;
+  steam_appid: number | null;
+  google_book_id: string | null;
+  version: number;
+}
+
+const MEDIA_BATCH_MAX_IDS = 100;
+
+// Full details (description, length, external ids) for many media at once.
+// `enrich` asks the backend to fill in missing descriptions from the providers.
+export const fetchMediaDetails = async (ids: number[], enrich = false): Promise<MediaDetails[]> => {
+  const chunks: number[][] = [];
+  for (let i = 0; i < ids.length; i += MEDIA_BATCH_MAX_IDS) chunks.push(ids.slice(i, i + MEDIA_BATCH_MAX_IDS));
+  const responses = await Promise.all(chunks.map((chunk) =>
+    api.get<{ results: MediaDetails[]; missing: number[] }>('/api/media/batch', {
+      params: { ids: chunk.join(','), ...(enrich ? { enrich: 1 } : {}) },
+    })));
+  return responses.flatMap((response) => response.data.results);
+};
+
 export default api;
\ No newline at end of file
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import api from '../api';
+import api, { LibraryMirror } from '../api';
 import { Box, Typography, Button, TextField, List, ListItem, ListItemText, IconButton, Dialog, DialogTitle, DialogContent, DialogActions, Autocomplete } from '@mui/material';
 import DeleteIcon from '@mui/icons-material/Delete';
 import AddIcon from '@mui/icons-material/Add';
@@ -7,7 +7,7 @@ import AddIcon from '@mui/icons-material/Add';
 interface CustomList {
   id: number;
   name: string;
-  entries: { id: number; user_media: number; }[];
+  entry_count: number;
 }
 
 
@@ -20,6 +20,9 @@ interface UserMedia {
   };
 }
 
+// Survives page switches so revisiting only downloads what changed
+const libraryMirror = new LibraryMirror<UserMedia>();
+
 function CustomListPage() {
   const [lists, setLists] = useState<CustomList[]>([]);
   const [newListName, setNewListName] = useState('');
@@ -29,12 +32,11 @@ function CustomListPage() {
   const [selectedEntry, setSelectedEntry] = useState<UserMedia|null>(null);
 
   const fetchLists = async () => {
-    const res = await api.get('/api/custom-lists/');
+    const res = await api.get('/api/custom-lists/', { params: { summary: 1 } });
     setLists(res.data);
   };
   const fetchLibrary = async () => {
-    const res = await api.get('/api/user/list/');
-    setLibrary(res.data);
+    setLibrary(await libraryMirror.refresh());
   };
 
   useEffect(() => { fetchLists(); fetchLibrary(); }, []);
@@ -72,7 +74,7 @@ function CustomListPage() {
               <IconButton edge="end" onClick={() => handleDelete(list.id)}><DeleteIcon /></IconButton>
             </>
           }>
-            <ListItemText primary={list.name} secondary={`${list.entries.length} entries`} />
+            <ListItemText primary={list.name} secondary={`${list.entry_count} entries`} />
           </ListItem>
         ))}
       </List>
@@ -1,5 +1,5 @@
 import { useState, useEffect, useMemo, useCallback } from 'react';
-import api from '../api';
+import api, { batchCustomListEntries, fetchCustomListsColumnar, fetchLibraryPages } from '../api';
 import debounce from 'lodash.debounce';
 
 import {
@@ -24,6 +24,7 @@ interface Media {
   id: number;
   api_source: string;
   api_id: number;
+  mal_id?: number | null;
   primary_title: string; 
   secondary_title: string | null; 
   cover_image_url: string | null;
@@ -85,12 +86,12 @@ function LibraryPage({ token }: LibraryPageProps) {
   const fetchCustomLists = async () => {
     setCustomListsLoading(true);
     try {
-      const response = await api.get('/api/custom-lists/');
-      setCustomLists(response.data);
+      const lists = await fetchCustomListsColumnar<CustomList>();
+      setCustomLists(lists);
       // Initialize visibility for any new custom lists (default: visible)
       const vis: Record<number, boolean> = { ...visibleCustomLists };
 
-      response.data.forEach((l: CustomList) => {
+      lists.forEach((l: CustomList) => {
         if (vis[l.id] === undefined) vis[l.id] = true;
       });
 
@@ -133,8 +134,12 @@ function LibraryPage({ token }: LibraryPageProps) {
     setLibraryLoading(true);
     
     try {
-      const response = await api.get('/api/user/list/');
-      setUserMediaList(response.data);
+      // Paint the first page right away and append the rest as it arrives
+      // The grid doesn't show descriptions, so leave them out (`fields` omits them by default)
+      await fetchLibraryPages<UserMedia>((items, isFirstPage) => {
+        setUserMediaList((prev) => (isFirstPage ? items : [...prev, ...items]));
+        if (isFirstPage) setLibraryLoading(false);
+      }, { fields: 'id,status,score,progress,media' });
     } catch (err) {
       console.error("Failed to fetch user list", err);
     } finally {
@@ -250,13 +255,13 @@ function LibraryPage({ token }: LibraryPageProps) {
     setListOpsPending(prev => ({ ...prev, [listId]: true }));
     try {
       if (add) {
-        await api.post('/api/custom-list-entries/', { custom_list: listId, user_media: editingItem.id });
+        await batchCustomListEntries({ add: [{ custom_list: listId, user_media: editingItem.id }] });
       } else {
         // find the entry id to delete
         const list = customLists.find(l => l.id === listId);
         const entry = list?.entries.find(e => e.user_media.id === editingItem.id);
         if (entry) {
-          await api.delete(`/api/custom-list-entries/${entry.id}/`);
+          await batchCustomListEntries({ delete: [entry.id] });
         }
       }
       // Refresh lists to keep local state consistent
@@ -2,37 +2,141 @@
 import os
 import sys
 import time
-import subprocess
+import threading
+import importlib.util
 from pathlib import Path
 
 # set DJANGO settings module
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")  # change to your project name
 
+HOST = "127.0.0.1"
+PORT = 8000
+
+# Fast start (the default) binds the port before setting Django up, skips
+# migrate when every migration is already applied and warms up in the
+# background. BACKEND_FAST_START=0 migrates and warms up before serving.
+FAST_START = os.getenv("BACKEND_FAST_START", "1") != "0"
+
+# `run_backend.py --production` (or BACKEND_MODE=production) serves with
+# several gunicorn + uvicorn worker processes instead (see backend/gunicorn_conf.py).
+PRODUCTION = "--production" in sys.argv[1:] or os.getenv("BACKEND_MODE") == "production"
+
+
+def setup_django():
+    import django
+    django.setup()
+
+
 # Optional: run migrations on first run
-def run_migrations():
+def run_migrations(timer):
     try:
-        import django
-        django.setup()
+        if FAST_START:
+            from api.startup import migrations_up_to_date
+            if migrations_up_to_date():
+                timer.note("up to date, skipped")
+                return
         from django.core.management import call_command
         call_command("migrate", "--noinput")
     except Exception as e:
         print("Migration failed:", e)
 
+
+def self_check():
+    # Warns about settings that slow the backend down (see api/checks.py)
+    from django.core.checks import run_checks
+    for message in run_checks(tags=["performance"]):
+        print(message)
+
+
+def start_background_workers():
+    # Periodic cleanup of expired tokens, stale OAuth handshakes, etc.
+    try:
+        from api import maintenance
+        maintenance.start_scheduler()
+    except Exception as e:
+        print("Failed to start maintenance scheduler:", e)
+
+    # Fills in descriptions and lengths of media added by searches and syncs
+    try:
+        from api import enrichment
+        enrichment.start_worker()
+    except Exception as e:
+        print("Failed to start media enrichment worker:", e)
+
+
+def warm_up():
+    try:
+        from api.startup import warm_up
+        print("Warm-up:", warm_up().report())
+    except Exception as e:
+        print("Warm-up failed:", e)
+
+
+def serve_production(started):
+    if sys.platform == "win32" or not importlib.util.find_spec("gunicorn"):
+        print("Production mode needs gunicorn, which runs on Linux and macOS only")
+        sys.exit(1)
+    os.environ.setdefault("BACKEND_PROFILE", "server")
+
+    from api.startup import PhaseTimer
+    timer = PhaseTimer()
+    timer.started = started
+    timer.phase("django setup", setup_django)
+    # Once, here, rather than racing in every worker
+    timer.phase("migrations", run_migrations, timer)
+    timer.phase("self-check", self_check)
+    print("Startup:", timer.report())
+
+    from django.db import connections
+    connections.close_all()
+    # A fresh process, so the workers (and graceful reloads) import the code themselves
+    os.execv(sys.executable, [
+        sys.executable, "-m", "gunicorn",
+        "--config", "python:backend.gunicorn_conf",
+        "backend.asgi:application",
+    ])
+
+
 def main():
+    started = time.perf_counter()
+
     # ensure current working dir is project root
     PROJECT_ROOT = Path(__file__).resolve().parent
     os.chdir(PROJECT_ROOT)
 
-    # run migrations (optional)
-    run_migrations()
+    if PRODUCTION:
+        serve_production(started)
 
     # Serve with uvicorn (ASGI). Use imports to avoid requiring uvicorn at top-level if unavailable.
     try:
         import uvicorn
-        uvicorn.run("backend.asgi:application", host="127.0.0.1", port=8000, log_level="info")
+        config = uvicorn.Config("backend.asgi:application", host=HOST, port=PORT, log_level="info")
+        # Connections made from here on wait in the listen backlog instead of being refused
+        sock = config.bind_socket() if FAST_START else None
     except Exception as e:
         print("Failed to start uvicorn:", e)
         sys.exit(1)
 
+    from api.startup import PhaseTimer
+    timer = PhaseTimer()
+    timer.started = started
+    timer.phase("django setup", setup_django)
+    # run migrations (optional)
+    timer.phase("migrations", run_migrations, timer)
+    timer.phase("self-check", self_check)
+    timer.phase("background workers", start_background_workers)
+    if FAST_START:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        timer.phase("warm-up", warm_up)
+    print("Startup:", timer.report())
+
+    try:
+        uvicorn.Server(config).run(sockets=[sock] if sock else None)
+    except Exception as e:
+        print("Failed to start uvicorn:", e)
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
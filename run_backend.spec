@@ -6,7 +6,15 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('collected_static', 'collected_static'), ('db.sqlite3', '.')],
-    hiddenimports=[],
+    # Provider clients are imported by name on first use (see api/services/__init__.py)
+    hiddenimports=[
+        'api.services.anilist_service',
+        'api.services.google_books_service',
+        'api.services.mal_service',
+        'api.services.rawg_service',
+        'api.services.steam_service',
+        'api.services.tmdb_service',
+    ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],